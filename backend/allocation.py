@@ -0,0 +1,146 @@
+"""
+Atomic parking spot allocation.
+
+Spots are claimed and released with guarded UPDATE statements and the lot's
+available_slots counter is adjusted in SQL, so concurrent workers can never
+hand out the same spot or overwrite each other's counter updates.
+"""
+from sqlalchemy import select, update
+from models import db, ParkingLot, ParkingSpot
+from spot_pool import pop_free_spot, MAX_POOL_POPS
+
+# Only used on databases without UPDATE ... RETURNING support
+MAX_CLAIM_ATTEMPTS = 5
+
+
+def _dialect():
+    """Get the SQLAlchemy dialect of the current session"""
+    return db.session.get_bind().dialect
+
+
+def _adjust_available_slots(lot_id, delta):
+    """Adjust a lot's available_slots counter inside the database"""
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot_id)
+        .values(available_slots=ParkingLot.available_slots + delta),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def _candidate_spot(lot_id, dialect):
+    """Subquery selecting the first free spot of a lot"""
+    candidate = select(ParkingSpot.id).where(
+        ParkingSpot.lot_id == lot_id,
+        ParkingSpot.status == 'available'
+    ).order_by(ParkingSpot.id).limit(1)
+
+    if dialect.name == 'postgresql':
+        # Skip rows another worker is claiming instead of queueing behind them
+        candidate = candidate.with_for_update(skip_locked=True)
+    return candidate
+
+
+def claim_spot(lot_id, user_id, status='occupied', spot_id=None):
+    """
+    Claim an available spot for a user in a single guarded UPDATE.
+
+    Claims ``spot_id`` when given, otherwise the first free spot of the lot.
+    Returns the claimed spot id, or None if nothing could be claimed. The
+    caller owns the transaction and must commit or roll back.
+    """
+    dialect = _dialect()
+
+    if spot_id is not None:
+        target = ParkingSpot.id == spot_id
+    else:
+        target = ParkingSpot.id == _candidate_spot(lot_id, dialect).scalar_subquery()
+
+    stmt = update(ParkingSpot).where(
+        target,
+        ParkingSpot.lot_id == lot_id,
+        ParkingSpot.status == 'available'
+    ).values(status=status, user_id=user_id)
+
+    claimed_id = None
+    if dialect.update_returning:
+        claimed_id = db.session.execute(
+            stmt.returning(ParkingSpot.id),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+    else:
+        # No RETURNING: pick a candidate, then rely on the status guard to
+        # detect a spot that was claimed between the SELECT and the UPDATE
+        for _ in range(MAX_CLAIM_ATTEMPTS if spot_id is None else 1):
+            candidate_id = spot_id
+            if candidate_id is None:
+                candidate_id = db.session.execute(_candidate_spot(lot_id, dialect)).scalar()
+                if candidate_id is None:
+                    break
+
+            result = db.session.execute(
+                update(ParkingSpot).where(
+                    ParkingSpot.id == candidate_id,
+                    ParkingSpot.lot_id == lot_id,
+                    ParkingSpot.status == 'available'
+                ).values(status=status, user_id=user_id),
+                execution_options={'synchronize_session': False}
+            )
+            if result.rowcount == 1:
+                claimed_id = candidate_id
+                break
+
+    if claimed_id is not None:
+        _adjust_available_slots(lot_id, -1)
+    return claimed_id
+
+
+def claim_free_spot(lot_id, user_id, status='occupied'):
+    """
+    Claim any free spot of a lot.
+
+    Candidates are popped from the Redis free-spot pool so the common case
+    needs no table scan; stale ids are simply dropped. Falls back to claiming
+    the first free spot in the database when the pool is empty or unavailable.
+    """
+    for _ in range(MAX_POOL_POPS):
+        spot_id = pop_free_spot(lot_id)
+        if spot_id is None:
+            break
+        if claim_spot(lot_id, user_id, status, spot_id=spot_id) is not None:
+            return spot_id
+
+    return claim_spot(lot_id, user_id, status)
+
+
+def release_spot(spot_id, user_id):
+    """
+    Mark a spot claimed by ``user_id`` as available again.
+
+    Returns the spot's lot id, or None if the spot was already free or is held
+    by someone else (in which case nothing is changed). The caller owns the
+    transaction.
+    """
+    dialect = _dialect()
+    stmt = update(ParkingSpot).where(
+        ParkingSpot.id == spot_id,
+        ParkingSpot.user_id == user_id,
+        ParkingSpot.status != 'available'
+    ).values(status='available', user_id=None)
+
+    if dialect.update_returning:
+        lot_id = db.session.execute(
+            stmt.returning(ParkingSpot.lot_id),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+    else:
+        lot_id = db.session.execute(
+            select(ParkingSpot.lot_id).where(ParkingSpot.id == spot_id)
+        ).scalar()
+        result = db.session.execute(stmt, execution_options={'synchronize_session': False})
+        if result.rowcount != 1:
+            lot_id = None
+
+    if lot_id is not None:
+        _adjust_available_slots(lot_id, 1)
+    return lot_id
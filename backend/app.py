@@ -1,6 +1,7 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_restful import Api, Resource
+from flask_migrate import Migrate, upgrade, stamp
 from flask_jwt_extended import JWTManager
 # Flask-Mail removed - using MailHog for development
 from models import *
@@ -24,6 +25,13 @@ from controllers import (
 from flask_cors import CORS
 from datetime import timedelta, datetime
 from redis import Redis
+from keyspace import scan_unlink
+from counters import read_counters
+from request_metrics import RequestMetrics, render_prometheus
+from local_cache import LocalCache
+from sql_profiler import init_sql_profiler
+from rate_limiter import DEFAULT_RATE_LIMITS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from dotenv import load_dotenv
 
@@ -47,16 +55,53 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=12)
 
+# Booking history pagination
+app.config['BOOKING_HISTORY_PAGE_SIZE'] = int(os.getenv('BOOKING_HISTORY_PAGE_SIZE', 50))
+app.config['BOOKING_HISTORY_MAX_PAGE_SIZE'] = int(os.getenv('BOOKING_HISTORY_MAX_PAGE_SIZE', 500))
+
 # MailHog configuration for development
 app.config['MAILHOG_SERVER'] = os.getenv('MAILHOG_SERVER', 'localhost')
 app.config['MAILHOG_PORT'] = int(os.getenv('MAILHOG_PORT', 8025))
 app.config['MAILHOG_WEB_PORT'] = int(os.getenv('MAILHOG_WEB_PORT', 8025))
 
+# Request metrics are flushed to Redis every N ms or every N counted hits
+app.config['METRICS_FLUSH_INTERVAL_MS'] = int(os.getenv('METRICS_FLUSH_INTERVAL_MS', 1000))
+app.config['METRICS_FLUSH_EVERY'] = int(os.getenv('METRICS_FLUSH_EVERY', 200))
+
+# SQL profiler (opt-in): per-request query summary, N+1 detection and slow request log
+app.config['SQL_PROFILER'] = os.getenv('SQL_PROFILER', '0') == '1'
+app.config['SQL_PROFILER_HEADER'] = os.getenv('SQL_PROFILER_HEADER', '0') == '1'
+app.config['SQL_SLOW_REQUEST_MS'] = int(os.getenv('SQL_SLOW_REQUEST_MS', 500))
+app.config['SQL_N_PLUS_ONE_THRESHOLD'] = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+
+# In-process cache tier: max entries and max seconds an entry lives locally
+app.config['LOCAL_CACHE_SIZE'] = int(os.getenv('LOCAL_CACHE_SIZE', 1024))
+app.config['LOCAL_CACHE_TTL'] = float(os.getenv('LOCAL_CACHE_TTL', 5))
+
+# Rate limit policies per endpoint: name -> [(scope 'user' | 'ip', max requests, window seconds)]
+app.config['RATE_LIMITS'] = DEFAULT_RATE_LIMITS
+# Number of reverse proxies in front of the app, so per-IP limits see the client address
+app.config['TRUSTED_PROXY_COUNT'] = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+if app.config['TRUSTED_PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'], x_proto=app.config['TRUSTED_PROXY_COUNT'])
+
+# Completed reservations older than this move to reserve_spot_archive (daily beat job / python archive.py)
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.getenv('ARCHIVE_BATCH_SIZE', 5000))
+# PostgreSQL: monthly reserve_spot partitions kept ready this many months ahead
+app.config['PARTITION_MONTHS_AHEAD'] = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+# Copy reservation history to reserve_spot_archive before deleting users and lots (?archive= overrides)
+app.config['ARCHIVE_ON_DELETE'] = os.getenv('ARCHIVE_ON_DELETE', '0') == '1'
+
 # Celery configuration
 app.config['CELERY_BROKER_URL'] = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 app.config['CELERY_RESULT_BACKEND'] = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 
 db.init_app(app)
+init_sql_profiler(app)
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+# Schema that db.create_all() produced before migrations were introduced
+BASELINE_REVISION = '0001_baseline'
 jwt = JWTManager(app)
 api = Api(app)
 CORS(app)
@@ -135,34 +180,64 @@ CORS(app, origins=allowed_origins)
 # Redis Client configuration
 app.redis_client = redis_client
 
+# Request metrics are counted in-process and flushed to Redis in batches
+request_metrics = RequestMetrics(
+    redis_client,
+    flush_interval_ms=app.config['METRICS_FLUSH_INTERVAL_MS'],
+    flush_every=app.config['METRICS_FLUSH_EVERY']
+) if redis_client else None
+app.request_metrics = request_metrics
+
+# In-process cache tier in front of Redis, invalidated across workers via pub/sub
+local_cache = LocalCache(
+    redis_client,
+    max_entries=app.config['LOCAL_CACHE_SIZE'],
+    ttl_seconds=app.config['LOCAL_CACHE_TTL']
+) if redis_client else None
+app.local_cache = local_cache
+
 # Middleware to track API calls and user activity
 @app.before_request
 def before_request():
     """Track API calls and user activity"""
-    if redis_client:
-        try:
-            # Increment total API calls
-            redis_client.incr('total_api_calls')
-            
-            # Track endpoint-specific calls
-            endpoint = request.endpoint
-            if endpoint:
-                redis_client.incr(f'endpoint_calls:{endpoint}')
-                
-        except Exception as e:
-            print(f"Redis tracking error: {e}")
+    if request_metrics:
+        g.request_started = time.perf_counter()
+        # Total and endpoint-specific calls
+        endpoint = request.endpoint
+        if endpoint:
+            request_metrics.incr('total_api_calls', f'endpoint_calls:{endpoint}')
+        else:
+            request_metrics.incr('total_api_calls')
 
 @app.after_request
 def after_request(response):
-    """Track response codes"""
-    if redis_client:
-        try:
-            status_code = response.status_code
-            redis_client.incr(f'response_codes:{status_code}')
-        except Exception as e:
-            print(f"Redis response tracking error: {e}")
+    """Track response codes, latency and DB usage"""
+    if request_metrics:
+        request_metrics.incr(f'response_codes:{response.status_code}')
+        started = g.get('request_started')
+        if started is not None:
+            request_metrics.record_request(
+                request.endpoint or 'unmatched',
+                request.method,
+                response.status_code,
+                time.perf_counter() - started,
+                g.get('db_queries', 0),
+                g.get('db_query_time', 0.0)
+            )
     return response
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics aggregated across all worker processes"""
+    if not redis_client:
+        return {'msg': 'Redis not available'}, 503
+    try:
+        # Include this worker's not yet flushed samples
+        request_metrics.flush()
+        return Response(render_prometheus(redis_client), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        return {'msg': 'Error rendering metrics', 'error': str(e)}, 500
+
 @app.route('/', methods=['GET'])
 def home():
     return {'msg': 'working fine?'}, 200
@@ -172,12 +247,13 @@ def redis_health():
     """Check Redis connection health"""
     if redis_client:
         try:
-            redis_client.ping()
+            # The snapshot read doubles as the connectivity check
+            snapshot = read_counters(redis_client)
             stats = {
                 'status': 'connected',
-                'active_users': redis_client.scard('active_users'),
-                'total_logins': int(redis_client.get('total_logins') or 0),
-                'total_registrations': int(redis_client.get('total_registrations') or 0),
+                'active_users': snapshot.active_users,
+                'total_logins': snapshot['total_logins'],
+                'total_registrations': snapshot['total_registrations'],
                 'app_name': redis_client.get('app_name')
             }
             return {'msg': 'Redis is healthy', 'stats': stats}, 200
@@ -193,45 +269,42 @@ def redis_dashboard():
         return {'msg': 'Redis not available'}, 503
     
     try:
+        # Include this worker's not yet flushed request counters
+        request_metrics.flush()
+        # Every counter, key count and INFO in one round trip
+        snapshot = read_counters(redis_client, include_info=True, include_key_counts=True)
         dashboard_data = {
             'connection_status': 'connected',
             'server_info': {
-                'redis_version': redis_client.info().get('redis_version', 'unknown'),
-                'used_memory_human': redis_client.info().get('used_memory_human', 'unknown'),
-                'connected_clients': redis_client.info().get('connected_clients', 0)
+                'redis_version': snapshot.info.get('redis_version', 'unknown'),
+                'used_memory_human': snapshot.info.get('used_memory_human', 'unknown'),
+                'connected_clients': snapshot.info.get('connected_clients', 0)
             },
             'application_metrics': {
-                'total_api_calls': int(redis_client.get('total_api_calls') or 0),
-                'total_logins': int(redis_client.get('total_logins') or 0),
-                'total_logouts': int(redis_client.get('total_logouts') or 0),
-                'total_registrations': int(redis_client.get('total_registrations') or 0),
-                'active_users_count': redis_client.scard('active_users'),
-                'users_created': int(redis_client.get('users_created') or 0),
-                'users_deleted': int(redis_client.get('users_deleted') or 0),
-                'parking_lots_created': int(redis_client.get('parking_lots_created') or 0),
-                'parking_lots_deleted': int(redis_client.get('parking_lots_deleted') or 0),
-                'total_reservations': int(redis_client.get('total_reservations') or 0),
-                'reservations_cancelled': int(redis_client.get('reservations_cancelled') or 0)
+                'total_api_calls': snapshot['total_api_calls'],
+                'total_logins': snapshot['total_logins'],
+                'total_logouts': snapshot['total_logouts'],
+                'total_registrations': snapshot['total_registrations'],
+                'active_users_count': snapshot.active_users,
+                'users_created': snapshot['users_created'],
+                'users_deleted': snapshot['users_deleted'],
+                'parking_lots_created': snapshot['parking_lots_created'],
+                'parking_lots_deleted': snapshot['parking_lots_deleted'],
+                'total_reservations': snapshot['total_reservations'],
+                'reservations_cancelled': snapshot['reservations_cancelled']
             },
             'daily_metrics': {
-                'today_logins': int(redis_client.get(f'daily_logins:{datetime.now().strftime("%Y-%m-%d")}') or 0),
-                'today_registrations': int(redis_client.get(f'daily_registrations:{datetime.now().strftime("%Y-%m-%d")}') or 0),
-                'today_reservations': int(redis_client.get(f'daily_reservations:{datetime.now().strftime("%Y-%m-%d")}') or 0)
-            },
-            'response_codes': {
-                '200': int(redis_client.get('response_codes:200') or 0),
-                '201': int(redis_client.get('response_codes:201') or 0),
-                '400': int(redis_client.get('response_codes:400') or 0),
-                '401': int(redis_client.get('response_codes:401') or 0),
-                '403': int(redis_client.get('response_codes:403') or 0),
-                '404': int(redis_client.get('response_codes:404') or 0),
-                '500': int(redis_client.get('response_codes:500') or 0)
+                'today_logins': snapshot.daily['logins'],
+                'today_registrations': snapshot.daily['registrations'],
+                'today_reservations': snapshot.daily['reservations']
             },
+            'response_codes': snapshot.response_codes,
             'cache_info': {
-                'total_keys': len(redis_client.keys('*')),
-                'active_sessions': len(redis_client.keys('user_session:*')),
-                'cached_parking_lots': len(redis_client.keys('parking_lot:*')),
-                'rate_limits_active': len(redis_client.keys('rate_limit:*'))
+                'total_keys': snapshot.total_keys,
+                # O(1)-ish counts from the keyspace registries instead of KEYS walks
+                'active_sessions': snapshot.key_counts['user_session'],
+                'cached_parking_lots': snapshot.key_counts['parking_lot'],
+                'rate_limits_active': snapshot.key_counts['rate_limit']
             }
         }
         
@@ -256,12 +329,10 @@ def clear_cache():
             'rate_limit:*', 'daily_*', 'monthly_*'
         ]
         
-        cleared_count = 0
-        for pattern in all_patterns:
-            keys = redis_client.keys(pattern)
-            if keys:
-                redis_client.delete(*keys)
-                cleared_count += len(keys)
+        # One incremental SCAN pass with batched UNLINK instead of a KEYS call per pattern
+        cleared_count = scan_unlink(redis_client, all_patterns)
+        if local_cache:
+            local_cache.invalidate_all()
         
         # Reset important counters to zero
         redis_client.set('total_api_calls', 0)
@@ -285,6 +356,17 @@ def clear_cache():
     except Exception as e:
         return {'msg': 'Error clearing cache', 'error': str(e)}, 500
 
+def upgrade_database():
+    """Apply all migrations, adopting databases created with db.create_all()"""
+    tables = set(db.inspect(db.engine).get_table_names())
+    if 'user' in tables and 'alembic_version' not in tables:
+        # Tables exist but were never migrated: a complete schema is already at
+        # head, anything older is the schema from before migrations existed
+        revision = 'head' if set(db.metadata.tables) <= tables else BASELINE_REVISION
+        stamp(revision=revision)
+        print(f"✅ Existing database stamped at {revision}")
+    upgrade()
+
 @app.route('/admin/reset-database', methods=['POST'])
 def reset_database():
     """Reset database and clear all cache - DANGEROUS operation"""
@@ -292,32 +374,20 @@ def reset_database():
         return {'msg': 'Redis not available'}, 503
     
     try:
-        # First, clear all Redis cache
-        all_patterns = [
-            'users:*', 'user:*', 'user_session:*',
-            'parking_lot*', 'active_users',
-            '*api_calls*', '*_count*', '*registrations*', 
-            '*logins*', '*reservations*', '*emails*',
-            'rate_limit:*', 'daily_*', 'monthly_*',
-            'endpoint_calls:*', 'response_codes:*'
-        ]
-        
-        cleared_count = 0
-        for pattern in all_patterns:
-            keys = redis_client.keys(pattern)
-            if keys:
-                redis_client.delete(*keys)
-                cleared_count += len(keys)
+        # Clear ALL Redis keys; ASYNC frees memory in the background instead of blocking Redis
+        cleared_count = redis_client.dbsize()
+        redis_client.flushdb(asynchronous=True)
+        if local_cache:
+            local_cache.invalidate_all()
         
-        # Clear ALL Redis keys to be absolutely sure
-        redis_client.flushdb()
-        
-        # Drop all database tables
+        # Drop all database tables, and the migration history with them
         db.drop_all()
+        db.session.execute(db.text('DROP TABLE IF EXISTS alembic_version'))
+        db.session.commit()
         print("✅ Database tables dropped")
         
-        # Recreate all tables
-        db.create_all()
+        # Recreate all tables through the migrations
+        upgrade_database()
         print("✅ Database tables recreated")
         
         # Create default admin user
@@ -360,9 +430,9 @@ def reset_database():
 if __name__ == '__main__':
     with app.app_context():
         try:
-            # Create all tables
-            db.create_all()
-            print("✅ Database tables created successfully")
+            # Create or upgrade all tables
+            upgrade_database()
+            print("✅ Database migrations applied successfully")
             
             # Create admin user if it doesn't exist
             admin = User.query.filter_by(email='admin@mad2.com').first()
@@ -0,0 +1,96 @@
+"""
+Cold-storage archival of completed reservations.
+
+Completed reservations older than ARCHIVE_AFTER_DAYS are moved from the hot
+reserve_spot table, which booking and reporting queries scan, into
+reserve_spot_archive. Each batch is copied with one INSERT ... SELECT and
+removed with one DELETE in the same transaction, so a crash never loses or
+duplicates a row. Archived rows keep their id and carry their lot id.
+
+Readers of the whole history (booking history, exports, rollup rebuilds)
+select from reservation_history, a UNION ALL of both tiers with the same
+columns. The beat job archive_old_reservations runs this daily; run it by
+hand with:
+
+    python archive.py [days]
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, literal, select, union_all
+from models import db, ParkingSpot, ReserveSpot, ReserveSpotArchive
+
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 5000
+
+ARCHIVE_COLUMNS = (
+    'id', 'spot_id', 'lot_id', 'user_id', 'parking_time', 'leaving_time',
+    'parking_cost', 'transaction_id', 'payment_method', 'archived_at',
+)
+
+
+def _hot_reservations():
+    return select(
+        ReserveSpot.id, ReserveSpot.spot_id, ParkingSpot.lot_id, ReserveSpot.user_id,
+        ReserveSpot.parking_time, ReserveSpot.leaving_time, ReserveSpot.parking_cost,
+        ReserveSpot.transaction_id, ReserveSpot.payment_method
+    ).select_from(ReserveSpot).outerjoin(ParkingSpot, ReserveSpot.spot_id == ParkingSpot.id)
+
+
+# Both tiers as one selectable; filter on reservation_history.c.<column>
+reservation_history = union_all(
+    _hot_reservations(),
+    select(
+        ReserveSpotArchive.id, ReserveSpotArchive.spot_id, ReserveSpotArchive.lot_id,
+        ReserveSpotArchive.user_id, ReserveSpotArchive.parking_time, ReserveSpotArchive.leaving_time,
+        ReserveSpotArchive.parking_cost, ReserveSpotArchive.transaction_id, ReserveSpotArchive.payment_method
+    )
+).subquery('reservation_history')
+
+
+def archive_reservations(*conditions):
+    """
+    Copy reservations matching `conditions` into reserve_spot_archive; returns
+    the row count. The caller deletes them from reserve_spot and owns the
+    transaction.
+    """
+    rows = _hot_reservations().add_columns(literal(datetime.now(), db.DateTime)).where(*conditions)
+    return db.session.execute(
+        insert(ReserveSpotArchive).from_select(ARCHIVE_COLUMNS, rows)
+    ).rowcount
+
+
+def archive_completed(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move completed reservations that ended more than `older_than_days` ago to
+    the archive, committing one batch at a time. Returns the number moved.
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    moved = 0
+    while True:
+        batch = select(ReserveSpot.id).where(
+            ReserveSpot.leaving_time.isnot(None),
+            ReserveSpot.leaving_time < cutoff,
+            # Implied by the above; lets PostgreSQL skip recent partitions
+            ReserveSpot.parking_time < cutoff
+        ).order_by(ReserveSpot.id).limit(batch_size)
+        ids = db.session.execute(batch).scalars().all()
+        if not ids:
+            return moved
+
+        archive_reservations(ReserveSpot.id.in_(ids))
+        db.session.execute(
+            delete(ReserveSpot).where(ReserveSpot.id.in_(ids), ReserveSpot.parking_time < cutoff),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        moved += len(ids)
+
+
+if __name__ == '__main__':
+    import sys
+    from app import app
+
+    with app.app_context():
+        days = int(sys.argv[1]) if len(sys.argv) > 1 else app.config.get('ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)
+        print(f"🔄 Archiving reservations completed more than {days} days ago...")
+        count = archive_completed(days, app.config.get('ARCHIVE_BATCH_SIZE', ARCHIVE_BATCH_SIZE))
+        print(f"✅ Archived {count} reservations")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Email render benchmark.
+
+Renders the monthly report email for synthetic users with tasks.py and
+serializes it the way send_simple_email used to (MIME boundary chosen by the
+generator) and the way mailer.build_message does now (preset boundary), and
+prints the cost per message of rendering, of MIME serialization and of both
+together.
+
+    python benchmarks/email_render.py --users 20000 --lots 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from email.mime.multipart import MIMEMultipart  # noqa: E402
+from email.mime.text import MIMEText  # noqa: E402
+
+from mailer import build_message  # noqa: E402
+from tasks import _monthly_report_email  # noqa: E402
+
+
+def legacy_build_message(to_email, subject, body, html_body=None):
+    """The MIME builder send_simple_email used before mailer.py"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = 'no-reply@parkease.com'
+    msg['To'] = to_email
+    msg.attach(MIMEText(body, 'plain'))
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+def make_reports(users, lots):
+    """Synthetic coordinator rows, see tasks._monthly_report_email"""
+    reports = []
+    for i in range(users):
+        usage = [[f'Lot {lot}', random.randint(1, 20)] for lot in random.sample(range(1, 50), random.randint(1, lots))]
+        bookings = sum(count for _, count in usage)
+        reports.append([f'user{i}', f'user{i}@example.com', bookings,
+                        bookings * 20.0, bookings * random.uniform(0.5, 6), usage])
+    return reports
+
+
+def measure(func, items, repeat):
+    """Best time per item in microseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--lots', type=int, default=5, help='maximum lots per user')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    reports = make_reports(args.users, args.lots)
+    now = datetime(2026, 1, 31, 9, 0, 0)
+
+    emails = [_monthly_report_email(report, now) for report in reports]
+
+    # Rendering is unchanged, so it counts the same on both sides
+    render = measure(lambda report: _monthly_report_email(report, now), reports, args.repeat)
+    rows = [
+        ('render', render, render),
+        ('MIME build + serialize',
+         measure(lambda email: legacy_build_message(**email).as_string(), emails, args.repeat),
+         measure(lambda email: build_message(**email).as_string(), emails, args.repeat)),
+    ]
+    rows.append(('total', rows[0][1] + rows[1][1], rows[0][2] + rows[1][2]))
+
+    print(f'\n{"us per message":24} {"before":>10} {"after":>10}')
+    for name, before, after in rows:
+        print(f'{name:24} {before:10.1f} {after:10.1f}   x{before / after:.2f}')
+
+
+if __name__ == '__main__':
+    main()
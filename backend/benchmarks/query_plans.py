@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Query plan benchmark for the hot query shapes.
+
+Seeds a scratch database, then prints the query plan and average latency of
+each hot query before and after the indexes declared in models.py are built.
+
+    python benchmarks/query_plans.py --reservations 200000
+    python benchmarks/query_plans.py --url postgresql://localhost/parking_bench
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db  # noqa: E402
+
+NOW = datetime(2026, 1, 15, 12, 0, 0)
+
+HOT_QUERIES = [
+    ('free spot of a lot',
+     "SELECT id FROM parking_spot WHERE lot_id = :lot_id AND status = 'available' ORDER BY id LIMIT 1"),
+    ('active reservation of a user',
+     "SELECT id FROM reserve_spot WHERE user_id = :user_id "
+     "AND (leaving_time IS NULL OR leaving_time > :now) LIMIT 1"),
+    ('booking history page',
+     "SELECT id, parking_time FROM reserve_spot WHERE user_id = :user_id "
+     "ORDER BY parking_time DESC LIMIT 50"),
+    ('30-day revenue',
+     "SELECT SUM(parking_cost) FROM reserve_spot WHERE parking_time >= :since "
+     "AND parking_time < :now AND leaving_time IS NOT NULL"),
+    ('reservations of a lot',
+     "SELECT COUNT(*) FROM reserve_spot JOIN parking_spot ON reserve_spot.spot_id = parking_spot.id "
+     "WHERE parking_spot.lot_id = :lot_id"),
+    ('reservations of a spot',
+     "SELECT COUNT(*) FROM reserve_spot WHERE spot_id = :spot_id"),
+]
+
+
+def seed(conn, lots, spots_per_lot, users, reservations):
+    """Fill the scratch database with synthetic parking history"""
+    conn.execute(text("INSERT INTO \"user\" (id, username, email, role, password) VALUES (:id, :u, :e, 'user', 'x')"),
+                 [{'id': i, 'u': f'user{i}', 'e': f'user{i}@example.com'} for i in range(1, users + 1)])
+    conn.execute(text("INSERT INTO parking_lot (id, location_name, price, address, pincode, number_of_slots, available_slots) "
+                      "VALUES (:id, :n, 20, 'addr', '000000', :s, :s)"),
+                 [{'id': i, 'n': f'Lot {i}', 's': spots_per_lot} for i in range(1, lots + 1)])
+    total_spots = lots * spots_per_lot
+    conn.execute(text("INSERT INTO parking_spot (id, lot_id, status) VALUES (:id, :lot, :status)"),
+                 [{'id': i, 'lot': (i - 1) // spots_per_lot + 1,
+                   'status': 'occupied' if random.random() < 0.9 else 'available'}
+                  for i in range(1, total_spots + 1)])
+
+    rows = []
+    for i in range(1, reservations + 1):
+        start = NOW - timedelta(minutes=random.randint(0, 3 * 365 * 24 * 60))
+        active = random.random() < 0.01
+        rows.append({
+            'id': i,
+            'spot': random.randint(1, total_spots),
+            'user': random.randint(1, users),
+            'start': start,
+            'end': None if active else start + timedelta(minutes=random.randint(15, 600)),
+            'cost': 0.0 if active else random.randint(1, 10) * 20.0,
+        })
+        if len(rows) == 10000:
+            _insert_reservations(conn, rows)
+            rows = []
+    if rows:
+        _insert_reservations(conn, rows)
+
+
+def _insert_reservations(conn, rows):
+    conn.execute(text("INSERT INTO reserve_spot (id, spot_id, user_id, parking_time, leaving_time, parking_cost) "
+                      "VALUES (:id, :spot, :user, :start, :end, :cost)"), rows)
+
+
+def explain(conn, sql, params):
+    """Get the query plan as text"""
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params).fetchall()
+        return '\n'.join(f'    {row[-1]}' for row in rows)
+    rows = conn.execute(text('EXPLAIN ' + sql), params).fetchall()
+    return '\n'.join(f'    {row[0]}' for row in rows)
+
+
+def measure(conn, sql, params, repeat):
+    """Average latency of a query in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(text(sql), params).fetchall()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def run_queries(conn, params, repeat, label):
+    print(f'\n=== {label} ===')
+    timings = {}
+    for name, sql in HOT_QUERIES:
+        timings[name] = measure(conn, sql, params, repeat)
+        print(f'\n{name}: {timings[name]:.3f} ms')
+        print(explain(conn, sql, params))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite://', help='scratch database URL (tables are dropped!)')
+    parser.add_argument('--lots', type=int, default=50)
+    parser.add_argument('--spots-per-lot', type=int, default=200)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--reservations', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    engine = create_engine(args.url)
+    tables = [db.metadata.tables[name] for name in ('user', 'parking_lot', 'parking_spot', 'reserve_spot')]
+    indexes = [index for table in tables for index in table.indexes]
+
+    db.metadata.drop_all(engine, tables=tables)
+    with engine.begin() as conn:
+        # Build the tables as they were before the indexes existed
+        for table in tables:
+            table.create(conn)
+            for index in table.indexes:
+                index.drop(conn)
+        print(f'Seeding {args.reservations} reservations...')
+        seed(conn, args.lots, args.spots_per_lot, args.users, args.reservations)
+
+    params = {'lot_id': args.lots // 2, 'user_id': args.users // 2, 'spot_id': 1,
+              'now': NOW, 'since': NOW - timedelta(days=30)}
+
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text('ANALYZE'))
+        before = run_queries(conn, params, args.repeat, 'before indexes')
+
+        for index in indexes:
+            index.create(conn)
+        conn.execute(text('ANALYZE'))
+        after = run_queries(conn, params, args.repeat, 'after indexes')
+
+    print('\n=== summary (ms per query) ===')
+    for name, _ in HOT_QUERIES:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f'{name:32} {before[name]:10.3f} {after[name]:10.3f}   x{speedup:.1f}')
+
+    db.metadata.drop_all(engine, tables=tables)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Stampede-safe cache fills.
+
+get_or_fill() keeps a value under `key` and a freshness marker `key:fresh`
+that lives for the fresh TTL, while the value itself is kept stale_ttl
+longer. Invalidation (mark_stale) only drops the marker, so readers keep
+getting the previous value while exactly one worker, holding `key:lock`,
+recomputes it (stale-while-revalidate). While the marker is alive, readers
+volunteer for an early refresh with a probability that grows as expiry nears
+and with how long the last computation took (XFetch), so hot keys are usually
+refreshed before anyone sees them stale. Only a cold miss makes readers wait,
+and then only for the one computation in flight.
+
+A counter `key:version` is bumped by every invalidation; a refresh that
+raced with one stores its value but leaves it marked stale.
+"""
+import json
+import math
+import random
+import time
+from redis.exceptions import LockError
+from keyspace import register_key
+
+# Seconds a recompute may hold the fill lock
+FILL_LOCK_TIMEOUT = 5
+# Seconds a reader waits for another worker's fill of a missing key
+COLD_WAIT = 1.0
+COLD_POLL_INTERVAL = 0.025
+# Higher values refresh earlier
+EARLY_REFRESH_BETA = 1.0
+VERSION_TTL = 86400
+
+# KEYS: value, fresh marker, version; ARGV: entry, value ms, fresh ms, version read before computing
+WRITE_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+if (redis.call('GET', KEYS[3]) or '0') == ARGV[4] then
+    redis.call('SET', KEYS[2], '1', 'PX', ARGV[3])
+end
+"""
+
+_scripts = {}
+
+
+def _write_script(redis_client):
+    script = _scripts.get(id(redis_client))
+    if script is None:
+        script = _scripts[id(redis_client)] = redis_client.register_script(WRITE_SCRIPT)
+    return script
+
+
+def _fresh_key(key):
+    return f'{key}:fresh'
+
+
+def _version_key(key):
+    return f'{key}:version'
+
+
+def _store(redis_client, key, compute, ttl, stale_ttl, version):
+    started = time.perf_counter()
+    value = compute()
+    entry = json.dumps({'value': value, 'delta': time.perf_counter() - started})
+    pipe = redis_client.pipeline(transaction=False)
+    _write_script(redis_client)(
+        keys=[key, _fresh_key(key), _version_key(key)],
+        args=[entry, int((ttl + stale_ttl) * 1000), int(ttl * 1000), version or '0'],
+        client=pipe
+    )
+    register_key(pipe, key, ttl + stale_ttl)
+    pipe.execute()
+    return value
+
+
+def _refresh(redis_client, key, compute, ttl, stale_ttl, version):
+    """Recompute under the fill lock; returns None if another worker holds it"""
+    lock = redis_client.lock(f'{key}:lock', timeout=FILL_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        return None
+    try:
+        return _store(redis_client, key, compute, ttl, stale_ttl, version)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+
+def get_or_fill(redis_client, key, compute, ttl, stale_ttl, local_cache=None):
+    """
+    Get a JSON-serializable value, computing it with compute() when needed.
+    Returns (value, result) where result is 'local_hit', 'hit', 'stale' or 'miss'.
+    """
+    if local_cache:
+        found, value = local_cache.get(key)
+        if found:
+            return value, 'local_hit'
+        generation = local_cache.generation()
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(key)
+    pipe.pttl(_fresh_key(key))
+    pipe.get(_version_key(key))
+    raw, fresh_ms, version = pipe.execute()
+
+    if raw is not None:
+        entry = json.loads(raw)
+        if fresh_ms > 0:
+            early = entry['delta'] * EARLY_REFRESH_BETA * -math.log(1 - random.random()) * 1000 >= fresh_ms
+            if not early:
+                if local_cache:
+                    local_cache.set(key, entry['value'], fresh_ms / 1000, generation)
+                return entry['value'], 'hit'
+            value = _refresh(redis_client, key, compute, ttl, stale_ttl, version)
+            return (entry['value'], 'hit') if value is None else (value, 'miss')
+        value = _refresh(redis_client, key, compute, ttl, stale_ttl, version)
+        return (entry['value'], 'stale') if value is None else (value, 'miss')
+
+    # Cold miss: one worker computes, the others wait briefly for its result
+    deadline = time.monotonic() + COLD_WAIT
+    while True:
+        value = _refresh(redis_client, key, compute, ttl, stale_ttl, version)
+        if value is not None:
+            return value, 'miss'
+        if time.monotonic() >= deadline:
+            return _store(redis_client, key, compute, ttl, stale_ttl, version), 'miss'
+        time.sleep(COLD_POLL_INTERVAL)
+        raw = redis_client.get(key)
+        if raw is not None:
+            return json.loads(raw)['value'], 'hit'
+
+
+def mark_stale(pipe, key):
+    """Queue invalidation of a get_or_fill value on a pipeline"""
+    pipe.delete(_fresh_key(key))
+    pipe.incr(_version_key(key))
+    pipe.expire(_version_key(key), VERSION_TTL)
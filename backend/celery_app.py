@@ -28,6 +28,22 @@ celery.conf.update(
             'schedule': 10.0,  
             # 'schedule': crontab(day_of_month=1, hour=9, minute=0),  # Monthly at 9:00 AM on the 1st
         },
+        'reconcile-spot-pools': {
+            'task': 'tasks.reconcile_spot_pools',
+            'schedule': 300.0,  # Every 5 minutes
+        },
+        'drain-email-outbox': {
+            'task': 'tasks.drain_email_outbox',
+            'schedule': 60.0,  # Every minute
+        },
+        'archive-old-reservations': {
+            'task': 'tasks.archive_old_reservations',
+            'schedule': crontab(hour=3, minute=0),  # Daily at 3:00 AM
+        },
+        'ensure-reserve-spot-partitions': {
+            'task': 'tasks.ensure_reserve_spot_partitions',
+            'schedule': crontab(hour=2, minute=0),  # Daily at 2:00 AM
+        },
     }
 )
 
@@ -1,11 +1,28 @@
 from flask_restful import Resource, Api
-from flask import request, current_app
+from flask import request, current_app, Response, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import db, User, ParkingLot, ParkingSpot, ReserveSpot
+from models import db, User, ParkingLot, ParkingSpot, ReserveSpot, LotActivityRollup, PaymentMethodRollup
+from allocation import claim_spot, claim_free_spot, release_spot
+from spot_pool import push_free_spots, remove_free_spots, drop_pool
+from rollups import record_booking, record_completion, retract_reservation
+from outbox import enqueue_email, dispatch_email
+from keyspace import register_key, unregister_key, scan_unlink
+from rate_limiter import rate_limit, hit as rate_limit_hit
+from cache_fill import get_or_fill, mark_stale
+from counters import read_counters, daily_key
+from lot_availability import lot_availability, adjust_availability, set_availability, remove_availability, refresh_availability
+from provisioning import provision_spots, resize_lot, ResizeError, RETIRED
+from deletion import delete_user, delete_lot
+from archive import reservation_history
 from datetime import datetime, timedelta
 import calendar
 import math
 import json
+import csv
+import io
+
+# Lot details change rarely; availability is kept in separate counters
+LOT_DETAILS_CACHE_SECONDS = 300
 
 # Redis utility functions
 def get_redis_client():
@@ -17,20 +34,55 @@ def cache_set(key, value, expiry_seconds=300):
     redis_client = get_redis_client()
     if redis_client:
         try:
-            redis_client.setex(key, expiry_seconds, json.dumps(value))
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.setex(key, expiry_seconds, json.dumps(value))
+            register_key(pipe, key, expiry_seconds)
+            pipe.execute()
+            local_cache = get_local_cache()
+            if local_cache and local_cache.handles(key):
+                local_cache.set(key, value, expiry_seconds)
             return True
         except Exception as e:
             print(f"Redis cache set error: {e}")
     return False
 
+def get_request_metrics():
+    """Get the request metrics collector from Flask app context"""
+    return getattr(current_app, 'request_metrics', None)
+
+def get_local_cache():
+    """Get the in-process cache tier from Flask app context"""
+    return getattr(current_app, 'local_cache', None)
+
 def cache_get(key):
-    """Get cached value"""
+    """Get cached value, from the in-process tier when possible"""
     redis_client = get_redis_client()
     if redis_client:
         try:
-            cached_data = redis_client.get(key)
+            metrics = get_request_metrics()
+            local_cache = get_local_cache()
+            if local_cache and local_cache.handles(key):
+                found, value = local_cache.get(key)
+                if found:
+                    if metrics:
+                        metrics.record_cache(key, 'local_hit')
+                    return value
+                # Taken before reading Redis so a racing invalidation wins
+                generation = local_cache.generation()
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.pttl(key)
+                cached_data, ttl_ms = pipe.execute()
+            else:
+                local_cache = None
+                cached_data = redis_client.get(key)
+            if metrics:
+                metrics.record_cache(key, 'hit' if cached_data is not None else 'miss')
             if cached_data:
-                return json.loads(cached_data)
+                value = json.loads(cached_data)
+                if local_cache and ttl_ms > 0:
+                    local_cache.set(key, value, ttl_ms / 1000, generation)
+                return value
         except Exception as e:
             print(f"Redis cache get error: {e}")
     return None
@@ -40,22 +92,62 @@ def cache_delete(key):
     redis_client = get_redis_client()
     if redis_client:
         try:
-            redis_client.delete(key)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(key)
+            unregister_key(pipe, key)
+            local_cache = get_local_cache()
+            if local_cache and local_cache.handles(key):
+                local_cache.publish_invalidation(pipe, key)
+            pipe.execute()
             return True
         except Exception as e:
             print(f"Redis cache delete error: {e}")
     return False
 
+def cache_get_or_fill(key, compute, expiry_seconds=10, stale_seconds=60):
+    """
+    Get a cached value, computing it at most once across workers when it is
+    missing or stale; stale values are served while the refresh runs
+    """
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            value, result = get_or_fill(redis_client, key, compute, expiry_seconds, stale_seconds, get_local_cache())
+            metrics = get_request_metrics()
+            if metrics:
+                metrics.record_cache(key, result)
+            return value
+        except Exception as e:
+            print(f"Redis cache fill error: {e}")
+    return compute()
+
+def cache_invalidate(key):
+    """Mark a cache_get_or_fill value stale"""
+    redis_client = get_redis_client()
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            mark_stale(pipe, key)
+            local_cache = get_local_cache()
+            if local_cache and local_cache.handles(key):
+                local_cache.publish_invalidation(pipe, key)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Redis cache invalidate error: {e}")
+    return False
+
 def clear_all_cache():
     """Clear all application cache"""
     redis_client = get_redis_client()
     if redis_client:
         try:
-            # Get all cache keys
-            cache_keys = redis_client.keys('users:*') + redis_client.keys('user:*') + redis_client.keys('parking_lot*')
-            if cache_keys:
-                redis_client.delete(*cache_keys)
-            print(f"✅ Cleared {len(cache_keys)} cache keys")
+            # Incremental SCAN + UNLINK instead of blocking KEYS
+            cleared = scan_unlink(redis_client, ['users:*', 'user:*', 'parking_lot*'])
+            local_cache = get_local_cache()
+            if local_cache:
+                local_cache.invalidate_all()
+            print(f"✅ Cleared {cleared} cache keys")
             return True
         except Exception as e:
             print(f"Redis cache clear error: {e}")
@@ -83,22 +175,32 @@ def add_to_set(key, value, expiry_seconds=3600):
             print(f"Redis set error: {e}")
     return False
 
+def archive_requested():
+    """Whether a delete should archive history first (?archive=1, default ARCHIVE_ON_DELETE)"""
+    archive = request.args.get('archive')
+    if archive is None:
+        return current_app.config.get('ARCHIVE_ON_DELETE', False)
+    return archive.lower() in ('1', 'true', 'yes')
+
+def superseding_reservation(reservation):
+    """
+    Another reservation of the same user on the same spot that holds the spot
+    instead of this one: one still open, or one made later
+    """
+    return ReserveSpot.query.filter(
+        ReserveSpot.user_id == reservation.user_id,
+        ReserveSpot.spot_id == reservation.spot_id,
+        ReserveSpot.id != reservation.id,
+        db.or_(ReserveSpot.leaving_time.is_(None), ReserveSpot.id > reservation.id)
+    ).first()
+
 def rate_limit_check(user_id, endpoint, max_requests=100, window_seconds=3600):
-    """Check rate limit for user"""
+    """Check rate limit for user (sliding window, one atomic script call)"""
     redis_client = get_redis_client()
     if redis_client:
         try:
-            key = f'rate_limit:{user_id}:{endpoint}'
-            current_requests = redis_client.get(key)
-            
-            if current_requests is None:
-                redis_client.setex(key, window_seconds, 1)
-                return True
-            elif int(current_requests) < max_requests:
-                redis_client.incr(key)
-                return True
-            else:
-                return False
+            allowed, _, _ = rate_limit_hit(redis_client, [(f'rate_limit:{user_id}:{endpoint}', max_requests, window_seconds)])
+            return allowed
         except Exception as e:
             print(f"Redis rate limit error: {e}")
     return True  # Allow if Redis is unavailable
@@ -326,61 +428,19 @@ class UserResource(Resource):
             return {'msg': 'Cannot delete admin users for security reasons'}, 403
         
         try:
-            # Handle related records before deleting user
-            
-            # 1. Check for active reservations
-            active_reservations = ReserveSpot.query.filter_by(user_id=user_id).filter(
-                ReserveSpot.leaving_time.is_(None)
-            ).all()
-            
-            if active_reservations:
-                # Release all active parking spots and complete reservations
-                for reservation in active_reservations:
-                    spot = ParkingSpot.query.get(reservation.spot_id)
-                    if spot:
-                        spot.status = 'available'
-                        spot.user_id = None
-                        
-                        # Update available slots in the parking lot
-                        lot = ParkingLot.query.get(spot.lot_id)
-                        if lot:
-                            lot.available_slots += 1
-                    
-                    # Mark reservation as completed with current time
-                    reservation.leaving_time = datetime.now()
-                    
-                    # Calculate final cost if not already set
-                    if reservation.parking_cost == 0:
-                        lot = ParkingLot.query.get(spot.lot_id) if spot else None
-                        if lot:
-                            duration_hours = (reservation.leaving_time - reservation.parking_time).total_seconds() / 3600
-                            reservation.parking_cost = duration_hours * lot.price
-            
-            # 2. Clear user_id from any parking spots still assigned to this user
-            assigned_spots = ParkingSpot.query.filter_by(user_id=user_id).all()
-            for spot in assigned_spots:
-                spot.user_id = None
-                spot.status = 'available'
-                
-                # Update available slots
-                lot = ParkingLot.query.get(spot.lot_id)
-                if lot:
-                    lot.available_slots += 1
-            
-            # 3. Delete ALL reservations (both active and historical) for this user
-            # This is necessary to avoid foreign key constraint violations
-            all_reservations = ReserveSpot.query.filter_by(user_id=user_id).all()
-            for reservation in all_reservations:
-                db.session.delete(reservation)
-            
-            # 4. Now safe to delete the user
-            db.session.delete(user)
+            # Release held spots, close open reservations and remove the
+            # user's history in a fixed number of set-based statements
+            released_spots = delete_user(user_id, archive=archive_requested())
             db.session.commit()
             
+            # Return released spots to the free-spot pools
+            for released_lot_id, spot_id in released_spots:
+                push_free_spots(released_lot_id, spot_id)
+            
             # Invalidate caches
             cache_delete(f'user:{user_id}')
             cache_delete('users:all')
-            cache_delete('parking_lots:all')  # Since we may have updated availability
+            refresh_availability({released_lot_id for released_lot_id, _ in released_spots})
             increment_counter('users_deleted')
             
             return {'msg': 'User deleted successfully. Any active reservations have been completed, parking spots released, and reservation history removed.'}, 200
@@ -401,12 +461,11 @@ class ParkingLotResource(Resource):
         if lot_id:
             # Try to get parking lot from cache first
             cache_key = f'parking_lot:{lot_id}'
-            cached_lot = cache_get(cache_key)
-            if cached_lot:
-                return cached_lot, 200
-                
-            lot = ParkingLot.query.get(lot_id)
-            if lot:
+            lot_data = cache_get(cache_key)
+            if not lot_data:
+                lot = ParkingLot.query.get(lot_id)
+                if not lot:
+                    return {'msg': 'Parking lot not found'}, 404
                 lot_data = {
                     'msg': 'Parking lot found',
                     'lot': {
@@ -419,17 +478,28 @@ class ParkingLotResource(Resource):
                         'available_slots': lot.available_slots
                     }
                 }
-                # Cache parking lot data for 10 seconds only to prevent stale data
-                cache_set(cache_key, lot_data, 10)
-                return lot_data, 200
-            return {'msg': 'Parking lot not found'}, 404
-        
-        # Try to get all parking lots from cache
-        cache_key = 'parking_lots:all'
-        cached_lots = cache_get(cache_key)
-        if cached_lots:
-            return cached_lots, 200
-        
+                # Lot details only change on edits, which delete this key
+                cache_set(cache_key, lot_data, LOT_DETAILS_CACHE_SECONDS)
+            
+            # Availability comes from the live per-lot counters
+            lot = lot_data['lot']
+            available = lot_availability().get(lot['id'], lot['available_slots'])
+            return {'msg': lot_data['msg'], 'lot': dict(lot, available_slots=available)}, 200
+        
+        # Lot details refreshed by one worker at a time when stale, with the
+        # live per-lot availability counters laid over them
+        lots = cache_get_or_fill('parking_lots:all', self._all_lots, LOT_DETAILS_CACHE_SECONDS)
+        availability = lot_availability()
+        return {
+            'msg': lots['msg'],
+            'lots': [
+                dict(lot, available_slots=availability.get(lot['id'], lot['available_slots']))
+                for lot in lots['lots']
+            ]
+        }, 200
+    
+    @staticmethod
+    def _all_lots():
         lots = ParkingLot.query.all()
         lot_list = []
         for lot in lots:
@@ -442,11 +512,7 @@ class ParkingLotResource(Resource):
                 'number_of_slots': lot.number_of_slots,
                 'available_slots': lot.available_slots
             })
-        
-        response_data = {'msg': 'Parking lots retrieved successfully', 'lots': lot_list}
-        # Cache parking lots for 10 seconds only (they change frequently)
-        cache_set(cache_key, response_data, 10)
-        return response_data, 200
+        return {'msg': 'Parking lots retrieved successfully', 'lots': lot_list}
     
     @jwt_required()
     def post(self):
@@ -478,20 +544,15 @@ class ParkingLotResource(Resource):
             )
             
             db.session.add(lot)
-            db.session.commit()
-            
-            # Create parking spots for this lot
-            for i in range(int(number_of_slots)):
-                spot = ParkingSpot(
-                    lot_id=lot.id,
-                    status='available'
-                )
-                db.session.add(spot)
+            db.session.flush()
             
+            # Create the lot's spots in bulk, in the same transaction as the lot
+            provision_spots(lot.id, lot.number_of_slots)
             db.session.commit()
             
             # Invalidate parking lots cache when new lot is created
-            cache_delete('parking_lots:all')
+            cache_invalidate('parking_lots:all')
+            set_availability(lot.id, lot.available_slots)
             increment_counter('parking_lots_created')
             
             return {
@@ -532,17 +593,25 @@ class ParkingLotResource(Resource):
             lot.address = data['address']
         if 'pincode' in data:
             lot.pincode = data['pincode']
-        if 'number_of_slots' in data:
-            lot.number_of_slots = int(data['number_of_slots'])
         if 'available_slots' in data:
             lot.available_slots = int(data['available_slots'])
         
         try:
+            resized = False
+            if 'number_of_slots' in data and int(data['number_of_slots']) != lot.number_of_slots:
+                # Add or remove spots so the lot really has that many
+                resize_lot(lot, int(data['number_of_slots']))
+                resized = True
             db.session.commit()
             
+            if resized:
+                # The free-spot pool is rebuilt from the new set of spots
+                drop_pool(lot_id)
+            
             # Invalidate parking lot cache when updated
             cache_delete(f'parking_lot:{lot_id}')
-            cache_delete('parking_lots:all')
+            cache_invalidate('parking_lots:all')
+            set_availability(lot.id, lot.available_slots)
             
             return {
                 'msg': 'Parking lot updated successfully',
@@ -556,6 +625,9 @@ class ParkingLotResource(Resource):
                     'available_slots': lot.available_slots
                 }
             }, 200
+        except ResizeError as e:
+            db.session.rollback()
+            return {'msg': str(e)}, 409
         except Exception as e:
             db.session.rollback()
             return {'msg': 'Error updating parking lot', 'error': str(e)}, 500
@@ -574,14 +646,15 @@ class ParkingLotResource(Resource):
             return {'msg': 'Parking lot not found'}, 404
         
         try:
-            # Delete all spots in this lot first
-            ParkingSpot.query.filter_by(lot_id=lot_id).delete()
-            db.session.delete(lot)
+            # Delete the lot's reservations and spots with it
+            delete_lot(lot_id, archive=archive_requested())
             db.session.commit()
             
             # Invalidate parking lot cache when deleted
             cache_delete(f'parking_lot:{lot_id}')
-            cache_delete('parking_lots:all')
+            cache_invalidate('parking_lots:all')
+            remove_availability(lot_id)
+            drop_pool(lot_id)
             increment_counter('parking_lots_deleted')
             
             return {'msg': 'Parking lot deleted successfully'}, 200
@@ -607,7 +680,7 @@ class ParkingSpotResource(Resource):
                 }, 200
             return {'msg': 'Parking spot not found'}, 404
         
-        spots = ParkingSpot.query.all()
+        spots = ParkingSpot.query.filter(ParkingSpot.status != RETIRED).all()
         spot_list = []
         for spot in spots:
             spot_list.append({
@@ -760,23 +833,22 @@ class ReserveSpotResource(Resource):
                 parking_cost=parking_cost
             )
             
-            # Update spot status
-            spot.status = 'reserved'
-            spot.user_id = user_id
-            
-            # Update available slots in lot
-            lot.available_slots -= 1
+            # Atomically reserve the spot and update available slots in lot
+            if claim_spot(lot.id, user_id, status='reserved', spot_id=spot.id) is None:
+                db.session.rollback()
+                return {'msg': 'Parking spot is not available'}, 400
             
             db.session.add(reservation)
+            record_booking(reservation, lot.id)
             db.session.commit()
+            remove_free_spots(lot.id, spot.id)
             
-            # Invalidate parking lots cache since availability changed
-            cache_delete('parking_lots:all')
-            cache_delete(f'parking_lot:{lot.id}')
+            # Availability changed: adjust the lot's counter, the listing stays cached
+            adjust_availability((lot.id, -1))
             
             # Increment reservation counter
             increment_counter('total_reservations')
-            increment_counter(f'daily_reservations:{datetime.now().strftime("%Y-%m-%d")}')
+            increment_counter(daily_key('reservations'))
             
             return {
                 'msg': 'Reservation created successfully',
@@ -807,24 +879,23 @@ class ReserveSpotResource(Resource):
             return {'msg': 'Access denied. You can only cancel your own reservations.'}, 403
         
         try:
-            # Get the spot and update its status
+            # Get the spot and release it, updating available slots in lot,
+            # unless a newer reservation of the same user holds it now
             spot = ParkingSpot.query.get(reservation.spot_id)
+            released_lot_id = None
+            if spot and not superseding_reservation(reservation):
+                released_lot_id = release_spot(spot.id, reservation.user_id)
             if spot:
-                spot.status = 'available'
-                spot.user_id = None
-                
-                # Update available slots in lot
-                lot = ParkingLot.query.get(spot.lot_id)
-                if lot:
-                    lot.available_slots += 1
+                retract_reservation(reservation, spot.lot_id)
             
             db.session.delete(reservation)
             db.session.commit()
+            if released_lot_id is not None:
+                push_free_spots(released_lot_id, spot.id)
             
-            # Invalidate parking lots cache since availability changed
-            if spot:
-                cache_delete('parking_lots:all')
-                cache_delete(f'parking_lot:{spot.lot_id}')
+            # Availability changed: adjust the lot's counter, the listing stays cached
+            if released_lot_id is not None:
+                adjust_availability((released_lot_id, 1))
             
             # Increment cancellation counter
             increment_counter('reservations_cancelled')
@@ -858,24 +929,31 @@ class UserReservationsResource(Resource):
             return {'msg': 'User not found'}, 404
         
         try:
-            reservations = ReserveSpot.query.filter_by(user_id=user_id).all()
-            # print(f"Found {len(reservations)} reservations")
+            # Reservations with their spot's lot in one query
+            rows = db.session.query(
+                ReserveSpot,
+                ParkingLot.location_name,
+                ParkingLot.address,
+                ParkingLot.price
+            ).outerjoin(
+                ParkingSpot, ReserveSpot.spot_id == ParkingSpot.id
+            ).outerjoin(
+                ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+            ).filter(
+                ReserveSpot.user_id == user_id
+            ).all()
         except Exception as e:
             return {'msg': 'Database error occurred', 'error': str(e)}, 500
         
         reservation_list = []
-        for reservation in reservations:
+        for reservation, location_name, address, price in rows:
             try:
-                # Get spot and lot information
-                spot = ParkingSpot.query.get(reservation.spot_id)
-                lot = ParkingLot.query.get(spot.lot_id) if spot else None
-                
                 reservation_list.append({
                     'id': reservation.id,
                     'spot_id': reservation.spot_id,
-                    'lot_name': lot.location_name if lot else 'Unknown',
-                    'lot_address': lot.address if lot else 'Unknown',
-                    'lot_price': lot.price if lot else 10,  # Include hourly rate
+                    'lot_name': location_name if location_name is not None else 'Unknown',
+                    'lot_address': address if address is not None else 'Unknown',
+                    'lot_price': price if price is not None else 10,  # Include hourly rate
                     'parking_time': reservation.parking_time.isoformat(),
                     'leaving_time': reservation.leaving_time.isoformat() if reservation.leaving_time else None,
                     'parking_cost': reservation.parking_cost,
@@ -895,6 +973,7 @@ class UserReservationsResource(Resource):
 
 class LoginResource(Resource):
     
+    @rate_limit('login')
     def post(self):
         data = request.get_json()
         email = data.get('email')
@@ -927,7 +1006,7 @@ class LoginResource(Resource):
         
         # Increment login counter
         increment_counter('total_logins')
-        increment_counter(f'daily_logins:{datetime.now().strftime("%Y-%m-%d")}')
+        increment_counter(daily_key('logins'))
         
         return {
             'msg': 'Login successful',
@@ -1022,7 +1101,7 @@ class RegisterResource(Resource):
             
             # Increment registration counter
             increment_counter('total_registrations')
-            increment_counter(f'daily_registrations:{datetime.now().strftime("%Y-%m-%d")}')
+            increment_counter(daily_key('registrations'))
             
             # Invalidate users cache
             cache_delete('users:all')
@@ -1073,6 +1152,7 @@ class LogoutResource(Resource):
 class BookingResource(Resource):
     
     @jwt_required()
+    @rate_limit('booking_{action}')
     def post(self, action):
         """Handle parking spot booking operations"""
         current_user_id = int(get_jwt_identity())
@@ -1112,16 +1192,14 @@ class BookingResource(Resource):
         if active_reservation:
             return {'msg': 'You already have an active parking reservation'}, 400
         
-        # Find first available spot
-        available_spot = ParkingSpot.query.filter_by(
-            lot_id=lot_id,
-            status='available'
-        ).first()
-        
-        if not available_spot:
-            return {'msg': 'No available parking spots in this lot'}, 400
-        
+        spot_id = None
         try:
+            # Atomically claim a free spot (user immediately starts parking)
+            spot_id = claim_free_spot(lot.id, user.id, status='occupied')
+            if spot_id is None:
+                db.session.rollback()
+                return {'msg': 'No available parking spots in this lot'}, 400
+            
             # Create reservation with current time as parking time
             now = datetime.now()
             # Set leaving_time to None (unlimited until manual release)
@@ -1132,39 +1210,27 @@ class BookingResource(Resource):
             
             # Create reservation
             reservation = ReserveSpot(
-                spot_id=available_spot.id,
+                spot_id=spot_id,
                 user_id=user.id,
                 parking_time=now,
                 leaving_time=leaving_time,
                 parking_cost=parking_cost
             )
             
-            # Update spot status to occupied (user immediately starts parking)
-            available_spot.status = 'occupied'
-            available_spot.user_id = user.id
-            
-            # Update available slots
-            lot.available_slots -= 1
-            
             db.session.add(reservation)
+            record_booking(reservation, lot.id)
+            confirmation = enqueue_email('booking_confirmation', reservation)
             db.session.commit()
             
-            # Invalidate parking lots cache since availability changed
-            cache_delete('parking_lots:all')
-            cache_delete(f'parking_lot:{lot.id}')
+            # Availability changed: adjust the lot's counter, the listing stays cached
+            adjust_availability((lot.id, -1))
             
             # Increment reservation counter
             increment_counter('total_reservations')
-            increment_counter(f'daily_reservations:{datetime.now().strftime("%Y-%m-%d")}')
+            increment_counter(daily_key('reservations'))
             
-            # Send booking confirmation email synchronously (for immediate delivery)
-            try:
-                from tasks import send_booking_confirmation_email
-                # Call directly instead of using .delay() for immediate email sending
-                result = send_booking_confirmation_email(reservation.id)
-                print(f"✅ Booking confirmation email sent: {result}")
-            except Exception as email_error:
-                print(f"⚠️ Failed to send booking confirmation email: {email_error}")
+            # Booking confirmation is delivered by a Celery worker from the email outbox
+            dispatch_email(confirmation.id)
             
             return {
                 'msg': 'Parking spot booked successfully',
@@ -1181,6 +1247,9 @@ class BookingResource(Resource):
             
         except Exception as e:
             db.session.rollback()
+            # The claim was rolled back, so hand the spot back to the pool
+            if spot_id is not None:
+                push_free_spots(lot.id, spot_id)
             print(f"Booking error: {str(e)}")  # Add debug logging
             return {'msg': 'Error booking parking spot', 'error': str(e)}, 500
     
@@ -1202,10 +1271,19 @@ class BookingResource(Resource):
             # Get the parking spot
             spot = ParkingSpot.query.get(reservation.spot_id)
             if spot:
+                # Only the reservation currently holding the spot can park in it
+                if (spot.status == 'available' or spot.user_id != reservation.user_id
+                        or superseding_reservation(reservation)):
+                    return {'msg': 'Parking spot is not held by this reservation'}, 409
+                
                 spot.status = 'occupied'
                 
-                # Update parking time to current time (actual parking time)
+                # Update parking time to current time (actual parking time); a
+                # pre-booked leaving time is replaced by the actual one on release
+                retract_reservation(reservation, spot.lot_id)
                 reservation.parking_time = datetime.now()
+                reservation.leaving_time = None
+                record_booking(reservation, spot.lot_id)
                 
                 db.session.commit()
                 
@@ -1241,12 +1319,22 @@ class BookingResource(Resource):
         if reservation.user_id != user.id:
             return {'msg': 'Access denied - not your reservation'}, 403
         
+        if reservation.leaving_time is not None:
+            return {'msg': 'Reservation already completed'}, 400
+        
         try:
             # Get the parking spot and lot
             spot = ParkingSpot.query.get(reservation.spot_id)
             lot = ParkingLot.query.get(spot.lot_id) if spot else None
             
             if spot and lot:
+                # Release the spot and update available slots in the database;
+                # only a spot still held by this reservation's user is freed
+                released_lot_id = release_spot(spot.id, reservation.user_id)
+                if released_lot_id is None:
+                    db.session.rollback()
+                    return {'msg': 'Parking spot is not held by this reservation'}, 409
+                
                 # Update leaving time to current time (actual leaving time)
                 now = datetime.now()
                 reservation.leaving_time = now
@@ -1280,27 +1368,17 @@ class BookingResource(Resource):
                     }
                     reservation.payment_method = method_mapping.get(payment_method, payment_method)
                 
-                # Release the spot
-                spot.status = 'available'
-                spot.user_id = None
-                
-                # Update available slots
-                lot.available_slots += 1
+                record_completion(reservation, lot.id)
+                receipt = enqueue_email('parking_release', reservation)
                 
                 db.session.commit()
                 
-                # Invalidate parking lots cache since availability changed
-                cache_delete('parking_lots:all')
-                cache_delete(f'parking_lot:{lot.id}')
+                # Availability changed: return the spot to the pool and adjust the lot's counter
+                push_free_spots(released_lot_id, spot.id)
+                adjust_availability((released_lot_id, 1))
                 
-                # Send parking release receipt email synchronously (for immediate delivery)
-                try:
-                    from tasks import send_parking_release_email
-                    # Call directly instead of using .delay() for immediate email sending
-                    result = send_parking_release_email(reservation.id)
-                    print(f"✅ Parking release email sent: {result}")
-                except Exception as email_error:
-                    print(f"⚠️ Failed to send parking release email: {email_error}")
+                # Release receipt is delivered by a Celery worker from the email outbox
+                dispatch_email(receipt.id)
                 
                 return {
                     'msg': 'Parking spot released successfully',
@@ -1326,6 +1404,20 @@ class BookingResource(Resource):
             return {'msg': 'Error releasing parking spot', 'error': str(e)}, 500
 
 
+def recent_month_starts(count, now=None):
+    """First day of the last `count` calendar months, oldest first"""
+    now = now or datetime.now()
+    year, month = now.year, now.month
+    months = []
+    for _ in range(count):
+        months.append(datetime(year, month, 1))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    months.reverse()
+    return months
+
+
 class ReportsResource(Resource):
     @jwt_required()
     def get(self):
@@ -1337,25 +1429,29 @@ class ReportsResource(Resource):
             return {'msg': 'Access denied. Admin only.'}, 403
         
         try:
-            # Get parking lot statistics
-            lots = ParkingLot.query.all()
-            lot_stats = []
+            month_rollup = LotActivityRollup.granularity == 'month'
+            
+            # Reservation count and revenue per lot from the monthly rollups
+            lot_totals = db.session.query(
+                LotActivityRollup.lot_id.label('lot_id'),
+                db.func.sum(LotActivityRollup.bookings).label('bookings'),
+                db.func.sum(LotActivityRollup.revenue).label('revenue')
+            ).filter(month_rollup).group_by(LotActivityRollup.lot_id).subquery()
+            
+            # Parking lot statistics
+            lot_rows = db.session.query(
+                ParkingLot,
+                db.func.coalesce(lot_totals.c.bookings, 0),
+                db.func.coalesce(lot_totals.c.revenue, 0)
+            ).outerjoin(
+                lot_totals, lot_totals.c.lot_id == ParkingLot.id
+            ).order_by(ParkingLot.id).all()
             
-            for lot in lots:
+            lot_stats = []
+            for lot, lot_reservations, lot_revenue in lot_rows:
                 total_spots = lot.number_of_slots
                 occupied_spots = total_spots - lot.available_slots
                 
-                # Get reservations for this lot
-                lot_reservations = db.session.query(ReserveSpot).join(ParkingSpot).filter(
-                    ParkingSpot.lot_id == lot.id
-                ).count()
-                
-                # Calculate revenue for this lot
-                lot_revenue = db.session.query(db.func.sum(ReserveSpot.parking_cost)).join(ParkingSpot).filter(
-                    ParkingSpot.lot_id == lot.id,
-                    ReserveSpot.leaving_time.isnot(None)  # Only completed reservations
-                ).scalar() or 0
-                
                 lot_stats.append({
                     'id': lot.id,
                     'location_name': lot.location_name,
@@ -1363,112 +1459,104 @@ class ReportsResource(Resource):
                     'occupied_spots': occupied_spots,
                     'available_spots': lot.available_slots,
                     'occupancy_rate': round((occupied_spots / total_spots) * 100, 2) if total_spots > 0 else 0,
-                    'total_reservations': lot_reservations,
+                    'total_reservations': int(lot_reservations),
                     'total_revenue': round(float(lot_revenue), 2)
                 })
             
             # Get user statistics
-            total_users = User.query.count()
-            admin_users = User.query.filter_by(role='admin').count()
-            regular_users = User.query.filter_by(role='user').count()
-            
-            # Get reservation statistics
-            total_reservations = ReserveSpot.query.count()
-            active_reservations = ReserveSpot.query.filter_by(leaving_time=None).count()
-            completed_reservations = ReserveSpot.query.filter(ReserveSpot.leaving_time.isnot(None)).count()
-            
-            # Calculate total revenue
-            total_revenue = db.session.query(db.func.sum(ReserveSpot.parking_cost)).filter(
-                ReserveSpot.leaving_time.isnot(None)
-            ).scalar() or 0
+            total_users, admin_users, regular_users = db.session.query(
+                db.func.count(User.id),
+                db.func.coalesce(db.func.sum(db.case((User.role == 'admin', 1), else_=0)), 0),
+                db.func.coalesce(db.func.sum(db.case((User.role == 'user', 1), else_=0)), 0)
+            ).one()
+            
+            # Get reservation statistics and total revenue
+            total_reservations, completed_reservations, total_revenue = db.session.query(
+                db.func.coalesce(db.func.sum(LotActivityRollup.bookings), 0),
+                db.func.coalesce(db.func.sum(LotActivityRollup.completed_sessions), 0),
+                db.func.coalesce(db.func.sum(LotActivityRollup.revenue), 0)
+            ).filter(month_rollup).one()
+            active_reservations = total_reservations - completed_reservations
+            
+            # Monthly reservation and revenue trends (last 12 calendar months)
+            month_starts = recent_month_starts(12)
+            monthly_rows = db.session.query(
+                LotActivityRollup.period_start,
+                db.func.sum(LotActivityRollup.bookings),
+                db.func.sum(LotActivityRollup.revenue)
+            ).filter(
+                month_rollup,
+                LotActivityRollup.period_start >= month_starts[0]
+            ).group_by(LotActivityRollup.period_start).all()
+            monthly_totals = {start: (count, revenue) for start, count, revenue in monthly_rows}
             
-            # Get monthly reservation trends (last 12 months)
             monthly_trends = []
-            for i in range(12):
-                month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-                month_end = month_start + timedelta(days=30)
-                
-                month_reservations = ReserveSpot.query.filter(
-                    ReserveSpot.parking_time >= month_start,
-                    ReserveSpot.parking_time < month_end
-                ).count()
-                
+            monthly_revenue = []
+            for month_start in month_starts:  # Oldest to newest
+                count, revenue = monthly_totals.get(month_start, (0, 0))
                 monthly_trends.append({
                     'month': month_start.strftime('%B %Y'),
-                    'reservations': month_reservations
+                    'reservations': int(count)
+                })
+                monthly_revenue.append({
+                    'month': month_start.strftime('%B %Y'),
+                    'revenue': round(float(revenue), 2)
                 })
-            
-            monthly_trends.reverse()  # Show oldest to newest
             
             # Daily revenue trends (last 30 days)
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            first_day = today - timedelta(days=29)
+            daily_totals = dict(db.session.query(
+                LotActivityRollup.period_start,
+                db.func.sum(LotActivityRollup.revenue)
+            ).filter(
+                LotActivityRollup.granularity == 'day',
+                LotActivityRollup.period_start >= first_day
+            ).group_by(LotActivityRollup.period_start).all())
+            
             daily_revenue = []
-            for i in range(30):
-                day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=i)
-                day_end = day_start + timedelta(days=1)
-                
-                day_revenue = db.session.query(db.func.sum(ReserveSpot.parking_cost)).filter(
-                    ReserveSpot.parking_time >= day_start,
-                    ReserveSpot.parking_time < day_end,
-                    ReserveSpot.leaving_time.isnot(None)
-                ).scalar() or 0
-                
+            for i in range(30):  # Oldest to newest
+                day = first_day + timedelta(days=i)
                 daily_revenue.append({
-                    'date': day_start.strftime('%Y-%m-%d'),
-                    'revenue': round(float(day_revenue), 2)
+                    'date': day.strftime('%Y-%m-%d'),
+                    'revenue': round(float(daily_totals.get(day) or 0), 2)
                 })
             
-            daily_revenue.reverse()  # Show oldest to newest
-            
-            # Monthly revenue trends (last 12 months)
-            monthly_revenue = []
-            for i in range(12):
-                month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-                month_end = month_start + timedelta(days=30)
-                
-                month_revenue_amount = db.session.query(db.func.sum(ReserveSpot.parking_cost)).filter(
-                    ReserveSpot.parking_time >= month_start,
-                    ReserveSpot.parking_time < month_end,
-                    ReserveSpot.leaving_time.isnot(None)
-                ).scalar() or 0
-                
-                monthly_revenue.append({
-                    'month': month_start.strftime('%B %Y'),
-                    'revenue': round(float(month_revenue_amount), 2)
-                })
-            
-            monthly_revenue.reverse()  # Show oldest to newest
-            
             # Payment method distribution
             payment_methods = db.session.query(
-                ReserveSpot.payment_method,
-                db.func.count(ReserveSpot.payment_method)
+                PaymentMethodRollup.payment_method,
+                db.func.sum(PaymentMethodRollup.sessions)
             ).filter(
-                ReserveSpot.payment_method.isnot(None)
-            ).group_by(ReserveSpot.payment_method).all()
+                PaymentMethodRollup.granularity == 'month'
+            ).group_by(PaymentMethodRollup.payment_method).having(
+                db.func.sum(PaymentMethodRollup.sessions) > 0
+            ).all()
             
             payment_distribution = [
-                {'method': method, 'count': count} for method, count in payment_methods
+                {'method': method, 'count': int(count)} for method, count in payment_methods
             ]
             
+
             # Get Redis analytics
             redis_stats = {}
             redis_client = get_redis_client()
             if redis_client:
                 try:
+                    snapshot = read_counters(redis_client)
                     redis_stats = {
-                        'total_api_calls': int(redis_client.get('api_calls:users:get') or 0) + int(redis_client.get('api_calls:parking_lots:get') or 0),
-                        'total_logins': int(redis_client.get('total_logins') or 0),
-                        'total_logouts': int(redis_client.get('total_logouts') or 0),
-                        'total_registrations': int(redis_client.get('total_registrations') or 0),
-                        'active_users_count': redis_client.scard('active_users'),
-                        'users_created': int(redis_client.get('users_created') or 0),
-                        'users_deleted': int(redis_client.get('users_deleted') or 0),
-                        'parking_lots_created': int(redis_client.get('parking_lots_created') or 0),
-                        'parking_lots_deleted': int(redis_client.get('parking_lots_deleted') or 0),
-                        'reservations_cancelled': int(redis_client.get('reservations_cancelled') or 0),
-                        'today_logins': int(redis_client.get(f'daily_logins:{datetime.now().strftime("%Y-%m-%d")}') or 0),
-                        'today_registrations': int(redis_client.get(f'daily_registrations:{datetime.now().strftime("%Y-%m-%d")}') or 0),
-                        'today_reservations': int(redis_client.get(f'daily_reservations:{datetime.now().strftime("%Y-%m-%d")}') or 0)
+                        'total_api_calls': snapshot['api_calls:users:get'] + snapshot['api_calls:parking_lots:get'],
+                        'total_logins': snapshot['total_logins'],
+                        'total_logouts': snapshot['total_logouts'],
+                        'total_registrations': snapshot['total_registrations'],
+                        'active_users_count': snapshot.active_users,
+                        'users_created': snapshot['users_created'],
+                        'users_deleted': snapshot['users_deleted'],
+                        'parking_lots_created': snapshot['parking_lots_created'],
+                        'parking_lots_deleted': snapshot['parking_lots_deleted'],
+                        'reservations_cancelled': snapshot['reservations_cancelled'],
+                        'today_logins': snapshot.daily['logins'],
+                        'today_registrations': snapshot.daily['registrations'],
+                        'today_reservations': snapshot.daily['reservations']
                     }
                 except Exception as e:
                     print(f"Error getting Redis stats: {e}")
@@ -1519,8 +1607,11 @@ class UserReportsResource(Resource):
             return {'msg': 'User not found'}, 404
         
         try:
-            # Get user's reservation statistics
-            user_reservations = ReserveSpot.query.filter_by(user_id=current_user_id).all()
+            # Get user's reservation statistics, hot and archived
+            history = reservation_history.c
+            user_reservations = db.session.query(
+                history.parking_time, history.leaving_time, history.parking_cost
+            ).filter(history.user_id == current_user_id).all()
             
             if not user_reservations:
                 # Return empty data structure if no reservations
@@ -1561,18 +1652,16 @@ class UserReportsResource(Resource):
             avg_hours_per_booking = total_hours / total_bookings if total_bookings > 0 else 0
             
             # Find favorite location
-            location_counts = {}
-            for res in user_reservations:
-                try:
-                    # Get the parking spot and lot information
-                    spot = ParkingSpot.query.get(res.spot_id)
-                    if spot:
-                        lot = ParkingLot.query.get(spot.lot_id)
-                        if lot:
-                            loc_name = lot.location_name
-                            location_counts[loc_name] = location_counts.get(loc_name, 0) + 1
-                except Exception as e:
-                    continue
+            location_counts = dict(db.session.query(
+                ParkingLot.location_name,
+                db.func.count(history.id)
+            ).select_from(reservation_history).join(
+                ParkingLot, history.lot_id == ParkingLot.id
+            ).filter(
+                history.user_id == current_user_id
+            ).group_by(
+                ParkingLot.location_name
+            ).all())
             
             favorite_location = max(location_counts.items(), key=lambda x: x[1]) if location_counts else ('N/A', 0)
             
@@ -1687,58 +1776,84 @@ class UserBookingHistoryResource(Resource):
         if not current_user:
             return {'msg': 'User not found'}, 404
         
+        # Keyset pagination: ?limit=<page size>&cursor=<next_cursor of the previous page>
+        max_page_size = current_app.config.get('BOOKING_HISTORY_MAX_PAGE_SIZE', 500)
+        page_size = request.args.get('limit', type=int) or current_app.config.get('BOOKING_HISTORY_PAGE_SIZE', 50)
+        page_size = max(1, min(page_size, max_page_size))
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                cursor_time, cursor_id = cursor.rsplit('|', 1)
+                cursor_time, cursor_id = datetime.fromisoformat(cursor_time), int(cursor_id)
+            except ValueError:
+                return {'msg': 'Invalid cursor'}, 400
+        
         try:
-            # Get user's reservation history
-            user_reservations = ReserveSpot.query.filter_by(user_id=current_user_id).order_by(ReserveSpot.parking_time.desc()).all()
+            # Get a page of the user's reservation history, hot and archived, with the lot in one query
+            history = reservation_history.c
+            query = db.session.query(
+                history.id,
+                history.parking_time,
+                history.leaving_time,
+                history.parking_cost,
+                history.spot_id,
+                ParkingLot.location_name
+            ).select_from(reservation_history).outerjoin(
+                ParkingLot, history.lot_id == ParkingLot.id
+            ).filter(
+                history.user_id == current_user_id
+            )
+            
+            if cursor:
+                query = query.filter(db.or_(
+                    history.parking_time < cursor_time,
+                    db.and_(history.parking_time == cursor_time, history.id < cursor_id)
+                ))
+            
+            rows = query.order_by(
+                history.parking_time.desc(), history.id.desc()
+            ).limit(page_size + 1).all()
+            
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
             
             booking_history = []
-            for res in user_reservations:
-                try:
-                    # Get the parking spot and lot information
-                    spot = ParkingSpot.query.get(res.spot_id)
-                    lot = None
-                    if spot:
-                        lot = ParkingLot.query.get(spot.lot_id)
-                    
-                    # Calculate duration if available
-                    duration_hours = None
-                    if res.leaving_time and res.parking_time:
-                        duration = res.leaving_time - res.parking_time
-                        duration_hours = round(duration.total_seconds() / 3600, 2)
-                    
-                    booking_data = {
-                        'id': res.id,
-                        'start_time': res.parking_time.isoformat() if res.parking_time else None,
-                        'end_time': res.leaving_time.isoformat() if res.leaving_time else None,
-                        'duration_hours': duration_hours,
-                        'total_amount': float(res.parking_cost) if res.parking_cost else 0,
-                        'status': 'Completed' if res.leaving_time else 'Active',
-                        'vehicle_number': current_user.vehicle_number,
-                        'parking_space': {
-                            'id': spot.id if spot else None,
-                            'name': f"{lot.location_name} - Spot {spot.id}" if lot and spot else 'Unknown Location'
-                        } if spot else {'id': None, 'name': 'Unknown Location'}
+            for res in rows:
+                # Calculate duration if available
+                duration_hours = None
+                if res.leaving_time and res.parking_time:
+                    duration = res.leaving_time - res.parking_time
+                    duration_hours = round(duration.total_seconds() / 3600, 2)
+                
+                booking_history.append({
+                    'id': res.id,
+                    'start_time': res.parking_time.isoformat() if res.parking_time else None,
+                    'end_time': res.leaving_time.isoformat() if res.leaving_time else None,
+                    'duration_hours': duration_hours,
+                    'total_amount': float(res.parking_cost) if res.parking_cost else 0,
+                    'status': 'Completed' if res.leaving_time else 'Active',
+                    'vehicle_number': current_user.vehicle_number,
+                    'parking_space': {
+                        'id': res.spot_id,
+                        'name': f"{res.location_name} - Spot {res.spot_id}" if res.location_name else 'Unknown Location'
                     }
-                    
-                    booking_history.append(booking_data)
-                    
-                except Exception as e:
-                    # Add basic reservation info even if there's an error with details
-                    booking_history.append({
-                        'id': res.id,
-                        'start_time': res.parking_time.isoformat() if res.parking_time else None,
-                        'end_time': res.leaving_time.isoformat() if res.leaving_time else None,
-                        'duration_hours': None,
-                        'total_amount': float(res.parking_cost) if res.parking_cost else 0,
-                        'status': 'Completed' if res.leaving_time else 'Active',
-                        'vehicle_number': current_user.vehicle_number,
-                        'parking_space': {'id': None, 'name': 'Unknown Location'}
-                    })
+                })
+            
+            next_cursor = None
+            if has_more:
+                last = rows[-1]
+                next_cursor = f"{last.parking_time.isoformat()}|{last.id}"
             
             return {
                 'status': 'success',
                 'msg': 'Booking history retrieved successfully',
-                'data': booking_history
+                'data': booking_history,
+                'pagination': {
+                    'limit': page_size,
+                    'has_more': has_more,
+                    'next_cursor': next_cursor
+                }
             }, 200
             
         except Exception as e:
@@ -1871,8 +1986,18 @@ class TasksResource(Resource):
             return {'msg': 'Failed to get task status', 'error': str(e)}, 500
 
 
+# Columns of the parking-details export, in CSV order
+PARKING_DETAILS_FIELDS = [
+    'reservation_id', 'user_name', 'user_email', 'vehicle_number', 'parking_lot', 'spot_number',
+    'parking_time', 'leaving_time', 'parking_cost', 'transaction_id', 'payment_method', 'status'
+]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
 class ExportResource(Resource):
     @jwt_required()
+    @rate_limit('export')
     def get(self, export_type):
         try:
             current_user_id = int(get_jwt_identity())
@@ -1886,66 +2011,21 @@ class ExportResource(Resource):
             return {'msg': 'Authentication error', 'error': str(e)}, 401
         
         try:
-            if export_type == 'parking-details':                
-                # Alternative approach: Get reservations and fetch related data separately
+            if export_type == 'parking-details':
+                # Optional filters: ?start=<ISO date>&end=<ISO date>&lot_id=<id>
                 try:
-                    # First, try the join approach
-                    reservations = db.session.query(
-                        ReserveSpot,
-                        User.username,
-                        User.email,
-                        User.vehicle_number,
-                        ParkingLot.location_name,
-                        ParkingSpot.id.label('spot_number')
-                    ).join(
-                        User, ReserveSpot.user_id == User.id
-                    ).join(
-                        ParkingSpot, ReserveSpot.spot_id == ParkingSpot.id
-                    ).join(
-                        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
-                    ).all()
-                    
-                except Exception as join_error:
-                    # Fallback: Get data separately
-                    all_reservations = ReserveSpot.query.all()
-                    reservations = []
-                    
-                    for reservation in all_reservations:
-                        try:
-                            user = User.query.get(reservation.user_id)
-                            spot = ParkingSpot.query.get(reservation.spot_id)
-                            lot = ParkingLot.query.get(spot.lot_id) if spot else None
-                            
-                            reservations.append((
-                                reservation,
-                                user.username if user else 'Unknown',
-                                user.email if user else 'Unknown',
-                                user.vehicle_number if user else None,
-                                lot.location_name if lot else 'Unknown',
-                                spot.id if spot else 'Unknown'
-                            ))
-                        except Exception as e:
-                            continue
-                    
-                export_data = []
-                for reservation, username, email, vehicle_number, location_name, spot_number in reservations:
-                    try:
-                        export_data.append({
-                            'reservation_id': reservation.id,
-                            'user_name': username,
-                            'user_email': email,
-                            'vehicle_number': vehicle_number or 'N/A',
-                            'parking_lot': location_name,
-                            'spot_number': spot_number,
-                            'parking_time': reservation.parking_time.isoformat() if reservation.parking_time else None,
-                            'leaving_time': reservation.leaving_time.isoformat() if reservation.leaving_time else 'Active',
-                            'parking_cost': float(reservation.parking_cost) if reservation.parking_cost else 0,
-                            'transaction_id': reservation.transaction_id or 'N/A',
-                            'payment_method': reservation.payment_method or 'N/A',
-                            'status': 'Completed' if reservation.leaving_time else 'Active'
-                        })
-                    except Exception as e:
-                        continue
+                    filters = self._parking_details_filters(request.args)
+                except ValueError:
+                    return {'msg': 'Invalid filter. Use ISO dates for start/end and a numeric lot_id'}, 400
+                
+                # ?format=csv or ?format=ndjson streams rows instead of building one JSON document
+                export_format = request.args.get('format', 'json')
+                if export_format in ('csv', 'ndjson'):
+                    return self._stream_parking_details(filters, export_format)
+                if export_format != 'json':
+                    return {'msg': 'Invalid format. Use json, csv or ndjson'}, 400
+                
+                export_data = [self._parking_details_row(row) for row in self._parking_details_query(filters)]
 
                 return {
                     'msg': 'Parking details export data generated',
@@ -1955,26 +2035,21 @@ class ExportResource(Resource):
                 
             elif export_type == 'monthly-report':
                 # Generate monthly summary
-                current_month = datetime.now().replace(day=1)
-                next_month = current_month + timedelta(days=32)
-                next_month = next_month.replace(day=1)
+                current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
                 
-                month_reservations = ReserveSpot.query.filter(
-                    ReserveSpot.parking_time >= current_month,
-                    ReserveSpot.parking_time < next_month
-                ).count()
-                
-                month_revenue = db.session.query(db.func.sum(ReserveSpot.parking_cost)).filter(
-                    ReserveSpot.parking_time >= current_month,
-                    ReserveSpot.parking_time < next_month,
-                    ReserveSpot.leaving_time.isnot(None)
-                ).scalar() or 0
+                month_reservations, month_revenue = db.session.query(
+                    db.func.coalesce(db.func.sum(LotActivityRollup.bookings), 0),
+                    db.func.coalesce(db.func.sum(LotActivityRollup.revenue), 0)
+                ).filter(
+                    LotActivityRollup.granularity == 'month',
+                    LotActivityRollup.period_start == current_month
+                ).one()
                 
                 return {
                     'msg': 'Monthly report generated',
                     'data': {
                         'month': current_month.strftime('%B %Y'),
-                        'total_reservations': month_reservations,
+                        'total_reservations': int(month_reservations),
                         'total_revenue': round(float(month_revenue), 2),
                         'report_generated_at': datetime.now().isoformat()
                     }
@@ -1987,3 +2062,84 @@ class ExportResource(Resource):
             import traceback
             traceback.print_exc()  # Print full stack trace
             return {'msg': 'Error generating export data', 'error': str(e)}, 500
+    
+    @staticmethod
+    def _parking_details_filters(args):
+        """Build parking-details filters from query arguments; raises ValueError on bad input"""
+        history = reservation_history.c
+        filters = []
+        if args.get('start'):
+            filters.append(history.parking_time >= datetime.fromisoformat(args['start']))
+        if args.get('end'):
+            filters.append(history.parking_time < datetime.fromisoformat(args['end']))
+        if args.get('lot_id'):
+            filters.append(history.lot_id == int(args['lot_id']))
+        return filters
+    
+    @staticmethod
+    def _parking_details_query(filters):
+        """Hot and archived reservations joined to user and lot, fetched in batches"""
+        history = reservation_history.c
+        return db.session.query(
+            history.id,
+            history.parking_time,
+            history.leaving_time,
+            history.parking_cost,
+            history.transaction_id,
+            history.payment_method,
+            User.username,
+            User.email,
+            User.vehicle_number,
+            ParkingLot.location_name,
+            history.spot_id.label('spot_number')
+        ).select_from(reservation_history).outerjoin(
+            User, history.user_id == User.id
+        ).outerjoin(
+            ParkingLot, history.lot_id == ParkingLot.id
+        ).filter(*filters).order_by(history.id).yield_per(EXPORT_BATCH_SIZE)
+    
+    @staticmethod
+    def _parking_details_row(row):
+        return {
+            'reservation_id': row.id,
+            'user_name': row.username or 'Unknown',
+            'user_email': row.email or 'Unknown',
+            'vehicle_number': row.vehicle_number or 'N/A',
+            'parking_lot': row.location_name or 'Unknown',
+            'spot_number': row.spot_number if row.spot_number is not None else 'Unknown',
+            'parking_time': row.parking_time.isoformat() if row.parking_time else None,
+            'leaving_time': row.leaving_time.isoformat() if row.leaving_time else 'Active',
+            'parking_cost': float(row.parking_cost) if row.parking_cost else 0,
+            'transaction_id': row.transaction_id or 'N/A',
+            'payment_method': row.payment_method or 'N/A',
+            'status': 'Completed' if row.leaving_time else 'Active'
+        }
+    
+    def _stream_parking_details(self, filters, export_format):
+        """Stream the parking-details export as CSV or newline-delimited JSON"""
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if export_format == 'csv':
+                writer.writerow(PARKING_DETAILS_FIELDS)
+            
+            for row in self._parking_details_query(filters):
+                record = self._parking_details_row(row)
+                if export_format == 'csv':
+                    writer.writerow([record[field] for field in PARKING_DETAILS_FIELDS])
+                else:
+                    buffer.write(json.dumps(record) + '\n')
+                
+                if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+            
+            yield buffer.getvalue()
+        
+        filename = f"parking-details-{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
@@ -0,0 +1,75 @@
+"""
+Application counter snapshots.
+
+The dashboards read a declared set of counter keys. read_counters() fetches
+all of them with one MGET, together with the active user count, key counts
+and (optionally) INFO, in a single pipelined round trip, and returns a
+CounterSnapshot of ints instead of one GET per number.
+"""
+from datetime import datetime
+from keyspace import queue_count_keys, TRACKED_NAMESPACES
+
+COUNTERS = (
+    'total_api_calls', 'total_logins', 'total_logouts', 'total_registrations',
+    'users_created', 'users_deleted', 'parking_lots_created', 'parking_lots_deleted',
+    'total_reservations', 'reservations_cancelled', 'emails_sent_total',
+    'api_calls:users:get', 'api_calls:parking_lots:get',
+)
+# Counted per day as daily_<name>:<YYYY-MM-DD>
+DAILY_COUNTERS = ('logins', 'registrations', 'reservations')
+RESPONSE_CODES = ('200', '201', '400', '401', '403', '404', '500')
+# Keyspace registries whose live keys are counted
+KEY_COUNT_NAMESPACES = TRACKED_NAMESPACES
+
+
+def daily_key(name, day=None):
+    return f'daily_{name}:{(day or datetime.now()).strftime("%Y-%m-%d")}'
+
+
+class CounterSnapshot:
+    def __init__(self, counters, daily, response_codes, active_users, total_keys=None, key_counts=None, info=None):
+        self.counters = counters
+        self.daily = daily
+        self.response_codes = response_codes
+        self.active_users = active_users
+        self.total_keys = total_keys
+        self.key_counts = key_counts or {}
+        self.info = info or {}
+
+    def __getitem__(self, name):
+        return self.counters[name]
+
+
+def read_counters(redis_client, include_info=False, include_key_counts=False):
+    """Read every declared counter in one round trip"""
+    day = datetime.now()
+    keys = list(COUNTERS)
+    keys += [daily_key(name, day) for name in DAILY_COUNTERS]
+    keys += [f'response_codes:{code}' for code in RESPONSE_CODES]
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.mget(keys)
+    pipe.scard('active_users')
+    if include_key_counts:
+        pipe.dbsize()
+        queue_count_keys(pipe, *KEY_COUNT_NAMESPACES)
+    if include_info:
+        pipe.info()
+    results = pipe.execute()
+
+    values = [int(value or 0) for value in results[0]]
+    counters = dict(zip(COUNTERS, values))
+    daily = dict(zip(DAILY_COUNTERS, values[len(COUNTERS):]))
+    response_codes = dict(zip(RESPONSE_CODES, values[len(COUNTERS) + len(DAILY_COUNTERS):]))
+
+    total_keys = key_counts = info = None
+    rest = results[2:]
+    if include_key_counts:
+        total_keys = rest[0]
+        counts = rest[1:1 + 2 * len(KEY_COUNT_NAMESPACES)][1::2]
+        key_counts = dict(zip(KEY_COUNT_NAMESPACES, counts))
+        rest = rest[1 + 2 * len(KEY_COUNT_NAMESPACES):]
+    if include_info:
+        info = rest[0]
+
+    return CounterSnapshot(counters, daily, response_codes, results[1], total_keys, key_counts, info)
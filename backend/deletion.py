@@ -0,0 +1,179 @@
+"""
+Set-based cascading deletes for users and parking lots.
+
+Deleting a user or a lot runs a fixed number of UPDATE/DELETE statements,
+however much booking history is attached: spots are released in one guarded
+UPDATE, every affected lot's available_slots is recounted in one grouped
+UPDATE, and the history is removed with one DELETE. With archive=True open
+reservations are first closed in one UPDATE and the history is copied into
+reserve_spot_archive with a single INSERT ... SELECT; otherwise history that
+was already archived is removed as well.
+
+The analytics rollups follow the history in the same transaction, with one
+grouped upsert per rollup table and granularity: sessions closed here are
+counted as completed, and deleted history is taken out, so reports never show
+a booking that no longer exists.
+
+The caller owns the transaction and must commit or roll back.
+"""
+from datetime import datetime
+from sqlalchemy import and_, case, delete, func, literal, or_, select, update
+from models import db, User, ParkingLot, ParkingSpot, ReserveSpot, ReserveSpotArchive, UserMonthlyRollup
+from archive import archive_reservations, reservation_history
+from rollups import record_completions, retract_history, drop_lot_rollups
+
+# Spot statuses that belong to someone and are freed when the booking goes away
+CLAIMED_STATUSES = ('occupied', 'reserved')
+
+
+def _dialect():
+    """Get the SQLAlchemy dialect of the current session"""
+    return db.session.get_bind().dialect
+
+
+def _hours_since(start, now):
+    """SQL expression for the hours from `start` until `now`"""
+    now = literal(now, db.DateTime)
+    if _dialect().name == 'postgresql':
+        return func.extract('epoch', now - start) / 3600
+    return (func.julianday(now) - func.julianday(start)) * 24
+
+
+def close_open_reservations(*conditions):
+    """
+    End open reservations matching `conditions` now, pricing any that have no
+    cost yet. Returns the ids of the closed reservations.
+    """
+    now = datetime.now()
+    lot_price = select(ParkingLot.price).join(
+        ParkingSpot, ParkingSpot.lot_id == ParkingLot.id
+    ).where(ParkingSpot.id == ReserveSpot.spot_id).scalar_subquery()
+    open_reservations = and_(ReserveSpot.leaving_time.is_(None), *conditions)
+    stmt = update(ReserveSpot).where(open_reservations).values(
+        leaving_time=now,
+        parking_cost=case(
+            (ReserveSpot.parking_cost == 0,
+             func.coalesce(_hours_since(ReserveSpot.parking_time, now) * lot_price, 0)),
+            else_=ReserveSpot.parking_cost
+        )
+    )
+
+    if _dialect().update_returning:
+        return db.session.execute(
+            stmt.returning(ReserveSpot.id),
+            execution_options={'synchronize_session': False}
+        ).scalars().all()
+    closed = db.session.execute(select(ReserveSpot.id).where(open_reservations)).scalars().all()
+    db.session.execute(stmt, execution_options={'synchronize_session': False})
+    return closed
+
+
+def recount_available_slots(lot_ids):
+    """Recompute available_slots of the given lots from their spots in one UPDATE"""
+    if not lot_ids:
+        return
+    free_spots = select(func.count(ParkingSpot.id)).where(
+        ParkingSpot.lot_id == ParkingLot.id,
+        ParkingSpot.status == 'available'
+    ).scalar_subquery()
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id.in_(lot_ids))
+        .values(available_slots=free_spots),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def _release_user_spots(user_id):
+    """Free every spot held by the user or by their open reservations; returns [(lot id, spot id)]"""
+    open_spot_ids = select(ReserveSpot.spot_id).where(
+        ReserveSpot.user_id == user_id,
+        ReserveSpot.leaving_time.is_(None)
+    )
+    held = and_(
+        ParkingSpot.status.in_(CLAIMED_STATUSES),
+        or_(ParkingSpot.user_id == user_id, ParkingSpot.id.in_(open_spot_ids))
+    )
+    stmt = update(ParkingSpot).where(held).values(status='available', user_id=None)
+
+    if _dialect().update_returning:
+        released = db.session.execute(
+            stmt.returning(ParkingSpot.lot_id, ParkingSpot.id),
+            execution_options={'synchronize_session': False}
+        ).all()
+    else:
+        released = db.session.execute(select(ParkingSpot.lot_id, ParkingSpot.id).where(held)).all()
+        db.session.execute(stmt, execution_options={'synchronize_session': False})
+
+    # Spots still pointing at the user without being held
+    db.session.execute(
+        update(ParkingSpot).where(ParkingSpot.user_id == user_id).values(user_id=None),
+        execution_options={'synchronize_session': False}
+    )
+    return [(lot_id, spot_id) for lot_id, spot_id in released]
+
+
+def delete_user(user_id, archive=False):
+    """
+    Delete a user with their reservations and monthly rollups. Their spots
+    are released first; with archive=True their open reservations are closed
+    and archived, otherwise their history is taken out of the lot rollups.
+    Returns the released spots as [(lot id, spot id)].
+    """
+    released = _release_user_spots(user_id)
+    recount_available_slots({lot_id for lot_id, _ in released})
+
+    if archive:
+        record_completions(close_open_reservations(ReserveSpot.user_id == user_id))
+        archive_reservations(ReserveSpot.user_id == user_id)
+    else:
+        retract_history(reservation_history.c.user_id == user_id)
+        db.session.execute(
+            delete(ReserveSpotArchive).where(ReserveSpotArchive.user_id == user_id),
+            execution_options={'synchronize_session': False}
+        )
+    db.session.execute(
+        delete(ReserveSpot).where(ReserveSpot.user_id == user_id),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(UserMonthlyRollup).where(UserMonthlyRollup.user_id == user_id),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(User).where(User.id == user_id),
+        execution_options={'synchronize_session': False}
+    )
+    return released
+
+
+def delete_lot(lot_id, archive=False):
+    """
+    Delete a lot with its spots and their reservations. With archive=True
+    open reservations are closed and archived and the lot's rollups are kept,
+    otherwise the rollups are deleted with the history.
+    """
+    lot_spot_ids = select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id)
+    in_lot = ReserveSpot.spot_id.in_(lot_spot_ids)
+
+    if archive:
+        record_completions(close_open_reservations(in_lot))
+        archive_reservations(in_lot)
+    else:
+        db.session.execute(
+            delete(ReserveSpotArchive).where(ReserveSpotArchive.lot_id == lot_id),
+            execution_options={'synchronize_session': False}
+        )
+        drop_lot_rollups(lot_id)
+    db.session.execute(
+        delete(ReserveSpot).where(in_lot),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(ParkingSpot).where(ParkingSpot.lot_id == lot_id),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(ParkingLot).where(ParkingLot.id == lot_id),
+        execution_options={'synchronize_session': False}
+    )
@@ -1,22 +1,30 @@
 """
 Database initialization script for production deployment.
-This script creates all database tables and seeds initial data.
+This script applies all database migrations and seeds initial data.
 """
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from app import app, db
-from models import User
+from app import app, db, upgrade_database
+from models import User, ReserveSpot, LotActivityRollup
+from rollups import rebuild_rollups
 
 def init_database():
     """Initialize the database with tables and seed data."""
     with app.app_context():
         try:
-            # Create all tables
-            db.create_all()
-            print("Database tables created successfully!")
+            # Create or upgrade all tables; databases created before
+            # migrations existed are stamped first so upgrade() only adds
+            # what is missing
+            upgrade_database()
+            print("Database migrations applied successfully!")
+            
+            # Backfill analytics rollups for history recorded before they existed
+            if not LotActivityRollup.query.first() and ReserveSpot.query.first():
+                count = rebuild_rollups()
+                print(f"Analytics rollups rebuilt from {count} reservations.")
 
             # Create admin user if it doesn't exist
             admin = User.query.filter_by(email='admin@mad2.com').first()
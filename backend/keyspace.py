@@ -0,0 +1,89 @@
+"""
+Redis keyspace accounting.
+
+Keys of the namespaces in TRACKED_NAMESPACES, the ones the dashboard counts,
+are registered when written in a sorted set ``keyspace:<namespace>``, scored
+by their expiry time, so live keys are counted with ZCARD instead of walking
+the keyspace with KEYS. Expired registrations are pruned on every write and
+count, so a registry never outgrows its live keys. Bulk clears walk the
+keyspace incrementally with SCAN and delete in batches with UNLINK, so Redis
+never blocks on one huge command.
+"""
+import time
+from fnmatch import fnmatchcase
+
+# Namespaces whose live keys the dashboard counts
+TRACKED_NAMESPACES = ('user_session', 'parking_lot', 'rate_limit')
+SCAN_BATCH_SIZE = 500
+
+
+def registry_key(namespace):
+    return f'keyspace:{namespace}'
+
+
+def _namespace(key):
+    namespace = key.split(':', 1)[0]
+    return namespace if namespace in TRACKED_NAMESPACES else None
+
+
+def register_key(pipe, key, expiry_seconds=None):
+    """Queue registration of a key on a pipeline (no-op for untracked namespaces)"""
+    namespace = _namespace(key)
+    if namespace:
+        now = time.time()
+        expires_at = now + expiry_seconds if expiry_seconds else float('inf')
+        pipe.zremrangebyscore(registry_key(namespace), '-inf', now)
+        pipe.zadd(registry_key(namespace), {key: expires_at})
+
+
+def unregister_key(pipe, *keys):
+    """Queue removal of keys from their registries on a pipeline"""
+    for key in keys:
+        namespace = _namespace(key)
+        if namespace:
+            pipe.zrem(registry_key(namespace), key)
+
+
+def queue_count_keys(pipe, *namespaces):
+    """
+    Queue live key counts of namespaces on a pipeline.
+    Queues two commands per namespace; every second result is a count.
+    """
+    now = time.time()
+    for namespace in namespaces:
+        pipe.zremrangebyscore(registry_key(namespace), '-inf', now)
+        pipe.zcard(registry_key(namespace))
+
+
+def count_keys(redis_client, *namespaces):
+    """
+    Count the live keys of namespaces in one round trip.
+    Expired registrations are pruned on the way, so the cost is bounded by
+    what expired since the last count.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    queue_count_keys(pipe, *namespaces)
+    counts = pipe.execute()[1::2]
+    return dict(zip(namespaces, counts))
+
+
+def scan_unlink(redis_client, patterns, batch_size=SCAN_BATCH_SIZE):
+    """
+    Delete every key matching any of the glob patterns.
+
+    Walks the keyspace once with SCAN and UNLINKs matches page by page,
+    keeping the registries in step. Returns the number of keys deleted.
+    """
+    patterns = list(patterns)
+    deleted = 0
+    cursor = 0
+    while True:
+        cursor, keys = redis_client.scan(cursor=cursor, count=batch_size)
+        matched = [key for key in keys if any(fnmatchcase(key, pattern) for pattern in patterns)]
+        if matched:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.unlink(*matched)
+            unregister_key(pipe, *matched)
+            deleted += pipe.execute()[0]
+        if cursor == 0:
+            return deleted
@@ -0,0 +1,126 @@
+"""
+In-process cache tier.
+
+A small TTL-aware LRU in front of Redis for hot read-mostly keys, so repeat
+reads in a worker are served from memory without a network round trip or
+json.loads. Entries never outlive their Redis TTL and are additionally capped
+at LOCAL_CACHE_TTL seconds.
+
+cache_delete publishes the key on the cache:invalidate channel and every
+worker's subscriber thread evicts it locally. A generation counter stops a
+read that raced with an invalidation from storing the stale value, and if the
+subscription drops the local tier is cleared, so the TTL cap bounds staleness
+even when a message is lost.
+
+Cached values are shared between requests and must not be mutated.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+# Invalidation message that clears every local entry
+INVALIDATE_ALL = '*'
+# Namespaces that are cached locally as well as in Redis
+LOCAL_NAMESPACES = ('parking_lots', 'parking_lot', 'users', 'user')
+
+
+class LocalCache:
+    def __init__(self, redis_client, max_entries=1024, ttl_seconds=5):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires at, value), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pid = None
+
+    @staticmethod
+    def handles(key):
+        return key.split(':', 1)[0] in LOCAL_NAMESPACES
+
+    def _ensure_subscriber(self):
+        # Started lazily so every forked worker gets its own subscription
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.clear()
+            threading.Thread(target=self._listen, name='local-cache-invalidator', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything invalidated while we were not subscribed is unknown
+                self.clear()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        if message['data'] == INVALIDATE_ALL:
+                            self.clear()
+                        else:
+                            self.evict(message['data'])
+            except Exception as e:
+                print(f"Local cache invalidation listener error: {e}")
+                self.clear()
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+    def generation(self):
+        """Snapshot to pass to set() for values read from Redis"""
+        self._ensure_subscriber()
+        return self._generation
+
+    def get(self, key):
+        """Return (found, value)"""
+        self._ensure_subscriber()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value, ttl_seconds=None, generation=None):
+        """Store a value; skipped if an invalidation happened since `generation`"""
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def publish_invalidation(self, pipe, *keys):
+        """Evict keys here and queue their invalidation for other workers on a pipeline"""
+        self.evict(*keys)
+        for key in keys:
+            pipe.publish(INVALIDATION_CHANNEL, key)
+
+    def invalidate_all(self):
+        """Clear the local tier of every worker"""
+        self.clear()
+        self.redis_client.publish(INVALIDATION_CHANNEL, INVALIDATE_ALL)
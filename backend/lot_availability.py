@@ -0,0 +1,173 @@
+"""
+Per-lot availability counters in Redis.
+
+The lot listing is cached as a rarely changing document of lot details
+(parking_lots:all) plus the hash ``parking_lots:available`` of lot id to
+available slots. Bookings and releases adjust one lot's counter with HINCRBY
+after committing, so the listing stays cached under booking churn instead of
+being rebuilt on every change.
+
+The hash is seeded from the database by one worker at a time and expires
+after AVAILABILITY_TTL, which bounds drift from a counter update that was
+lost. Every change bumps ``parking_lots:available_version``; a seed that
+raced with a change is kept only briefly so it is redone from fresh data.
+"""
+from flask import current_app
+from redis.exceptions import LockError
+from models import db, ParkingLot
+
+AVAILABLE_KEY = 'parking_lots:available'
+VERSION_KEY = 'parking_lots:available_version'
+LOCK_KEY = 'parking_lots:available_lock'
+# An empty hash does not exist, so seeding also writes this field
+SEEDED_FIELD = '_seeded'
+AVAILABILITY_TTL = 600
+RACED_SEED_TTL = 2
+SEED_LOCK_TIMEOUT = 5
+
+# KEYS: counters, version; ARGV: lot id, delta
+ADJUST_SCRIPT = """
+redis.call('INCR', KEYS[2])
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return false
+"""
+
+# KEYS: counters, version; ARGV: version read before the snapshot, ttl, raced ttl, lot id/count pairs
+SEED_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], '""" + SEEDED_FIELD + """', 1)
+for i = 4, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+else
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+"""
+
+_scripts = {}
+
+
+def _redis():
+    """Get Redis client from Flask app context"""
+    return getattr(current_app, 'redis_client', None)
+
+
+def _script(redis_client, source):
+    script = _scripts.get((id(redis_client), source))
+    if script is None:
+        script = _scripts[(id(redis_client), source)] = redis_client.register_script(source)
+    return script
+
+
+def _db_availability():
+    return dict(db.session.query(ParkingLot.id, ParkingLot.available_slots).all())
+
+
+def _seed(redis_client, version):
+    """Seed the counters under the seed lock; returns None if another worker holds it"""
+    lock = redis_client.lock(LOCK_KEY, timeout=SEED_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        return None
+    try:
+        availability = _db_availability()
+        args = [version or '0', AVAILABILITY_TTL, RACED_SEED_TTL]
+        for lot_id, available in availability.items():
+            args += [lot_id, available]
+        _script(redis_client, SEED_SCRIPT)(keys=[AVAILABLE_KEY, VERSION_KEY], args=args)
+        return availability
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+
+def lot_availability():
+    """Get {lot id: available slots}, seeding the counters when needed"""
+    redis_client = _redis()
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hgetall(AVAILABLE_KEY)
+            pipe.get(VERSION_KEY)
+            counters, version = pipe.execute()
+            if counters.pop(SEEDED_FIELD, None):
+                return {int(lot_id): int(available) for lot_id, available in counters.items()}
+            availability = _seed(redis_client, version)
+            if availability is not None:
+                return availability
+        except Exception as e:
+            print(f"Redis lot availability error: {e}")
+    # No Redis, or another worker is seeding: read the counters directly
+    return _db_availability()
+
+
+def adjust_availability(*changes):
+    """Apply (lot id, delta) changes to the counters; call after committing"""
+    redis_client = _redis()
+    if not redis_client or not changes:
+        return False
+    try:
+        script = _script(redis_client, ADJUST_SCRIPT)
+        pipe = redis_client.pipeline(transaction=False)
+        for lot_id, delta in changes:
+            script(keys=[AVAILABLE_KEY, VERSION_KEY], args=[lot_id, delta], client=pipe)
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Redis lot availability update error: {e}")
+    return False
+
+
+def set_availability(lot_id, available):
+    """Store a lot's counter outright, e.g. after it was created or edited"""
+    redis_client = _redis()
+    if not redis_client:
+        return False
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incr(VERSION_KEY)
+        pipe.hset(AVAILABLE_KEY, lot_id, available)
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Redis lot availability set error: {e}")
+    return False
+
+
+def remove_availability(lot_id):
+    """Forget a deleted lot's counter"""
+    redis_client = _redis()
+    if not redis_client:
+        return False
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incr(VERSION_KEY)
+        pipe.hdel(AVAILABLE_KEY, lot_id)
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Redis lot availability remove error: {e}")
+    return False
+
+
+def refresh_availability(lot_ids):
+    """Store the database counters of some lots, e.g. after they were recounted"""
+    redis_client = _redis()
+    if not redis_client or not lot_ids:
+        return False
+    try:
+        rows = db.session.query(ParkingLot.id, ParkingLot.available_slots).filter(ParkingLot.id.in_(lot_ids)).all()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incr(VERSION_KEY)
+        for lot_id, available in rows:
+            pipe.hset(AVAILABLE_KEY, lot_id, available)
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Redis lot availability refresh error: {e}")
+    return False
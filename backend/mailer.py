@@ -0,0 +1,191 @@
+"""
+Pooled SMTP delivery.
+
+Each worker process keeps a small pool of persistent SMTP connections, so bulk
+jobs send many messages per connection instead of paying the connect and
+greeting round trips for every email. Idle connections are checked with NOOP
+before reuse and stale ones are replaced transparently.
+"""
+import os
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+SMTP_SERVER = os.environ.get('MAILHOG_SERVER', 'localhost')
+SMTP_PORT = int(os.environ.get('MAILHOG_PORT', 1025))
+SENDER_EMAIL = os.environ.get('SMTP_SENDER', 'no-reply@parkease.com')
+SMTP_TIMEOUT = 30
+
+# Connections kept open per worker process
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+# Idle time after which a pooled connection is checked with NOOP before reuse
+SMTP_IDLE_CHECK = 30
+# Many servers cap messages per session, so recycle connections after this many
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+# Messages built and sent at a time by send_bulk_emails
+BULK_CHUNK_SIZE = 500
+
+
+def build_message(to_email, subject, body, html_body=None, attachment_path=None):
+    """Build a MIME email with a plain text part, optional HTML part and attachment"""
+    # A random boundary up front spares the generator from scanning the whole
+    # body with a freshly compiled regex to pick one for every message
+    msg = MIMEMultipart('alternative', boundary=f'=_{uuid.uuid4().hex}')
+    msg['Subject'] = subject
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = to_email
+
+    msg.attach(MIMEText(body, 'plain'))
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html'))
+
+    if attachment_path and os.path.exists(attachment_path):
+        with open(attachment_path, "rb") as attachment:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(attachment.read())
+            encoders.encode_base64(part)
+            part.add_header(
+                'Content-Disposition',
+                f'attachment; filename= {os.path.basename(attachment_path)}',
+            )
+            msg.attach(part)
+    return msg
+
+
+class _PooledConnection:
+    def __init__(self, server):
+        self.server = server
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of persistent SMTP connections for one worker process"""
+
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, max_size=SMTP_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        return _PooledConnection(smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT))
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.server.quit()
+        except Exception:
+            conn.server.close()
+
+    @staticmethod
+    def _alive(conn):
+        try:
+            return conn.server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Forked worker: never share the parent's sockets
+                    self._idle = []
+                    self._pid = os.getpid()
+                conn = self._idle.pop() if self._idle else None
+
+            if conn is None:
+                return self._connect()
+            if time.monotonic() - conn.last_used < SMTP_IDLE_CHECK or self._alive(conn):
+                return conn
+            self._close(conn)
+
+    def _release(self, conn):
+        conn.last_used = time.monotonic()
+        if conn.sent < SMTP_MAX_MESSAGES_PER_CONNECTION:
+            with self._lock:
+                if self._pid == os.getpid() and len(self._idle) < self.max_size:
+                    self._idle.append(conn)
+                    return
+        self._close(conn)
+
+    def send(self, message):
+        """Send one MIME message, reconnecting once if the connection dropped"""
+        for attempt in range(2):
+            # Retry on a fresh connection: if one pooled session died, its siblings likely did too
+            conn = self._acquire() if attempt == 0 else self._connect()
+            try:
+                conn.server.send_message(message)
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server rejected this message; the session itself is still usable
+                self._release(conn)
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._close(conn)
+                if attempt:
+                    raise
+                continue
+
+            conn.sent += 1
+            self._release(conn)
+            return
+
+    def send_batch(self, messages, connections=None):
+        """
+        Send many MIME messages over at most `connections` parallel connections.
+        Returns a list of booleans telling which messages were sent.
+        """
+        results = [False] * len(messages)
+        if not messages:
+            return results
+        workers = max(1, min(connections or self.max_size, len(messages)))
+
+        def send_share(offset):
+            for index in range(offset, len(messages), workers):
+                try:
+                    self.send(messages[index])
+                    results[index] = True
+                except Exception as e:
+                    print(f"❌ Email to {messages[index]['To']} failed: {e}")
+
+        if workers == 1:
+            send_share(0)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(send_share, range(workers)))
+        return results
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+
+smtp_pool = SMTPConnectionPool()
+
+
+def send_bulk_emails(emails, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Send an iterable of send_simple_email keyword dicts through the pool
+    Messages are built chunk by chunk so large runs stay flat in memory.
+    Returns the number of emails sent.
+    """
+    sent = 0
+    chunk = []
+    for email in emails:
+        chunk.append(build_message(**email))
+        if len(chunk) >= chunk_size:
+            sent += sum(smtp_pool.send_batch(chunk))
+            chunk = []
+    if chunk:
+        sent += sum(smtp_pool.send_batch(chunk))
+    return sent
@@ -0,0 +1,72 @@
+"""baseline schema
+
+Revision ID: 0001_baseline
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('role', sa.String(length=50), nullable=False),
+    sa.Column('password', sa.String(length=200), nullable=False),
+    sa.Column('vehicle_number', sa.String(length=20), nullable=True),
+    sa.Column('phone_number', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('phone_number'),
+    sa.UniqueConstraint('username'),
+    sa.UniqueConstraint('vehicle_number')
+    )
+    op.create_table('parking_lot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('location_name', sa.String(length=100), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('address', sa.String(length=200), nullable=False),
+    sa.Column('pincode', sa.String(length=10), nullable=False),
+    sa.Column('number_of_slots', sa.Integer(), nullable=False),
+    sa.Column('available_slots', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('parking_spot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.ForeignKeyConstraint(['lot_id'], ['parking_lot.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('reserve_spot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('parking_time', sa.DateTime(), nullable=False),
+    sa.Column('leaving_time', sa.DateTime(), nullable=True),
+    sa.Column('parking_cost', sa.Float(), nullable=False),
+    sa.Column('transaction_id', sa.String(length=50), nullable=True),
+    sa.Column('payment_method', sa.String(length=20), nullable=True),
+    sa.ForeignKeyConstraint(['spot_id'], ['parking_spot.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('reserve_spot')
+    op.drop_table('parking_spot')
+    op.drop_table('parking_lot')
+    op.drop_table('user')
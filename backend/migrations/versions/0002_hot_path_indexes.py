@@ -0,0 +1,65 @@
+"""indexes for hot query shapes
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_hot_path_indexes'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial index condition)
+INDEXES = (
+    ('ix_parking_spot_lot_status', 'parking_spot', ['lot_id', 'status'], None),
+    ('ix_parking_spot_free', 'parking_spot', ['lot_id', 'id'], "status = 'available'"),
+    ('ix_parking_spot_user_id', 'parking_spot', ['user_id'], None),
+    ('ix_reserve_spot_user_leaving', 'reserve_spot', ['user_id', 'leaving_time'], None),
+    ('ix_reserve_spot_user_parking', 'reserve_spot', ['user_id', 'parking_time'], None),
+    ('ix_reserve_spot_parking_time', 'reserve_spot', ['parking_time'], None),
+    ('ix_reserve_spot_spot_id', 'reserve_spot', ['spot_id'], None),
+    ('ix_reserve_spot_active', 'reserve_spot', ['user_id', 'spot_id'], 'leaving_time IS NULL'),
+)
+
+
+def _is_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if _is_postgresql():
+        # Build the indexes without blocking writes to the live tables;
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns, where in INDEXES:
+                op.create_index(name, table, columns, unique=False,
+                                postgresql_where=sa.text(where) if where else None,
+                                postgresql_concurrently=True)
+        return
+
+    for table in ('parking_spot', 'reserve_spot'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, index_table, columns, where in INDEXES:
+                if index_table == table:
+                    batch_op.create_index(name, columns, unique=False,
+                                          sqlite_where=sa.text(where) if where else None)
+
+
+def downgrade():
+    if _is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, table, columns, where in reversed(INDEXES):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+        return
+
+    for table in ('reserve_spot', 'parking_spot'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, index_table, columns, where in reversed(INDEXES):
+                if index_table == table:
+                    batch_op.drop_index(name)
@@ -0,0 +1,75 @@
+"""analytics rollup tables
+
+Revision ID: 0003_analytics_rollups
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_analytics_rollups'
+down_revision = '0002_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lot_activity_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('period_start', sa.DateTime(), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('completed_sessions', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('occupied_minutes', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('lot_id', 'granularity', 'period_start', name='uq_lot_activity_rollup_period')
+    )
+    with op.batch_alter_table('lot_activity_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_lot_activity_rollup_period', ['granularity', 'period_start'], unique=False)
+
+    op.create_table('payment_method_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=10), nullable=False),
+    sa.Column('period_start', sa.DateTime(), nullable=False),
+    sa.Column('payment_method', sa.String(length=20), nullable=False),
+    sa.Column('sessions', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('lot_id', 'granularity', 'period_start', 'payment_method', name='uq_payment_method_rollup_period')
+    )
+    with op.batch_alter_table('payment_method_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_method_rollup_period', ['granularity', 'period_start'], unique=False)
+
+    op.create_table('user_monthly_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('month_start', sa.DateTime(), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('completed_sessions', sa.Integer(), nullable=False),
+    sa.Column('spent', sa.Float(), nullable=False),
+    sa.Column('occupied_minutes', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'month_start', 'lot_id', name='uq_user_monthly_rollup_month')
+    )
+    with op.batch_alter_table('user_monthly_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_user_monthly_rollup_month', ['month_start'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_monthly_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_monthly_rollup_month')
+    op.drop_table('user_monthly_rollup')
+
+    with op.batch_alter_table('payment_method_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_method_rollup_period')
+    op.drop_table('payment_method_rollup')
+
+    with op.batch_alter_table('lot_activity_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_lot_activity_rollup_period')
+    op.drop_table('lot_activity_rollup')
@@ -0,0 +1,42 @@
+"""reservation archive
+
+Revision ID: 0005_reserve_spot_archive
+Revises: 0004_email_outbox
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_reserve_spot_archive'
+down_revision = '0004_email_outbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reserve_spot_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('parking_time', sa.DateTime(), nullable=False),
+    sa.Column('leaving_time', sa.DateTime(), nullable=True),
+    sa.Column('parking_cost', sa.Float(), nullable=False),
+    sa.Column('transaction_id', sa.String(length=50), nullable=True),
+    sa.Column('payment_method', sa.String(length=20), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('reserve_spot_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_reserve_spot_archive_user_parking', ['user_id', 'parking_time'], unique=False)
+        batch_op.create_index('ix_reserve_spot_archive_parking_time', ['parking_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reserve_spot_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_reserve_spot_archive_parking_time')
+        batch_op.drop_index('ix_reserve_spot_archive_user_parking')
+    op.drop_table('reserve_spot_archive')
@@ -0,0 +1,112 @@
+"""partition reserve_spot by month on PostgreSQL
+
+Revision ID: 0006_partition_reserve_spot
+Revises: 0005_reserve_spot_archive
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_partition_reserve_spot'
+down_revision = '0005_reserve_spot_archive'
+branch_labels = None
+depends_on = None
+
+# Partitions created up front beyond the current month; the beat job keeps this many ahead
+MONTHS_AHEAD = 3
+
+
+def _month_start(timestamp):
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(start, months):
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1)
+
+
+def _create_indexes():
+    op.create_index('ix_reserve_spot_user_leaving', 'reserve_spot', ['user_id', 'leaving_time'], unique=False)
+    op.create_index('ix_reserve_spot_user_parking', 'reserve_spot', ['user_id', 'parking_time'], unique=False)
+    op.create_index('ix_reserve_spot_parking_time', 'reserve_spot', ['parking_time'], unique=False)
+    op.create_index('ix_reserve_spot_spot_id', 'reserve_spot', ['spot_id'], unique=False)
+    op.create_index('ix_reserve_spot_active', 'reserve_spot', ['user_id', 'spot_id'], unique=False,
+                    postgresql_where=sa.text('leaving_time IS NULL'))
+
+
+def _drop_indexes():
+    for name in ('ix_reserve_spot_active', 'ix_reserve_spot_spot_id', 'ix_reserve_spot_parking_time',
+                 'ix_reserve_spot_user_parking', 'ix_reserve_spot_user_leaving'):
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def _create_foreign_keys():
+    op.create_foreign_key('reserve_spot_spot_id_fkey', 'reserve_spot', 'parking_spot', ['spot_id'], ['id'])
+    op.create_foreign_key('reserve_spot_user_id_fkey', 'reserve_spot', 'user', ['user_id'], ['id'])
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # Range partitioning is PostgreSQL only; other databases keep the plain table
+        return
+
+    # Move the current table aside; index and constraint names are reused below
+    op.execute('ALTER TABLE reserve_spot RENAME TO reserve_spot_unpartitioned')
+    op.execute('ALTER TABLE reserve_spot_unpartitioned RENAME CONSTRAINT reserve_spot_pkey TO reserve_spot_unpartitioned_pkey')
+    _drop_indexes()
+    op.execute('ALTER SEQUENCE reserve_spot_id_seq OWNED BY NONE')
+
+    # The partition key must be part of the primary key
+    op.execute(
+        'CREATE TABLE reserve_spot ('
+        'LIKE reserve_spot_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS, '
+        'PRIMARY KEY (id, parking_time)'
+        ') PARTITION BY RANGE (parking_time)'
+    )
+    op.execute('ALTER SEQUENCE reserve_spot_id_seq OWNED BY reserve_spot.id')
+    _create_foreign_keys()
+    _create_indexes()
+
+    # One partition per month from the oldest reservation to MONTHS_AHEAD
+    # months ahead, and a default partition for anything outside them
+    oldest = bind.execute(sa.text('SELECT min(parking_time) FROM reserve_spot_unpartitioned')).scalar()
+    current = _month_start(datetime.now())
+    start = _month_start(oldest) if oldest and oldest < current else current
+    end = _add_months(current, MONTHS_AHEAD + 1)
+    while start < end:
+        following = _add_months(start, 1)
+        op.execute(
+            f"CREATE TABLE reserve_spot_y{start.year}m{start.month:02d} PARTITION OF reserve_spot "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        start = following
+    op.execute('CREATE TABLE reserve_spot_default PARTITION OF reserve_spot DEFAULT')
+
+    op.execute('INSERT INTO reserve_spot SELECT * FROM reserve_spot_unpartitioned')
+    op.execute('DROP TABLE reserve_spot_unpartitioned')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute(
+        'CREATE TABLE reserve_spot_unpartitioned '
+        '(LIKE reserve_spot INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    )
+    op.execute('INSERT INTO reserve_spot_unpartitioned SELECT * FROM reserve_spot')
+    op.execute('ALTER SEQUENCE reserve_spot_id_seq OWNED BY NONE')
+    # Drops every partition with it
+    op.execute('DROP TABLE reserve_spot')
+
+    op.execute('ALTER TABLE reserve_spot_unpartitioned RENAME TO reserve_spot')
+    op.execute('ALTER TABLE reserve_spot ADD CONSTRAINT reserve_spot_pkey PRIMARY KEY (id)')
+    op.execute('ALTER SEQUENCE reserve_spot_id_seq OWNED BY reserve_spot.id')
+    _create_foreign_keys()
+    _create_indexes()
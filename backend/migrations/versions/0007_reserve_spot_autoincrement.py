@@ -0,0 +1,45 @@
+"""never reuse reserve_spot ids on SQLite
+
+Revision ID: 0007_reserve_spot_autoincrement
+Revises: 0006_partition_reserve_spot
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_reserve_spot_autoincrement'
+down_revision = '0006_partition_reserve_spot'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        # Sequences elsewhere never hand out an id twice
+        return
+
+    # Without AUTOINCREMENT SQLite reuses the highest ids once they are moved
+    # to reserve_spot_archive, which keeps them as its primary key
+    with op.batch_alter_table('reserve_spot', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        pass
+
+    # Continue after every id already handed out, archived ones included
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'reserve_spot'")
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'reserve_spot', max("
+        "(SELECT coalesce(max(id), 0) FROM reserve_spot), "
+        "(SELECT coalesce(max(id), 0) FROM reserve_spot_archive))"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    with op.batch_alter_table('reserve_spot', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+        pass
@@ -38,8 +38,20 @@ class ParkingSpot(db.Model):  # Fixed: Capital P in ParkingSpot
     
     # Relationships
     reservations = db.relationship('ReserveSpot', backref='parking_spot', lazy=True)
+    
+    __table_args__ = (
+        # Free-spot lookups and per-lot availability counts
+        db.Index('ix_parking_spot_lot_status', 'lot_id', 'status'),
+        # First free spot of a lot, only indexing spots that can be claimed
+        db.Index('ix_parking_spot_free', 'lot_id', 'id',
+                 postgresql_where=db.text("status = 'available'"),
+                 sqlite_where=db.text("status = 'available'")),
+        db.Index('ix_parking_spot_user_id', 'user_id'),
+    )
 
 
+# On PostgreSQL migration 0006 partitions this table by month of parking_time
+# (primary key (id, parking_time)); partitions.py creates upcoming months.
 class ReserveSpot(db.Model):
     __tablename__ = 'reserve_spot'  # Added explicit table name
     id = db.Column(db.Integer, primary_key=True)  # Fixed: db.Column (capital C)
@@ -52,5 +64,113 @@ class ReserveSpot(db.Model):
     # Payment transaction details
     transaction_id = db.Column(db.String(50), nullable=True)  # Store transaction ID from payment
     payment_method = db.Column(db.String(20), nullable=True)  # Store payment method (qr/card/upi/cash)
+    
+    __table_args__ = (
+        db.Index('ix_reserve_spot_user_leaving', 'user_id', 'leaving_time'),
+        # Booking history ordered by parking time
+        db.Index('ix_reserve_spot_user_parking', 'user_id', 'parking_time'),
+        # Date-range reports
+        db.Index('ix_reserve_spot_parking_time', 'parking_time'),
+        db.Index('ix_reserve_spot_spot_id', 'spot_id'),
+        # Active sessions only (leaving_time IS NULL)
+        db.Index('ix_reserve_spot_active', 'user_id', 'spot_id',
+                 postgresql_where=db.text('leaving_time IS NULL'),
+                 sqlite_where=db.text('leaving_time IS NULL')),
+        # Never reuse the id of a reservation moved to reserve_spot_archive
+        {'sqlite_autoincrement': True},
+    )
+
+
+# Reservation history moved out of reserve_spot (deletion.py). Rows keep their
+# original id and carry lot_id, but no foreign keys, so archived history
+# survives spot, lot and user deletion.
+class ReserveSpotArchive(db.Model):
+    __tablename__ = 'reserve_spot_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    spot_id = db.Column(db.Integer, nullable=False)
+    lot_id = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    parking_time = db.Column(db.DateTime, nullable=False)
+    leaving_time = db.Column(db.DateTime, nullable=True)
+    parking_cost = db.Column(db.Float, nullable=False)
+    transaction_id = db.Column(db.String(50), nullable=True)
+    payment_method = db.Column(db.String(20), nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_reserve_spot_archive_user_parking', 'user_id', 'parking_time'),
+        db.Index('ix_reserve_spot_archive_parking_time', 'parking_time'),
+    )
+
+
+# Analytics rollups, maintained incrementally by rollups.py. Sessions are
+# bucketed by parking_time, like the reports that read them. lot_id and
+# user_id carry no foreign keys so history survives lot and user deletion.
+class LotActivityRollup(db.Model):
+    __tablename__ = 'lot_activity_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, nullable=False)
+    granularity = db.Column(db.String(10), nullable=False)  # hour / day / month
+    period_start = db.Column(db.DateTime, nullable=False)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    completed_sessions = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    occupied_minutes = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('lot_id', 'granularity', 'period_start', name='uq_lot_activity_rollup_period'),
+        db.Index('ix_lot_activity_rollup_period', 'granularity', 'period_start'),
+    )
 
 
+class PaymentMethodRollup(db.Model):
+    __tablename__ = 'payment_method_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, nullable=False)
+    granularity = db.Column(db.String(10), nullable=False)  # hour / day / month
+    period_start = db.Column(db.DateTime, nullable=False)
+    payment_method = db.Column(db.String(20), nullable=False)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('lot_id', 'granularity', 'period_start', 'payment_method',
+                            name='uq_payment_method_rollup_period'),
+        db.Index('ix_payment_method_rollup_period', 'granularity', 'period_start'),
+    )
+
+
+class UserMonthlyRollup(db.Model):
+    __tablename__ = 'user_monthly_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    lot_id = db.Column(db.Integer, nullable=False)
+    month_start = db.Column(db.DateTime, nullable=False)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    completed_sessions = db.Column(db.Integer, nullable=False, default=0)
+    spent = db.Column(db.Float, nullable=False, default=0)
+    occupied_minutes = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'month_start', 'lot_id', name='uq_user_monthly_rollup_month'),
+        db.Index('ix_user_monthly_rollup_month', 'month_start'),
+    )
+
+
+# Transactional outbox for user emails. Rows are written in the same
+# transaction as the reservation change and delivered by Celery (outbox.py).
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # booking_confirmation / parking_release
+    reservation_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending / sending / sent / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # When the row may next be picked up: retry backoff while pending, lease expiry while sending
+    available_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'status', 'available_at'),
+    )
@@ -0,0 +1,110 @@
+"""
+Transactional email outbox.
+
+Request handlers call enqueue_email() before committing a reservation change,
+so the email is recorded atomically with it, and dispatch_email() after the
+commit to hand delivery to Celery without waiting on SMTP. Rows whose
+dispatch was lost, or whose delivery failed, are picked up again by the
+periodic drain_email_outbox task.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, and_
+from models import db, EmailOutbox
+
+MAX_ATTEMPTS = 5
+# How long a worker owns a claimed row before others may retry it
+SENDING_LEASE = timedelta(minutes=5)
+RETRY_BACKOFF = timedelta(minutes=1)
+
+
+def enqueue_email(kind, reservation):
+    """Record an email for a reservation; call before committing the reservation"""
+    if reservation.id is None:
+        db.session.flush()
+    now = datetime.now()
+    entry = EmailOutbox(
+        kind=kind,
+        reservation_id=reservation.id,
+        status='pending',
+        attempts=0,
+        available_at=now,
+        created_at=now
+    )
+    db.session.add(entry)
+    return entry
+
+
+def dispatch_email(outbox_id):
+    """Ask a Celery worker to deliver an outbox row; call after committing"""
+    try:
+        from celery_app import celery
+        from tasks import deliver_outbox_email
+        # Publish on a pooled producer so requests reuse broker connections.
+        # Fail fast if the broker is down instead of blocking the request on
+        # kombu's reconnect loop - the periodic drain will deliver it later
+        with celery.producer_or_acquire() as producer:
+            producer.connection.ensure_connection(max_retries=1, interval_start=0)
+            deliver_outbox_email.apply_async(args=[outbox_id], retry=False, producer=producer)
+        return True
+    except Exception as e:
+        print(f"⚠️ Email outbox dispatch failed, leaving {outbox_id} for the drain: {e}")
+    return False
+
+
+def _due_clause(now):
+    return and_(
+        EmailOutbox.status.in_(('pending', 'sending')),
+        EmailOutbox.available_at <= now
+    )
+
+
+def due_email_ids(limit=100):
+    """Get ids of outbox rows that are waiting for delivery or whose lease expired"""
+    now = datetime.now()
+    return list(db.session.execute(
+        select(EmailOutbox.id).where(_due_clause(now)).order_by(EmailOutbox.available_at).limit(limit)
+    ).scalars())
+
+
+def claim_email(outbox_id):
+    """
+    Take ownership of an outbox row for delivery.
+
+    Uses a guarded UPDATE so only one worker can claim a row; returns the
+    claimed EmailOutbox or None. Commits the claim.
+    """
+    now = datetime.now()
+    result = db.session.execute(
+        update(EmailOutbox).where(
+            EmailOutbox.id == outbox_id,
+            _due_clause(now)
+        ).values(
+            status='sending',
+            attempts=EmailOutbox.attempts + 1,
+            available_at=now + SENDING_LEASE
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    if result.rowcount != 1:
+        return None
+    return db.session.get(EmailOutbox, outbox_id, populate_existing=True)
+
+
+def mark_sent(entry):
+    entry.status = 'sent'
+    entry.sent_at = datetime.now()
+    entry.last_error = None
+    db.session.commit()
+
+
+def mark_failed(entry, error, permanent=False):
+    """Schedule a retry with linear backoff, or give up after MAX_ATTEMPTS"""
+    entry.last_error = str(error)[:500]
+    if permanent or entry.attempts >= MAX_ATTEMPTS:
+        entry.status = 'failed'
+    else:
+        entry.status = 'pending'
+        entry.available_at = datetime.now() + RETRY_BACKOFF * entry.attempts
+    db.session.commit()
+
@@ -0,0 +1,105 @@
+"""
+Monthly range partitions of reserve_spot on PostgreSQL.
+
+Migration 0006 turns reserve_spot into a table partitioned by RANGE
+(parking_time) with one partition per month and a default partition, so
+queries bounded on parking_time only scan the months they ask for. The beat
+job ensure_reserve_spot_partitions creates the coming months ahead of time;
+rows that landed in the default partition because their month was missing
+are moved into it when it is created.
+
+Other databases keep a plain reserve_spot table and ensure_partitions() does
+nothing.
+"""
+from datetime import datetime
+from sqlalchemy import text
+from models import db
+
+PARTITIONED_TABLE = 'reserve_spot'
+DEFAULT_PARTITION = 'reserve_spot_default'
+PARTITION_MONTHS_AHEAD = 3
+# pg_advisory_xact_lock key so concurrent runs do not race to create a partition
+PARTITION_LOCK_KEY = 5071
+
+
+def month_start(timestamp):
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(start, months):
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(start):
+    return f'{PARTITIONED_TABLE}_y{start.year}m{start.month:02d}'
+
+
+def is_partitioned(connection):
+    """Whether reserve_spot is a partitioned table on this connection"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid))"
+    ), {'table': PARTITIONED_TABLE}).scalar()
+
+
+def existing_partitions(connection):
+    return set(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "WHERE parent.relname = :table AND pg_table_is_visible(parent.oid)"
+    ), {'table': PARTITIONED_TABLE}).scalars())
+
+
+def create_partition(connection, start):
+    """Create the partition for the month starting at `start`; returns its name"""
+    name = partition_name(start)
+    end = add_months(start, 1)
+    bounds = f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    in_month = {'start': start, 'end': end}
+
+    misplaced = connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+        f"WHERE parking_time >= :start AND parking_time < :end)"
+    ), in_month).scalar()
+    if not misplaced:
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF {PARTITIONED_TABLE} {bounds}"))
+        return name
+
+    # A month cannot be attached while the default partition holds its rows,
+    # so move them into the new table first
+    connection.execute(text(
+        f"CREATE TABLE {name} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE parking_time >= :start AND parking_time < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), in_month)
+    connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {name} {bounds}"))
+    return name
+
+
+def ensure_partitions(months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Create any missing partitions from the current month to `months_ahead`
+    months ahead and commit. Returns the names of the created partitions.
+    """
+    connection = db.session.connection()
+    if not is_partitioned(connection):
+        return []
+
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': PARTITION_LOCK_KEY})
+    existing = existing_partitions(connection)
+    current = month_start(datetime.now())
+    created = []
+    for months in range(months_ahead + 1):
+        start = add_months(current, months)
+        if partition_name(start) not in existing:
+            created.append(create_partition(connection, start))
+    db.session.commit()
+    return created
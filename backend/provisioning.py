@@ -0,0 +1,151 @@
+"""
+Bulk parking spot provisioning.
+
+Creating or resizing a lot adds and removes its spots in a handful of set
+based statements inside the caller's transaction, instead of one ORM object
+per bay. On PostgreSQL new spots are generated server side with
+INSERT ... SELECT FROM generate_series, elsewhere they are inserted with a
+single executemany.
+
+Shrinking a lot only ever touches available spots, highest ids first, so
+occupied and reserved bays are never taken away. Spots with booking history
+cannot be deleted and are retired instead; growing the lot revives retired
+spots before inserting new ones.
+"""
+from sqlalchemy import delete, insert, select, text, update
+from models import db, ParkingLot, ParkingSpot, ReserveSpot
+
+# Status of spots removed from a lot that still have booking history
+RETIRED = 'retired'
+# Mappings per executemany batch on databases without generate_series
+INSERT_BATCH_SIZE = 5000
+
+
+class ResizeError(Exception):
+    """The lot cannot be resized as requested"""
+
+
+def _dialect():
+    """Get the SQLAlchemy dialect of the current session"""
+    return db.session.get_bind().dialect
+
+
+def _revive_spots(lot_id, count):
+    """Make up to `count` retired spots of a lot available again"""
+    retired = select(ParkingSpot.id).where(
+        ParkingSpot.lot_id == lot_id,
+        ParkingSpot.status == RETIRED
+    ).order_by(ParkingSpot.id).limit(count)
+    result = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id.in_(retired.scalar_subquery()), ParkingSpot.status == RETIRED)
+        .values(status='available', user_id=None),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount
+
+
+def provision_spots(lot_id, count):
+    """
+    Add `count` available spots to a lot. Retired spots are revived first.
+    The caller owns the transaction and must commit or roll back.
+    """
+    if count <= 0:
+        return 0
+    revived = _revive_spots(lot_id, count)
+    remaining = count - revived
+
+    if remaining > 0:
+        if _dialect().name == 'postgresql':
+            db.session.execute(
+                text(
+                    "INSERT INTO parking_spot (lot_id, status) "
+                    "SELECT :lot_id, 'available' FROM generate_series(1, :count)"
+                ),
+                {'lot_id': lot_id, 'count': remaining}
+            )
+        else:
+            for start in range(0, remaining, INSERT_BATCH_SIZE):
+                batch = min(INSERT_BATCH_SIZE, remaining - start)
+                db.session.execute(
+                    insert(ParkingSpot),
+                    [{'lot_id': lot_id, 'status': 'available'}] * batch
+                )
+    return count
+
+
+def retire_spots(lot_id, count):
+    """
+    Remove `count` available spots from a lot, highest ids first. Spots with
+    booking history are marked retired, the rest are deleted. Raises
+    ResizeError if the lot does not have that many available spots.
+    The caller owns the transaction and must commit or roll back.
+    """
+    if count <= 0:
+        return []
+    candidates = select(ParkingSpot.id).where(
+        ParkingSpot.lot_id == lot_id,
+        ParkingSpot.status == 'available'
+    ).order_by(ParkingSpot.id.desc()).limit(count)
+    if _dialect().name == 'postgresql':
+        # Leave spots that are being booked right now to the booking
+        candidates = candidates.with_for_update(skip_locked=True)
+    spot_ids = db.session.execute(candidates).scalars().all()
+    if len(spot_ids) < count:
+        raise ResizeError(f'Only {len(spot_ids)} free spots can be removed from this lot')
+
+    with_history = set(db.session.execute(
+        select(ReserveSpot.spot_id).where(ReserveSpot.spot_id.in_(spot_ids)).distinct()
+    ).scalars())
+    unused = [spot_id for spot_id in spot_ids if spot_id not in with_history]
+
+    # The status guard catches spots booked since they were selected
+    removed = 0
+    if unused:
+        removed += db.session.execute(
+            delete(ParkingSpot).where(ParkingSpot.id.in_(unused), ParkingSpot.status == 'available'),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+    if with_history:
+        removed += db.session.execute(
+            update(ParkingSpot)
+            .where(ParkingSpot.id.in_(with_history), ParkingSpot.status == 'available')
+            .values(status=RETIRED),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+    if removed != count:
+        raise ResizeError('Spots were booked while resizing, please try again')
+    return spot_ids
+
+
+def resize_lot(lot, number_of_slots):
+    """
+    Grow or shrink a lot to `number_of_slots` spots, keeping occupied and
+    reserved spots. Returns the ids of removed spots. Raises ResizeError if
+    there are not enough free spots to remove.
+    The caller owns the transaction and must commit or roll back.
+    """
+    if number_of_slots < 0:
+        raise ResizeError('Number of slots cannot be negative')
+    delta = number_of_slots - lot.number_of_slots
+    if delta == 0:
+        return []
+
+    removed = []
+    if delta > 0:
+        provision_spots(lot.id, delta)
+    else:
+        removed = retire_spots(lot.id, -delta)
+
+    # Counters are adjusted in SQL so concurrent bookings are not overwritten
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot.id)
+        .values(
+            number_of_slots=number_of_slots,
+            available_slots=ParkingLot.available_slots + delta
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.expire(lot, ['number_of_slots', 'available_slots'])
+    return removed
@@ -0,0 +1,126 @@
+"""
+Sliding-window rate limiting.
+
+Every check is one atomic Lua script call: it trims each window's sorted set
+of request timestamps, counts what is left and records the request only when
+all of the policy's limits allow it. A request therefore costs one round trip,
+and concurrent requests can never slip past a limit between a read and a
+write. Redis' own clock is used, so all workers share the same windows.
+
+Policies are configured per endpoint in RATE_LIMITS (app config) as lists of
+(scope, max requests, window seconds), where scope is 'user' (JWT identity,
+falling back to the client IP) or 'ip'. Resources opt in with @rate_limit.
+"""
+import uuid
+from functools import wraps
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+from keyspace import registry_key
+
+# Policy name -> [(scope, max requests, window seconds)]
+DEFAULT_RATE_LIMITS = {
+    'booking_book-spot': [('user', 10, 60), ('ip', 30, 60)],
+    'login': [('ip', 10, 60), ('ip', 50, 3600)],
+    'export': [('user', 5, 60)],
+}
+
+# KEYS[1] = keyspace registry, KEYS[2..] = window keys
+# ARGV[1] = request id, then max requests and window ms per key
+# Returns {allowed, remaining, retry after ms}
+SLIDING_WINDOW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local remaining = -1
+local retry_after = 0
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', string.format('%.3f', now / 1000))
+
+for i = 2, #KEYS do
+    local limit = tonumber(ARGV[i * 2 - 2])
+    local window = tonumber(ARGV[i * 2 - 1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window)
+    local count = redis.call('ZCARD', KEYS[i])
+    if count >= limit then
+        local oldest = redis.call('ZRANGE', KEYS[i], count - limit, count - limit, 'WITHSCORES')
+        retry_after = math.max(retry_after, tonumber(oldest[2]) + window - now)
+    elseif remaining < 0 or limit - count - 1 < remaining then
+        remaining = limit - count - 1
+    end
+end
+
+if retry_after > 0 then
+    return {0, 0, retry_after}
+end
+
+for i = 2, #KEYS do
+    local window = tonumber(ARGV[i * 2 - 1])
+    redis.call('ZADD', KEYS[i], now, ARGV[1])
+    redis.call('PEXPIRE', KEYS[i], window)
+    redis.call('ZADD', KEYS[1], string.format('%.3f', (now + window) / 1000), KEYS[i])
+end
+return {1, remaining, 0}
+"""
+
+_scripts = {}
+
+
+def _script(redis_client):
+    script = _scripts.get(id(redis_client))
+    if script is None:
+        script = _scripts[id(redis_client)] = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+    return script
+
+
+def hit(redis_client, limits):
+    """
+    Count one request against every (key, max requests, window seconds) limit.
+    Returns (allowed, remaining, retry after seconds); the request is only
+    recorded when every limit allows it.
+    """
+    keys = [registry_key('rate_limit')]
+    args = [uuid.uuid4().hex]
+    for key, max_requests, window_seconds in limits:
+        keys.append(key)
+        args += [max_requests, int(window_seconds * 1000)]
+    allowed, remaining, retry_after_ms = _script(redis_client)(keys=keys, args=args, client=redis_client)
+    return bool(allowed), max(remaining, 0), -(-retry_after_ms // 1000)
+
+
+def _scope_id(scope):
+    if scope == 'user':
+        try:
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        if identity is not None:
+            return f'user:{identity}'
+    return f'ip:{request.remote_addr}'
+
+
+def rate_limit(policy):
+    """
+    Rate limit a Flask-RESTful resource method with a RATE_LIMITS policy.
+
+    The policy name may reference the view arguments, e.g. 'booking_{action}';
+    names without a configured policy are not limited. Place it below
+    @jwt_required() so per-user limits can see the identity. Requests are let
+    through when Redis is unavailable.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            name = policy.format(**kwargs)
+            limits = current_app.config.get('RATE_LIMITS', DEFAULT_RATE_LIMITS).get(name)
+            redis_client = getattr(current_app, 'redis_client', None)
+            if limits and redis_client:
+                try:
+                    allowed, _, retry_after = hit(redis_client, [
+                        (f'rate_limit:{name}:{_scope_id(scope)}:{window_seconds}', max_requests, window_seconds)
+                        for scope, max_requests, window_seconds in limits
+                    ])
+                    if not allowed:
+                        return {'msg': 'Rate limit exceeded. Try again later.'}, 429, {'Retry-After': str(retry_after)}
+                except Exception as e:
+                    print(f"Redis rate limit error: {e}")
+            return method(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,220 @@
+"""
+Batched request metrics.
+
+before_request/after_request only bump in-process counters. A background
+thread flushes them to Redis as INCRBYs in one pipelined round trip every
+flush interval, or sooner once enough hits have been counted, and once more
+when the worker exits. Request threads never wait on Redis.
+
+Prometheus samples (latency histograms, DB query stats, cache hit rates and
+Celery task durations) go through the same batches into one Redis hash, so
+/metrics reports totals across every gunicorn and Celery worker process.
+"""
+import atexit
+import os
+import re
+import threading
+import time
+from collections import Counter
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Hash holding every Prometheus sample, keyed by its exposition line prefix
+PROMETHEUS_HASH = 'metrics:prometheus'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+TASK_DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+# Metric name -> (type, help)
+METRICS = {
+    'parkease_http_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'parkease_http_responses_total': ('counter', 'Responses by endpoint and status code'),
+    'parkease_db_queries_per_request': ('histogram', 'SQL queries issued per request by endpoint'),
+    'parkease_db_query_duration_seconds_total': ('counter', 'Time spent in SQL queries by endpoint'),
+    'parkease_cache_requests_total': ('counter', 'cache_get lookups by key namespace and result'),
+    'parkease_celery_task_duration_seconds': ('histogram', 'Celery task run time by task and state'),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels, le=None):
+    pairs = [f'{key}="{_escape(value)}"' for key, value in labels.items()]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return f'{name}{{{",".join(pairs)}}}' if pairs else name
+
+
+def _bucket_label(bound):
+    return f'{bound:g}'
+
+
+# (namespace, result) -> cache lookup sample name
+_cache_samples = {}
+
+
+class RequestMetrics:
+    def __init__(self, redis_client, flush_interval_ms=1000, flush_every=200):
+        self.redis_client = redis_client
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_every = flush_every
+        # (key, hash field or None) -> amount
+        self._counts = Counter()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _ensure_flusher(self):
+        # Started lazily so every forked worker gets its own thread
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            with self._lock:
+                self._counts = Counter()
+                self._pending = 0
+            threading.Thread(target=self._run, name='request-metrics-flusher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _add(self, items):
+        self._ensure_flusher()
+        with self._lock:
+            for key, amount in items:
+                self._counts[key] += amount
+            self._pending += 1
+            due = self._pending >= self.flush_every
+        if due:
+            self._wakeup.set()
+
+    def incr(self, *keys):
+        """Count one hit for each plain Redis counter key"""
+        self._add(((key, None), 1) for key in keys)
+
+    def inc(self, name, labels, amount=1):
+        """Add to a Prometheus counter"""
+        self._add([((PROMETHEUS_HASH, _sample(name, labels)), amount)])
+
+    def _observations(self, name, labels, value, buckets):
+        # Buckets are stored cumulative, as Prometheus exposes them; empty ones
+        # still get a field so every series carries the full bucket set
+        items = [((PROMETHEUS_HASH, _sample(f'{name}_bucket', labels, _bucket_label(bound))), int(value <= bound))
+                 for bound in buckets]
+        items.append(((PROMETHEUS_HASH, _sample(f'{name}_bucket', labels, '+Inf')), 1))
+        items.append(((PROMETHEUS_HASH, _sample(f'{name}_sum', labels)), float(value)))
+        items.append(((PROMETHEUS_HASH, _sample(f'{name}_count', labels)), 1))
+        return items
+
+    def observe(self, name, labels, value, buckets):
+        """Record a value in a Prometheus histogram"""
+        self._add(self._observations(name, labels, value, buckets))
+
+    def record_request(self, endpoint, method, status_code, duration, queries, query_time):
+        labels = {'endpoint': endpoint, 'method': method}
+        items = self._observations('parkease_http_request_duration_seconds', labels, duration, LATENCY_BUCKETS)
+        items += self._observations('parkease_db_queries_per_request', labels, queries, QUERY_COUNT_BUCKETS)
+        items.append(((PROMETHEUS_HASH, _sample('parkease_db_query_duration_seconds_total', labels)), float(query_time)))
+        items.append(((PROMETHEUS_HASH, _sample('parkease_http_responses_total',
+                                                {'endpoint': endpoint, 'code': status_code})), 1))
+        self._add(items)
+
+    def record_cache(self, key, result):
+        """result is 'local_hit', 'hit' or 'miss'"""
+        namespace = key.split(':', 1)[0]
+        # Cache lookups are the hottest path, so their sample names are memoized
+        sample = _cache_samples.get((namespace, result))
+        if sample is None:
+            sample = _cache_samples[(namespace, result)] = _sample(
+                'parkease_cache_requests_total', {'namespace': namespace, 'result': result})
+        self._add([((PROMETHEUS_HASH, sample), 1)])
+
+    def record_task(self, task_name, state, duration):
+        self.observe('parkease_celery_task_duration_seconds', {'task': task_name, 'state': state},
+                     duration, TASK_DURATION_BUCKETS)
+
+    def flush(self):
+        """Write the accumulated counters to Redis in one pipeline"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._pending = 0
+        if not counts:
+            return 0
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for (key, field), amount in counts.items():
+                if field is None:
+                    pipe.incrby(key, amount)
+                elif isinstance(amount, float):
+                    pipe.hincrbyfloat(key, field, amount)
+                else:
+                    pipe.hincrby(key, field, amount)
+            pipe.execute()
+            return len(counts)
+        except Exception as e:
+            print(f"Redis metrics flush error: {e}")
+            # Keep the counts for the next flush rather than losing them
+            with self._lock:
+                self._counts.update(counts)
+            return 0
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_query_time = g.get('db_query_time', 0.0) + elapsed
+
+
+_LE_LABEL = re.compile(r',?le="([^"]*)"')
+_SAMPLE_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+def _family(sample):
+    name = sample.split('{', 1)[0]
+    if name not in METRICS:
+        for suffix in _SAMPLE_SUFFIXES:
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(sample):
+    name, _, labels = sample.partition('{')
+    match = _LE_LABEL.search(labels)
+    le = float(match.group(1)) if match else float('inf')
+    return (_LE_LABEL.sub('', labels), name, le)
+
+
+def render_prometheus(redis_client):
+    """Render every stored sample in the Prometheus text exposition format"""
+    families = {}
+    for sample, value in redis_client.hgetall(PROMETHEUS_HASH).items():
+        families.setdefault(_family(sample), []).append((sample, value))
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        samples = families.get(name)
+        if not samples:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for sample, value in sorted(samples, key=lambda item: _sort_key(item[0])):
+            lines.append(f'{sample} {value}')
+    return '\n'.join(lines) + '\n'
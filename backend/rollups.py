@@ -0,0 +1,333 @@
+"""
+Incrementally maintained analytics rollups.
+
+Bookings and releases add their contribution to per-lot hourly, daily and
+monthly buckets (LotActivityRollup, PaymentMethodRollup) and to per-user
+monthly buckets (UserMonthlyRollup) inside the same transaction as the
+reservation change, so reports never have to scan reserve_spot.
+
+Bulk changes (closing or deleting many reservations at once) adjust the
+rollups with one grouped INSERT ... SELECT ... ON CONFLICT DO UPDATE per
+rollup table and granularity, however many reservations are affected.
+
+Rebuild everything from the reservation history with:
+
+    python rollups.py
+"""
+from collections import defaultdict
+from sqlalchemy import case, delete, func, literal, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from archive import reservation_history
+from models import db, LotActivityRollup, PaymentMethodRollup, UserMonthlyRollup
+
+GRANULARITIES = ('hour', 'day', 'month')
+
+# SQLite stores DateTime columns as text in this format, so truncating with
+# strftime yields values equal to the stored period_start
+_SQLITE_PERIOD_FORMATS = {
+    'hour': '%Y-%m-%d %H:00:00.000000',
+    'day': '%Y-%m-%d 00:00:00.000000',
+    'month': '%Y-%m-01 00:00:00.000000',
+}
+
+_DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def period_start(timestamp, granularity):
+    """Truncate a datetime to the start of its hour, day or month"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _occupied_minutes(reservation):
+    if not reservation.leaving_time or not reservation.parking_time:
+        return 0.0
+    return (reservation.leaving_time - reservation.parking_time).total_seconds() / 60
+
+
+def _upsert(model, keys, increments):
+    """Add increments to the rollup row identified by keys, creating it if needed"""
+    table = model.__table__
+    insert = _DIALECT_INSERTS.get(db.session.get_bind().dialect.name)
+
+    if insert is not None:
+        stmt = insert(table).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + stmt.excluded[column] for column in increments}
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback: update, then insert when the bucket does not exist yet
+    result = db.session.execute(
+        table.update()
+        .where(*[table.c[column] == value for column, value in keys.items()])
+        .values({column: table.c[column] + value for column, value in increments.items()})
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(**keys, **increments))
+
+
+def _apply(reservation, lot_id, bookings=0, completions=0, sign=1):
+    """Add (or with sign=-1, remove) a reservation's contribution to all rollups"""
+    if completions:
+        revenue = float(reservation.parking_cost or 0) * completions
+        minutes = _occupied_minutes(reservation) * completions
+    else:
+        revenue = minutes = 0.0
+
+    for granularity in GRANULARITIES:
+        start = period_start(reservation.parking_time, granularity)
+        _upsert(LotActivityRollup,
+                {'lot_id': lot_id, 'granularity': granularity, 'period_start': start},
+                {'bookings': sign * bookings, 'completed_sessions': sign * completions,
+                 'revenue': sign * revenue, 'occupied_minutes': sign * minutes})
+        if completions and reservation.payment_method:
+            _upsert(PaymentMethodRollup,
+                    {'lot_id': lot_id, 'granularity': granularity, 'period_start': start,
+                     'payment_method': reservation.payment_method},
+                    {'sessions': sign * completions})
+
+    _upsert(UserMonthlyRollup,
+            {'user_id': reservation.user_id, 'month_start': period_start(reservation.parking_time, 'month'),
+             'lot_id': lot_id},
+            {'bookings': sign * bookings, 'completed_sessions': sign * completions,
+             'spent': sign * revenue, 'occupied_minutes': sign * minutes})
+
+
+def record_booking(reservation, lot_id):
+    """Count a new reservation; call before committing it"""
+    _apply(reservation, lot_id, bookings=1, completions=1 if reservation.leaving_time else 0)
+
+
+def record_completion(reservation, lot_id):
+    """Count a finished session and its revenue; call before committing the release"""
+    _apply(reservation, lot_id, completions=1)
+
+
+def retract_reservation(reservation, lot_id):
+    """Remove a cancelled reservation's contribution; call before deleting it"""
+    _apply(reservation, lot_id, bookings=1, completions=1 if reservation.leaving_time else 0, sign=-1)
+
+
+def _history(*conditions):
+    """Reservations of both tiers matching `conditions` on reservation_history.c"""
+    history = reservation_history.c
+    return select(
+        history.user_id, history.parking_time, history.leaving_time,
+        history.parking_cost, history.payment_method, history.lot_id
+    ).where(history.lot_id.isnot(None), *conditions)
+
+
+def _collect(rows, bookings=True):
+    """
+    Sum reservation rows into (lot, payment method, user) rollup buckets.
+    With bookings=False only completed sessions are counted.
+    """
+    lot_buckets = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    payment_buckets = defaultdict(int)
+    user_buckets = defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    for reservation in rows:
+        lot_id = reservation.lot_id
+        completed = reservation.leaving_time is not None
+        revenue = float(reservation.parking_cost or 0) if completed else 0.0
+        minutes = _occupied_minutes(reservation)
+
+        for granularity in GRANULARITIES:
+            start = period_start(reservation.parking_time, granularity)
+            bucket = lot_buckets[(lot_id, granularity, start)]
+            if bookings:
+                bucket[0] += 1
+            if completed:
+                bucket[1] += 1
+                bucket[2] += revenue
+                bucket[3] += minutes
+                if reservation.payment_method:
+                    payment_buckets[(lot_id, granularity, start, reservation.payment_method)] += 1
+
+        bucket = user_buckets[(reservation.user_id, period_start(reservation.parking_time, 'month'), lot_id)]
+        if bookings:
+            bucket[0] += 1
+        if completed:
+            bucket[1] += 1
+            bucket[2] += revenue
+            bucket[3] += minutes
+
+    return lot_buckets, payment_buckets, user_buckets
+
+
+def _apply_buckets(buckets, sign=1):
+    """Add (or with sign=-1, remove) collected buckets to the rollup tables"""
+    lot_buckets, payment_buckets, user_buckets = buckets
+    for (lot_id, granularity, start), (bookings, completions, revenue, minutes) in lot_buckets.items():
+        _upsert(LotActivityRollup,
+                {'lot_id': lot_id, 'granularity': granularity, 'period_start': start},
+                {'bookings': sign * bookings, 'completed_sessions': sign * completions,
+                 'revenue': sign * revenue, 'occupied_minutes': sign * minutes})
+    for (lot_id, granularity, start, method), sessions in payment_buckets.items():
+        _upsert(PaymentMethodRollup,
+                {'lot_id': lot_id, 'granularity': granularity, 'period_start': start,
+                 'payment_method': method},
+                {'sessions': sign * sessions})
+    for (user_id, start, lot_id), (bookings, completions, spent, minutes) in user_buckets.items():
+        _upsert(UserMonthlyRollup,
+                {'user_id': user_id, 'month_start': start, 'lot_id': lot_id},
+                {'bookings': sign * bookings, 'completed_sessions': sign * completions,
+                 'spent': sign * spent, 'occupied_minutes': sign * minutes})
+
+
+def _period(column, granularity):
+    """SQL expression truncating a timestamp to the start of its rollup period"""
+    # Rendered inline so the same expression can be grouped on in PostgreSQL
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.date_trunc(literal_column(f"'{granularity}'"), column)
+    return func.strftime(literal_column(f"'{_SQLITE_PERIOD_FORMATS[granularity]}'"), column)
+
+
+def _minutes(start, end):
+    """SQL expression for the minutes from `start` to `end`"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.extract('epoch', end - start) / 60
+    return (func.julianday(end) - func.julianday(start)) * 1440
+
+
+def _upsert_from(model, keys, increments, rows, insert):
+    """Add grouped rows (keys then increments) to the rollup rows they identify, creating missing ones"""
+    table = model.__table__
+    stmt = insert(table).from_select(list(keys) + list(increments), rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + stmt.excluded[column] for column in increments}
+    )
+    db.session.execute(stmt)
+
+
+def _adjust_history(conditions, sign=1, bookings=True):
+    """
+    Add (or with sign=-1, remove) the contribution of the reservations in
+    both tiers matching `conditions` with one grouped statement per rollup
+    table and granularity. With bookings=False only completed sessions count.
+    """
+    insert = _DIALECT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        # Generic fallback: collect the buckets in Python, one upsert each
+        rows = db.session.execute(_history(*conditions))
+        _apply_buckets(_collect(rows, bookings=bookings), sign=sign)
+        return
+
+    history = reservation_history.c
+    completed = history.leaving_time.isnot(None)
+    scope = (history.lot_id.isnot(None), *conditions)
+
+    def completed_sum(value):
+        return sign * func.coalesce(func.sum(case((completed, value), else_=0)), 0)
+
+    totals = (
+        sign * func.count() if bookings else literal(0),
+        completed_sum(1),
+        completed_sum(func.coalesce(history.parking_cost, 0)),
+        completed_sum(_minutes(history.parking_time, history.leaving_time)),
+    )
+
+    for granularity in GRANULARITIES:
+        period = _period(history.parking_time, granularity)
+        _upsert_from(
+            LotActivityRollup, ('lot_id', 'granularity', 'period_start'),
+            ('bookings', 'completed_sessions', 'revenue', 'occupied_minutes'),
+            select(history.lot_id, literal(granularity), period, *totals)
+            .where(*scope).group_by(history.lot_id, period),
+            insert
+        )
+        _upsert_from(
+            PaymentMethodRollup, ('lot_id', 'granularity', 'period_start', 'payment_method'),
+            ('sessions',),
+            select(history.lot_id, literal(granularity), period, history.payment_method, sign * func.count())
+            .where(*scope, completed, history.payment_method.isnot(None))
+            .group_by(history.lot_id, period, history.payment_method),
+            insert
+        )
+
+    month = _period(history.parking_time, 'month')
+    _upsert_from(
+        UserMonthlyRollup, ('user_id', 'month_start', 'lot_id'),
+        ('bookings', 'completed_sessions', 'spent', 'occupied_minutes'),
+        select(history.user_id, month, history.lot_id, *totals)
+        .where(*scope).group_by(history.user_id, month, history.lot_id),
+        insert
+    )
+
+
+def record_completions(reservation_ids):
+    """Count the sessions of reservations just closed in bulk; call before committing"""
+    if not reservation_ids:
+        return
+    _adjust_history((reservation_history.c.id.in_(reservation_ids),), bookings=False)
+
+
+def retract_history(*conditions):
+    """
+    Remove the contribution of every reservation in both tiers matching
+    `conditions` on reservation_history.c; call before deleting them.
+    """
+    _adjust_history(conditions, sign=-1)
+
+
+def drop_lot_rollups(lot_id):
+    """Delete every rollup row of a lot; call when its history is deleted"""
+    for model in (LotActivityRollup, PaymentMethodRollup, UserMonthlyRollup):
+        db.session.execute(
+            delete(model).where(model.lot_id == lot_id),
+            execution_options={'synchronize_session': False}
+        )
+
+
+def rebuild_rollups(batch_size=5000):
+    """
+    Recompute all rollups from the reservation history.
+
+    Streams both reservation tiers in batches and replaces the rollup tables in one
+    transaction. Returns the number of reservations processed.
+    """
+    rows = db.session.execute(_history().execution_options(yield_per=batch_size))
+    lot_buckets, payment_buckets, user_buckets = _collect(rows)
+    # Every reservation is booked once into exactly one month bucket
+    processed = sum(bucket[0] for (_, granularity, _), bucket in lot_buckets.items() if granularity == 'month')
+
+    db.session.query(LotActivityRollup).delete()
+    db.session.query(PaymentMethodRollup).delete()
+    db.session.query(UserMonthlyRollup).delete()
+
+    db.session.bulk_insert_mappings(LotActivityRollup, [
+        {'lot_id': lot_id, 'granularity': granularity, 'period_start': start, 'bookings': bookings,
+         'completed_sessions': completions, 'revenue': revenue, 'occupied_minutes': minutes}
+        for (lot_id, granularity, start), (bookings, completions, revenue, minutes) in lot_buckets.items()
+    ])
+    db.session.bulk_insert_mappings(PaymentMethodRollup, [
+        {'lot_id': lot_id, 'granularity': granularity, 'period_start': start,
+         'payment_method': method, 'sessions': sessions}
+        for (lot_id, granularity, start, method), sessions in payment_buckets.items()
+    ])
+    db.session.bulk_insert_mappings(UserMonthlyRollup, [
+        {'user_id': user_id, 'month_start': start, 'lot_id': lot_id, 'bookings': bookings,
+         'completed_sessions': completions, 'spent': spent, 'occupied_minutes': minutes}
+        for (user_id, start, lot_id), (bookings, completions, spent, minutes) in user_buckets.items()
+    ])
+    db.session.commit()
+    return processed
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        print("🔄 Rebuilding analytics rollups...")
+        count = rebuild_rollups()
+        print(f"✅ Rollups rebuilt from {count} reservations")
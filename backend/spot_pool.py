@@ -0,0 +1,136 @@
+"""
+Redis-backed pool of free parking spots per lot.
+
+Each lot keeps a Redis set ``free_spots:<lot_id>`` of spot ids that are
+available, so booking can SPOP a candidate in O(1) instead of scanning the
+parking_spot table. The pool is only a hint: every popped id is still claimed
+with the guarded UPDATE in allocation.py, and reconcile_pool() repairs drift
+against the database.
+"""
+from flask import current_app
+from models import db, ParkingSpot
+
+# How many stale ids to skip before falling back to a database scan
+MAX_POOL_POPS = 5
+
+
+def _redis():
+    """Get Redis client from Flask app context"""
+    return getattr(current_app, 'redis_client', None)
+
+
+def pool_key(lot_id):
+    return f'free_spots:{lot_id}'
+
+
+def seeded_key(lot_id):
+    # An empty Redis set does not exist, so track seeding separately
+    return f'free_spots_seeded:{lot_id}'
+
+
+def _free_spot_ids(lot_id):
+    """Get ids of all available spots of a lot from the database"""
+    rows = db.session.query(ParkingSpot.id).filter_by(lot_id=lot_id, status='available').all()
+    return {str(spot_id) for (spot_id,) in rows}
+
+
+def seed_pool(lot_id):
+    """(Re)build the free-spot pool of a lot from the database"""
+    redis_client = _redis()
+    if not redis_client:
+        return False
+    try:
+        free_ids = _free_spot_ids(lot_id)
+        pipe = redis_client.pipeline()
+        pipe.delete(pool_key(lot_id))
+        if free_ids:
+            pipe.sadd(pool_key(lot_id), *free_ids)
+        pipe.set(seeded_key(lot_id), 1)
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Redis spot pool seed error: {e}")
+    return False
+
+
+def pop_free_spot(lot_id):
+    """Pop a candidate free spot id of a lot, seeding the pool if needed"""
+    redis_client = _redis()
+    if not redis_client:
+        return None
+    try:
+        if not redis_client.exists(seeded_key(lot_id)):
+            seed_pool(lot_id)
+        spot_id = redis_client.spop(pool_key(lot_id))
+        return int(spot_id) if spot_id is not None else None
+    except Exception as e:
+        print(f"Redis spot pool pop error: {e}")
+    return None
+
+
+def push_free_spots(lot_id, *spot_ids):
+    """Return spots to the pool of a lot (no-op until the pool is seeded)"""
+    redis_client = _redis()
+    if not redis_client or not spot_ids:
+        return False
+    try:
+        if redis_client.exists(seeded_key(lot_id)):
+            redis_client.sadd(pool_key(lot_id), *spot_ids)
+        return True
+    except Exception as e:
+        print(f"Redis spot pool push error: {e}")
+    return False
+
+
+def remove_free_spots(lot_id, *spot_ids):
+    """Remove spots that were taken outside the pool"""
+    redis_client = _redis()
+    if not redis_client or not spot_ids:
+        return False
+    try:
+        redis_client.srem(pool_key(lot_id), *spot_ids)
+        return True
+    except Exception as e:
+        print(f"Redis spot pool remove error: {e}")
+    return False
+
+
+def drop_pool(lot_id):
+    """Forget the pool of a lot, e.g. when the lot is deleted"""
+    redis_client = _redis()
+    if not redis_client:
+        return False
+    try:
+        redis_client.delete(pool_key(lot_id), seeded_key(lot_id))
+        return True
+    except Exception as e:
+        print(f"Redis spot pool drop error: {e}")
+    return False
+
+
+def reconcile_pool(lot_id):
+    """
+    Repair drift between the pool of a lot and the database.
+
+    Returns a dict with the number of ids added and removed.
+    """
+    redis_client = _redis()
+    if not redis_client:
+        return {'added': 0, 'removed': 0}
+
+    if not redis_client.exists(seeded_key(lot_id)):
+        seed_pool(lot_id)
+        return {'added': 0, 'removed': 0}
+
+    db_ids = _free_spot_ids(lot_id)
+    pool_ids = redis_client.smembers(pool_key(lot_id))
+
+    missing = db_ids - pool_ids
+    stale = pool_ids - db_ids
+    pipe = redis_client.pipeline()
+    if missing:
+        pipe.sadd(pool_key(lot_id), *missing)
+    if stale:
+        pipe.srem(pool_key(lot_id), *stale)
+    pipe.execute()
+    return {'added': len(missing), 'removed': len(stale)}
@@ -0,0 +1,162 @@
+"""
+SQL query profiler.
+
+Opt-in (SQL_PROFILER=1) instrumentation on the SQLAlchemy engine. Every
+statement a request issues is recorded with its run time and normalized
+shape, and a shape repeated SQL_N_PLUS_ONE_THRESHOLD or more times in one
+request is flagged as a likely N+1 pattern. The summary is returned in
+X-SQL-Profile response headers (SQL_PROFILER_HEADER=1), and requests that
+are slow or show N+1 patterns are logged.
+
+profile_queries() records the same summary around any block of code, so CI
+scripts can guard endpoints against query regressions:
+
+    with profile_queries() as profile:
+        client.get('/users/1/reservations', headers=auth)
+    profile.assert_no_n_plus_one()
+"""
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+N_PLUS_ONE_THRESHOLD = 5
+SLOW_REQUEST_MS = 500
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_BIND_PARAM = re.compile(r'%\(\w+\)s|(?<![:\w]):\w+|\$\d+|%s')
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+# Profile collected by an active profile_queries() block
+_active_profile = ContextVar('sql_profile', default=None)
+
+
+def normalize_sql(statement):
+    """Reduce a statement to its shape: literals and parameters become ?"""
+    sql = _STRING_LITERAL.sub('?', statement)
+    sql = _BIND_PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUE_LIST.sub('(...)', sql)
+    return ' '.join(sql.split())
+
+
+class QueryProfile:
+    def __init__(self, threshold=N_PLUS_ONE_THRESHOLD):
+        self.threshold = threshold
+        self.started = time.perf_counter()
+        self.count = 0
+        self.total_time = 0.0
+        # Shape -> [count, total time]
+        self.shapes = defaultdict(lambda: [0, 0.0])
+
+    def record(self, statement, elapsed):
+        shape = self.shapes[normalize_sql(statement)]
+        shape[0] += 1
+        shape[1] += elapsed
+        self.count += 1
+        self.total_time += elapsed
+
+    def n_plus_one(self):
+        """Shapes repeated at least `threshold` times, most repeated first"""
+        repeated = [(sql, count, elapsed) for sql, (count, elapsed) in self.shapes.items()
+                    if count >= self.threshold]
+        return sorted(repeated, key=lambda item: -item[1])
+
+    def summary(self):
+        return {
+            'queries': self.count,
+            'time_ms': round(self.total_time * 1000, 2),
+            'n_plus_one': [
+                {'sql': sql, 'count': count, 'time_ms': round(elapsed * 1000, 2)}
+                for sql, count, elapsed in self.n_plus_one()
+            ]
+        }
+
+    def assert_no_n_plus_one(self):
+        repeated = self.n_plus_one()
+        if repeated:
+            details = '; '.join(f'{count}x {sql}' for sql, count, _ in repeated)
+            raise AssertionError(f'N+1 query pattern detected: {details}')
+
+    def assert_max_queries(self, limit):
+        if self.count > limit:
+            raise AssertionError(f'{self.count} queries issued, expected at most {limit}')
+
+
+def _current_profile():
+    profile = _active_profile.get()
+    if profile is None and has_request_context():
+        profile = g.get('sql_profile')
+    return profile
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile() is not None:
+        conn.info.setdefault('sql_profiler_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    started = conn.info.get('sql_profiler_started')
+    if profile is not None and started:
+        profile.record(statement, time.perf_counter() - started.pop())
+
+
+def _install_listeners():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@contextmanager
+def profile_queries(threshold=N_PLUS_ONE_THRESHOLD):
+    """Profile every statement issued inside the block"""
+    _install_listeners()
+    profile = QueryProfile(threshold)
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+
+
+def init_sql_profiler(app):
+    """Profile every request when SQL_PROFILER is enabled; no-op otherwise"""
+    if not app.config.get('SQL_PROFILER'):
+        return
+    _install_listeners()
+    threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', N_PLUS_ONE_THRESHOLD)
+    slow_ms = app.config.get('SQL_SLOW_REQUEST_MS', SLOW_REQUEST_MS)
+    add_header = app.config.get('SQL_PROFILER_HEADER', False)
+
+    @app.before_request
+    def start_sql_profile():
+        g.sql_profile = QueryProfile(threshold)
+
+    @app.after_request
+    def finish_sql_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        elapsed_ms = (time.perf_counter() - profile.started) * 1000
+        repeated = profile.n_plus_one()
+        if add_header:
+            response.headers['X-SQL-Profile'] = (
+                f'queries={profile.count}; time_ms={profile.total_time * 1000:.1f}; n_plus_one={len(repeated)}'
+            )
+            if repeated:
+                sql, count, _ = repeated[0]
+                response.headers['X-SQL-N-Plus-One'] = f'{count}x {sql[:200]}'
+
+        if repeated or elapsed_ms >= slow_ms:
+            print(f"🐢 {request.method} {request.path} ({request.endpoint}): {elapsed_ms:.0f}ms, "
+                  f"{profile.count} queries in {profile.total_time * 1000:.1f}ms")
+            for sql, count, elapsed in repeated:
+                print(f"   ⚠️ N+1: {count}x ({elapsed * 1000:.1f}ms) {sql[:300]}")
+        return response
@@ -1,19 +1,47 @@
 from celery_app import celery
+from celery import chord
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown, task_prerun, task_postrun
 from datetime import datetime, timedelta
 from flask import current_app
 from flask_mail import Message
-from models import db, User, ParkingLot, ReserveSpot, ParkingSpot
+from models import db, User, ParkingLot, ReserveSpot, ParkingSpot, UserMonthlyRollup
+from archive import reservation_history
+from outbox import claim_email, due_email_ids, mark_sent, mark_failed
+from mailer import smtp_pool, build_message, send_bulk_emails, SMTP_SERVER, SMTP_PORT
 import csv
 import io
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-import smtplib
 import json
 import requests
+import time
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    """Close this worker's pooled SMTP connections on shutdown"""
+    smtp_pool.close_all()
+
+@worker_process_shutdown.connect
+def flush_task_metrics(**kwargs):
+    """Flush this worker's pending metrics; pool processes skip atexit hooks"""
+    metrics = getattr(get_app_context(), 'request_metrics', None)
+    if metrics:
+        metrics.flush()
+
+# Task id -> start time of the tasks running in this process
+_task_started = {}
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    """Record task run time for the /metrics endpoint"""
+    started = _task_started.pop(task_id, None)
+    metrics = getattr(get_app_context(), 'request_metrics', None)
+    if started is not None and metrics:
+        metrics.record_task(task.name, state or 'UNKNOWN', time.perf_counter() - started)
 
 def get_app_context():
     """Helper function to get Flask app context"""
@@ -23,213 +51,169 @@ def get_app_context():
 def send_simple_email(to_email, subject, body, html_body=None, attachment_path=None):
     """
     Simple email sender using SMTP - works without verification
+    Reuses this worker's pooled SMTP connections (see mailer.py)
     """
     try:
-        smtp_server = "localhost"
-        smtp_port = 1025
-        sender_email = "no-reply@parkease.com" 
-        sender_password = "" 
-        
-        print(f"🔧 Attempting to send email to {to_email}")
-        print(f"🔧 Subject: {subject}")
-        print(f"🔧 SMTP: {smtp_server}:{smtp_port}")
-        
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = sender_email
-        msg['To'] = to_email
-        
-        # Add text part
-        text_part = MIMEText(body, 'plain')
-        msg.attach(text_part)
-        
-        # Add HTML part if provided
-        if html_body:
-            html_part = MIMEText(html_body, 'html')
-            msg.attach(html_part)
-        
-        # Add attachment if provided
-        if attachment_path and os.path.exists(attachment_path):
-            with open(attachment_path, "rb") as attachment:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(attachment.read())
-                encoders.encode_base64(part)
-                part.add_header(
-                    'Content-Disposition',
-                    f'attachment; filename= {os.path.basename(attachment_path)}',
-                )
-                msg.attach(part)
-        
-        # Send email using MailHog
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        text = msg.as_string()
-        server.sendmail(sender_email, to_email, text)
-        server.quit()
-        
+        smtp_pool.send(build_message(to_email, subject, body, html_body, attachment_path))
         print(f"✅ Email sent successfully to MailHog: {to_email} - {subject}")
         return True
         
     except Exception as e:
         print(f"❌ Email sending failed: {str(e)}")
-        print(f"❌ Make sure MailHog is running on localhost:1025")
+        print(f"❌ Make sure MailHog is running on {SMTP_SERVER}:{SMTP_PORT}")
         return False
 
-@celery.task(bind=True)
-def send_daily_reminders(self):
-    """
-    Daily scheduled job - Send reminders to users
-    Checks if user hasn't visited recently or new parking lots are available
-    """
-    try:
-        with get_app_context().app_context():
-            print("🔄 Starting daily reminder job...")
-            
-            # Get all users
-            users = User.query.filter_by(role='user').all()
-            seven_days_ago = datetime.now() - timedelta(days=7)
-            inactive_users = []
-            
-            for user in users:
-                recent_reservation = ReserveSpot.query.filter(
-                    ReserveSpot.user_id == user.id,
-                    ReserveSpot.parking_time >= seven_days_ago
-                ).first()
-                
-                if not recent_reservation:
-                    inactive_users.append(user)
-            
-            new_lots = ParkingLot.query.all()  
-            
-            sent_count = 0
-            
-            # Send reminders to inactive users
-            for user in inactive_users:
-                subject = "Parking Reminder - Book Your Spot Today!"
-                
-                body = f"""
-Hello {user.username}!
+# Users per send_reminder_chunk subtask
+REMINDER_CHUNK_SIZE = 500
+
+def _lot_summary(lots):
+    """Plain text list of lots for reminder emails"""
+    body = ""
+    for lot in lots:
+        body += f"""
+* {lot['location_name']}
+   Address: {lot['address']}
+   Price: Rs {lot['price']}/hour
+   Available Spots: {lot['available_slots']}/{lot['number_of_slots']}
+"""
+    return body
+
+def _inactive_reminder_email(username, email, lots):
+    body = f"""
+Hello {username}!
 
 We noticed you haven't booked a parking spot recently. 
 
 Here are some available parking lots for you:
 """
-                
-                # Add available lots info
-                for lot in new_lots[:3]:  # Show top 3 lots
-                    body += f"""
-* {lot.location_name}
-   Address: {lot.address}
-   Price: Rs {lot.price}/hour
-   Available Spots: {lot.available_slots}/{lot.number_of_slots}
-"""
-                
-                body += """
+    
+    # Add available lots info
+    body += _lot_summary(lots[:3])  # Show top 3 lots
+    
+    body += """
 
 Book your parking spot now to secure your place!
 
 Best regards,
 Parking Management Team
 """
-                
-                # Send email
-                if send_simple_email(user.email, subject, body):
-                    sent_count += 1
-            
-            # Also notify about new parking lots to all users
-            if new_lots:
-                active_users = [user for user in users if user not in inactive_users]
-                for user in active_users:  # Limit to 5 users for testing
-                    subject = "New Parking Lots Available!"
-                    
-                    body = f"""
-Hello {user.username}!
+    return {'to_email': email, 'subject': "Parking Reminder - Book Your Spot Today!", 'body': body}
+
+def _new_lots_email(username, email, lots):
+    body = f"""
+Hello {username}!
 
 Great news! New parking lots are now available:
 
 """
-                    for lot in new_lots[:2]:
-                        body += f"""
-* {lot.location_name}
-   Address: {lot.address}
-   Price: Rs {lot.price}/hour
-   Available Spots: {lot.available_slots}/{lot.number_of_slots}
+    for lot in lots[:2]:
+        body += f"""
+* {lot['location_name']}
+   Address: {lot['address']}
+   Price: Rs {lot['price']}/hour
+   Available Spots: {lot['available_slots']}/{lot['number_of_slots']}
 
 """
-                    
-                    body += """
+    
+    body += """
 Check out these new locations and book your spot today!
 
 Best regards,
 ParkEase-Smart Parking Solutions
 """
-                    
-                    if send_simple_email(user.email, subject, body):
-                        sent_count += 1
+    return {'to_email': email, 'subject': "New Parking Lots Available!", 'body': body}
+
+@celery.task(bind=True)
+def send_daily_reminders(self):
+    """
+    Daily scheduled job - Send reminders to users
+    Checks if user hasn't visited recently or new parking lots are available
+    Coordinator: splits users into inactive/active with one NOT EXISTS query,
+    streamed in chunks that are fanned out to send_reminder_chunk subtasks
+    """
+    try:
+        with get_app_context().app_context():
+            print("🔄 Starting daily reminder job...")
+            
+            seven_days_ago = datetime.now() - timedelta(days=7)
             
-            print(f"✅ Daily reminder job completed. Sent {sent_count} emails.")
-            return f"Sent {sent_count} reminder emails successfully"
+            lots = [{
+                'location_name': lot.location_name,
+                'address': lot.address,
+                'price': lot.price,
+                'available_slots': lot.available_slots,
+                'number_of_slots': lot.number_of_slots
+            } for lot in ParkingLot.query.order_by(ParkingLot.id).limit(3).all()]
+            
+            # Users with a reservation in the last 7 days are active
+            recently_parked = db.exists().where(
+                ReserveSpot.user_id == User.id,
+                ReserveSpot.parking_time >= seven_days_ago
+            )
+            users = db.session.query(
+                User.username, User.email, recently_parked.label('active')
+            ).filter(User.role == 'user').order_by(User.id).yield_per(REMINDER_CHUNK_SIZE)
+            
+            chunk_count = user_count = 0
+            chunk = []
+            for username, email, active in users:
+                chunk.append([username, email, bool(active)])
+                if len(chunk) >= REMINDER_CHUNK_SIZE:
+                    send_reminder_chunk.delay(chunk, lots)
+                    chunk_count += 1
+                    user_count += len(chunk)
+                    chunk = []
+            if chunk:
+                send_reminder_chunk.delay(chunk, lots)
+                chunk_count += 1
+                user_count += len(chunk)
+            
+            print(f"✅ Daily reminder job dispatched {user_count} users in {chunk_count} chunks.")
+            return f"Dispatched reminders for {user_count} users in {chunk_count} chunks"
             
     except Exception as e:
         print(f"❌ Daily reminder job failed: {str(e)}")
         raise self.retry(countdown=300, max_retries=3)
 
 @celery.task(bind=True)
-def send_monthly_reports(self):
+def send_reminder_chunk(self, recipients, lots):
     """
-    Monthly scheduled job - Send activity reports to users
-    Creates HTML report with user's monthly parking activity
+    Daily reminder subtask - Email one chunk of [username, email, active] users
+    Inactive users get a booking reminder; active users hear about parking lots
     """
     try:
-        with get_app_context().app_context():
-            print("🔄 Starting monthly report job...")
-            
-            # Get current month
-            now = datetime.now()
-            first_day = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            # Get all users who had activity this month
-            users_with_activity = db.session.query(User).join(ReserveSpot).filter(
-                ReserveSpot.parking_time >= first_day
-            ).distinct().all()
-            
-            # If no users with activity, send to all users for demo
-            if not users_with_activity:
-                users_with_activity = User.query.filter_by(role='user').limit(5).all()
-            
-            sent_count = 0
-            
-            for user in users_with_activity:
-                # Get user's monthly data
-                user_reservations = ReserveSpot.query.filter(
-                    ReserveSpot.user_id == user.id,
-                    ReserveSpot.parking_time >= first_day
-                ).all()
-                
-                # Calculate statistics
-                total_bookings = len(user_reservations)
-                total_spent = sum(float(r.parking_cost or 0) for r in user_reservations if r.leaving_time)
-                total_hours = 0
-                
-                lot_usage = {}
-                for reservation in user_reservations:
-                    if reservation.leaving_time and reservation.parking_time:
-                        duration = (reservation.leaving_time - reservation.parking_time).total_seconds() / 3600
-                        total_hours += duration
-                    
-                    # Get lot information
-                    spot = ParkingSpot.query.get(reservation.spot_id)
-                    if spot:
-                        lot = ParkingLot.query.get(spot.lot_id)
-                        if lot:
-                            lot_name = lot.location_name
-                            lot_usage[lot_name] = lot_usage.get(lot_name, 0) + 1
-                
-                # Find most used lot
-                most_used_lot = max(lot_usage.items(), key=lambda x: x[1]) if lot_usage else ("None", 0)
-                
-                # Create HTML report
-                html_report = f"""
+        emails = []
+        for username, email, active in recipients:
+            if not active:
+                emails.append(_inactive_reminder_email(username, email, lots))
+            elif lots:
+                emails.append(_new_lots_email(username, email, lots))
+        
+        # Send everything over this worker's pooled SMTP connections
+        sent_count = send_bulk_emails(emails)
+        print(f"✅ Reminder chunk completed. Sent {sent_count} emails.")
+        return f"Sent {sent_count} reminder emails successfully"
+        
+    except Exception as e:
+        print(f"❌ Reminder chunk failed: {str(e)}")
+        raise self.retry(countdown=300, max_retries=3)
+
+# Users per send_report_chunk subtask
+REPORT_CHUNK_SIZE = 200
+
+def _monthly_report_email(report, now):
+    """
+    Build the monthly report email of one user
+    report is a coordinator row: [username, email, bookings, spent, hours, [[lot_name, bookings], ...]]
+    """
+    username, email, total_bookings, total_spent, total_hours, lot_usage = report
+    lot_usage = dict(lot_usage)
+    
+    # Find most used lot
+    most_used_lot = max(lot_usage.items(), key=lambda x: x[1]) if lot_usage else ("None", 0)
+    
+    # Create HTML report
+    html_report = f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -251,7 +235,7 @@ def send_monthly_reports(self):
     <div class="container">
         <div class="header">
             <h1>Monthly Parking Report</h1>
-            <p>{now.strftime('%B %Y')} Activity Summary for {user.username}</p>
+            <p>{now.strftime('%B %Y')} Activity Summary for {username}</p>
         </div>
         
         <div class="stats">
@@ -279,11 +263,11 @@ def send_monthly_reports(self):
         <div class="section">
             <h3>Location Usage</h3>
 """
-                
-                for lot_name, count in sorted(lot_usage.items(), key=lambda x: x[1], reverse=True):
-                    html_report += f'<div class="lot-item">* {lot_name}: {count} bookings</div>'
-                
-                html_report += f"""
+    
+    for lot_name, count in sorted(lot_usage.items(), key=lambda x: x[1], reverse=True):
+        html_report += f'<div class="lot-item">* {lot_name}: {count} bookings</div>'
+    
+    html_report += f"""
         </div>
         
         <div class="section">
@@ -303,11 +287,11 @@ def send_monthly_reports(self):
 </body>
 </html>
 """
-                
-                # Text version for email clients that don't support HTML
-                text_report = f"""
+    
+    # Text version for email clients that don't support HTML
+    text_report = f"""
 Monthly Parking Report - {now.strftime('%B %Y')}
-Hello {user.username}!
+Hello {username}!
 
 Your parking activity summary:
 * Total Bookings: {total_bookings}
@@ -317,28 +301,156 @@ Your parking activity summary:
 
 Location Usage:
 """
-                for lot_name, count in sorted(lot_usage.items(), key=lambda x: x[1], reverse=True):
-                    text_report += f"* {lot_name}: {count} bookings\n"
-                
-                text_report += """
+    for lot_name, count in sorted(lot_usage.items(), key=lambda x: x[1], reverse=True):
+        text_report += f"* {lot_name}: {count} bookings\n"
+    
+    text_report += """
 Thanks for using our parking service!
 
 Best regards,
 ParkEase-Smart Parking Solutions
 """
-                
-                # Send email with HTML report
-                subject = f"Your Monthly Parking Report - {now.strftime('%B %Y')}"
-                
-                if send_simple_email(user.email, subject, text_report, html_report):
-                    sent_count += 1
+    
+    subject = f"Your Monthly Parking Report - {now.strftime('%B %Y')}"
+    
+    return {'to_email': email, 'subject': subject, 'body': text_report, 'html_body': html_report}
+
+def _monthly_activity(first_day):
+    """
+    Stream this month's per-user activity from the rollups with one grouped query
+    Yields coordinator rows, see _monthly_report_email
+    """
+    rows = db.session.query(
+        User.id,
+        User.username,
+        User.email,
+        ParkingLot.location_name,
+        db.func.sum(UserMonthlyRollup.bookings),
+        db.func.sum(UserMonthlyRollup.spent),
+        db.func.sum(UserMonthlyRollup.occupied_minutes)
+    ).join(
+        User, User.id == UserMonthlyRollup.user_id
+    ).outerjoin(
+        ParkingLot, ParkingLot.id == UserMonthlyRollup.lot_id
+    ).filter(
+        UserMonthlyRollup.month_start == first_day
+    ).group_by(
+        User.id, User.username, User.email, ParkingLot.location_name
+    ).order_by(User.id).yield_per(1000)
+    
+    report = None
+    current_user_id = None
+    for user_id, username, email, lot_name, bookings, spent, minutes in rows:
+        if user_id != current_user_id:
+            if report:
+                yield report
+            current_user_id = user_id
+            report = [username, email, 0, 0.0, 0.0, []]
+        report[2] += int(bookings or 0)
+        report[3] += float(spent or 0)
+        report[4] += float(minutes or 0) / 60
+        if lot_name:
+            report[5].append([lot_name, int(bookings or 0)])
+    if report:
+        yield report
+
+@celery.task(bind=True)
+def send_monthly_reports(self):
+    """
+    Monthly scheduled job - Send activity reports to users
+    Creates HTML report with user's monthly parking activity
+    Coordinator: reads per-user aggregates in one grouped query and replaces
+    itself with a chord of send_report_chunk subtasks, so this task id
+    reports progress and finally the finalize_monthly_reports summary
+    """
+    try:
+        with get_app_context().app_context():
+            print("🔄 Starting monthly report job...")
+            
+            # Get current month
+            now = datetime.now()
+            first_day = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
             
-            print(f"✅ Monthly report job completed. Sent {sent_count} reports.")
-            return f"Sent {sent_count} monthly reports successfully"
+            chunks = []
+            chunk = []
+            for report in _monthly_activity(first_day):
+                chunk.append(report)
+                if len(chunk) >= REPORT_CHUNK_SIZE:
+                    chunks.append(chunk)
+                    chunk = []
+            if chunk:
+                chunks.append(chunk)
+            
+            # If no users with activity, send to all users for demo
+            if not chunks:
+                demo_users = User.query.filter_by(role='user').limit(5).all()
+                if demo_users:
+                    chunks.append([[user.username, user.email, 0, 0.0, 0.0, []] for user in demo_users])
             
     except Exception as e:
         print(f"❌ Monthly report job failed: {str(e)}")
         raise self.retry(countdown=300, max_retries=3)
+    
+    total = sum(len(chunk) for chunk in chunks)
+    run_id = self.request.id
+    
+    if self.request.called_directly:
+        # No worker (e.g. the sync fallback in TasksResource): render and send inline
+        results = [send_report_chunk(chunk, now.isoformat(), None, total) for chunk in chunks]
+        return finalize_monthly_reports(results, total)
+    
+    self.update_state(state='PROGRESS', meta={
+        'status': f'Queued {total} reports in {len(chunks)} chunks',
+        'current': 0,
+        'total': total
+    })
+    print(f"📨 Monthly report job fanned out {total} reports in {len(chunks)} chunks")
+    return self.replace(chord(
+        [send_report_chunk.s(chunk, now.isoformat(), run_id, total) for chunk in chunks],
+        finalize_monthly_reports.s(total)
+    ))
+
+def _monthly_report_progress(task, run_id, users, sent, total):
+    """Add a finished chunk to the run's counters and publish them on the coordinator task"""
+    redis_client = getattr(get_app_context(), 'redis_client', None)
+    if not run_id or not redis_client:
+        return
+    try:
+        key = f'monthly_reports_progress:{run_id}'
+        pipe = redis_client.pipeline()
+        pipe.hincrby(key, 'users', users)
+        pipe.hincrby(key, 'sent', sent)
+        pipe.expire(key, 86400)
+        done, sent_total, _ = pipe.execute()
+        task.update_state(task_id=run_id, state='PROGRESS', meta={
+            'status': f'Sent {sent_total} of {total} reports',
+            'current': done,
+            'total': total
+        })
+    except Exception as e:
+        print(f"⚠️ Monthly report progress update failed: {e}")
+
+@celery.task(bind=True)
+def send_report_chunk(self, reports, generated_at, run_id, total):
+    """
+    Monthly report subtask - Render and send the reports of one chunk of users
+    """
+    now = datetime.fromisoformat(generated_at)
+    emails = [_monthly_report_email(report, now) for report in reports]
+    
+    # Send everything over this worker's pooled SMTP connections
+    sent_count = send_bulk_emails(emails)
+    _monthly_report_progress(self, run_id, len(reports), sent_count, total)
+    return sent_count
+
+@celery.task(bind=True)
+def finalize_monthly_reports(self, results, total):
+    """
+    Monthly report chord callback - Summarize the chunk results
+    """
+    sent_count = sum(results)
+    print(f"✅ Monthly report job completed. Sent {sent_count} reports.")
+    return f"Sent {sent_count} of {total} monthly reports successfully"
 
 @celery.task(bind=True)
 def export_user_data_csv(self, user_id, export_type="full"):
@@ -354,8 +466,15 @@ def export_user_data_csv(self, user_id, export_type="full"):
             if not user:
                 return {"status": "error", "message": "User not found"}
             
-            # Get user's reservations
-            reservations = ReserveSpot.query.filter_by(user_id=user_id).order_by(ReserveSpot.parking_time.desc()).all()
+            # Get user's hot and archived reservations with their lot names
+            history = reservation_history.c
+            reservations = db.session.query(
+                history.id, history.spot_id, history.parking_time, history.leaving_time,
+                history.parking_cost, history.transaction_id, history.payment_method,
+                ParkingLot.location_name
+            ).select_from(reservation_history).outerjoin(
+                ParkingLot, history.lot_id == ParkingLot.id
+            ).filter(history.user_id == user_id).order_by(history.parking_time.desc()).all()
             
             # Create CSV data
             csv_data = []
@@ -367,13 +486,7 @@ def export_user_data_csv(self, user_id, export_type="full"):
             
             for reservation in reservations:
                 try:
-                    # Get spot and lot info
-                    spot = ParkingSpot.query.get(reservation.spot_id)
-                    lot_name = "Unknown"
-                    if spot:
-                        lot = ParkingLot.query.get(spot.lot_id)
-                        if lot:
-                            lot_name = lot.location_name
+                    lot_name = reservation.location_name or "Unknown"
                     
                     # Calculate duration
                     duration = 0
@@ -458,38 +571,38 @@ ParkEase-Smart Parking Solutions
             "message": f"Export failed: {str(e)}"
         }
 
-@celery.task(bind=True)
-def send_booking_confirmation_email(self, reservation_id):
+def _reservation_details(reservation_id):
+    """Load a reservation with its user, spot and lot in one query"""
+    return db.session.query(ReserveSpot, User, ParkingSpot, ParkingLot).join(
+        User, ReserveSpot.user_id == User.id
+    ).join(
+        ParkingSpot, ReserveSpot.spot_id == ParkingSpot.id
+    ).join(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).filter(ReserveSpot.id == reservation_id).first()
+
+def build_booking_confirmation_email(reservation_id):
     """
-    Send booking confirmation email to user
+    Build the booking confirmation email of a reservation
+    Returns send_simple_email keyword arguments, or None if the reservation data is missing
     """
-    try:
-        with get_app_context().app_context():
-            reservation = ReserveSpot.query.get(reservation_id)
-            if not reservation:
-                print(f"❌ Reservation {reservation_id} not found")
-                return f"Reservation {reservation_id} not found"
-            
-            user = User.query.get(reservation.user_id)
-            parking_spot = ParkingSpot.query.get(reservation.spot_id)
-            parking_lot = ParkingLot.query.get(parking_spot.lot_id) if parking_spot else None
-            
-            if not user or not parking_lot or not parking_spot:
-                print(f"❌ Missing data for reservation {reservation_id}")
-                return f"Missing data for reservation {reservation_id}"
-            
-            subject = f"Booking Confirmation - {parking_lot.location_name}"
-            
-            # Calculate duration properly handling None leaving_time
-            if reservation.leaving_time:
-                duration_hours = (reservation.leaving_time - reservation.parking_time).total_seconds() / 3600
-                duration_text = f"{duration_hours:.1f} hours"
-                end_time_text = reservation.leaving_time.strftime('%Y-%m-%d %H:%M')
-            else:
-                duration_text = "Open-ended"
-                end_time_text = "Open"
-            
-            body = f"""
+    details = _reservation_details(reservation_id)
+    if not details:
+        return None
+    reservation, user, parking_spot, parking_lot = details
+    
+    subject = f"Booking Confirmation - {parking_lot.location_name}"
+    
+    # Calculate duration properly handling None leaving_time
+    if reservation.leaving_time:
+        duration_hours = (reservation.leaving_time - reservation.parking_time).total_seconds() / 3600
+        duration_text = f"{duration_hours:.1f} hours"
+        end_time_text = reservation.leaving_time.strftime('%Y-%m-%d %H:%M')
+    else:
+        duration_text = "Open-ended"
+        end_time_text = "Open"
+    
+    body = f"""
 Dear {user.username},
 
 Your parking booking has been confirmed!
@@ -507,69 +620,50 @@ Please arrive on time and remember your booking details.
 
 Best regards,
 ParkEase-Smart Parking Solutions
-            """
-            
-            html_body = f"""
-            <html>
-            <body>
-                <h2>Booking Confirmation</h2>
-                <p>Dear <strong>{user.username}</strong>,</p>
-                <p>Your parking booking has been confirmed!</p>
-                
-                <h3>Booking Details:</h3>
-                <ul>
-                    <li><strong>Parking Lot:</strong> {parking_lot.location_name}</li>
-                    <li><strong>Address:</strong> {parking_lot.address}</li>
-                    <li><strong>Spot ID:</strong> {parking_spot.id}</li>
-                    <li><strong>Start Time:</strong> {reservation.parking_time.strftime('%Y-%m-%d %H:%M')}</li>
-                    <li><strong>End Time:</strong> {end_time_text}</li>
-                    <li><strong>Duration:</strong> {duration_text}</li>
-                    <li><strong>Total Cost:</strong> Rs {reservation.parking_cost:.2f}</li>
-                </ul>
-                
-                <p>Please arrive on time and remember your booking details.</p>
-                
-                <p>Best regards,<br>
-                <strong>Parking Management System</strong></p>
-            </body>
-            </html>
-            """
-            
-            if send_simple_email(user.email, subject, body, html_body):
-                print(f"✅ Booking confirmation email sent to {user.email}")
-                return f"Booking confirmation email sent to {user.email}"
-            else:
-                print(f"❌ Failed to send booking confirmation email to {user.email}")
-                return f"Failed to send booking confirmation email to {user.email}"
-                
-    except Exception as e:
-        print(f"❌ Booking confirmation email task failed: {str(e)}")
-        return f"Booking confirmation email task failed: {str(e)}"
+    """
+    
+    html_body = f"""
+    <html>
+    <body>
+        <h2>Booking Confirmation</h2>
+        <p>Dear <strong>{user.username}</strong>,</p>
+        <p>Your parking booking has been confirmed!</p>
+        
+        <h3>Booking Details:</h3>
+        <ul>
+            <li><strong>Parking Lot:</strong> {parking_lot.location_name}</li>
+            <li><strong>Address:</strong> {parking_lot.address}</li>
+            <li><strong>Spot ID:</strong> {parking_spot.id}</li>
+            <li><strong>Start Time:</strong> {reservation.parking_time.strftime('%Y-%m-%d %H:%M')}</li>
+            <li><strong>End Time:</strong> {end_time_text}</li>
+            <li><strong>Duration:</strong> {duration_text}</li>
+            <li><strong>Total Cost:</strong> Rs {reservation.parking_cost:.2f}</li>
+        </ul>
+        
+        <p>Please arrive on time and remember your booking details.</p>
+        
+        <p>Best regards,<br>
+        <strong>Parking Management System</strong></p>
+    </body>
+    </html>
+    """
+    
+    return {'to_email': user.email, 'subject': subject, 'body': body, 'html_body': html_body}
 
-@celery.task(bind=True)
-def send_parking_release_email(self, reservation_id):
+def build_parking_release_email(reservation_id):
     """
-    Send parking release/checkout email to user
+    Build the parking release/checkout email of a reservation
+    Returns send_simple_email keyword arguments, or None if the reservation data is missing
     """
-    try:
-        with get_app_context().app_context():
-            reservation = ReserveSpot.query.get(reservation_id)
-            if not reservation:
-                print(f"❌ Reservation {reservation_id} not found")
-                return f"Reservation {reservation_id} not found"
-            
-            user = User.query.get(reservation.user_id)
-            parking_spot = ParkingSpot.query.get(reservation.spot_id)
-            parking_lot = ParkingLot.query.get(parking_spot.lot_id) if parking_spot else None
-            
-            if not user or not parking_lot or not parking_spot:
-                print(f"❌ Missing data for reservation {reservation_id}")
-                return f"Missing data for reservation {reservation_id}"
-            
-            subject = f"Parking Released - {parking_lot.location_name}"
-            actual_end_time = reservation.leaving_time or datetime.now()
-            
-            body = f"""
+    details = _reservation_details(reservation_id)
+    if not details:
+        return None
+    reservation, user, parking_spot, parking_lot = details
+    
+    subject = f"Parking Released - {parking_lot.location_name}"
+    actual_end_time = reservation.leaving_time or datetime.now()
+    
+    body = f"""
 Dear {user.username},
 
 Your parking session has been completed and the spot has been released.
@@ -587,44 +681,208 @@ Thank you for using our parking service!
 
 Best regards,
 ParkEase-Smart Parking Solutions
-            """
-            
-            html_body = f"""
-            <html>
-            <body>
-                <h2>Parking Session Completed</h2>
-                <p>Dear <strong>{user.username}</strong>,</p>
-                <p>Your parking session has been completed and the spot has been released.</p>
-                
-                <h3>Session Summary:</h3>
-                <ul>
-                    <li><strong>Parking Lot:</strong> {parking_lot.location_name}</li>
-                    <li><strong>Address:</strong> {parking_lot.address}</li>
-                    <li><strong>Spot ID:</strong> {parking_spot.id}</li>
-                    <li><strong>Start Time:</strong> {reservation.parking_time.strftime('%Y-%m-%d %H:%M')}</li>
-                    <li><strong>End Time:</strong> {actual_end_time.strftime('%Y-%m-%d %H:%M')}</li>
-                    <li><strong>Duration:</strong> {(actual_end_time - reservation.parking_time).total_seconds() / 3600:.1f} hours</li>
-                    <li><strong>Total Cost:</strong> Rs {reservation.parking_cost:.2f}</li>
-                </ul>
-                
-                <p>Thank you for using our parking service!</p>
+    """
+    
+    html_body = f"""
+    <html>
+    <body>
+        <h2>Parking Session Completed</h2>
+        <p>Dear <strong>{user.username}</strong>,</p>
+        <p>Your parking session has been completed and the spot has been released.</p>
+        
+        <h3>Session Summary:</h3>
+        <ul>
+            <li><strong>Parking Lot:</strong> {parking_lot.location_name}</li>
+            <li><strong>Address:</strong> {parking_lot.address}</li>
+            <li><strong>Spot ID:</strong> {parking_spot.id}</li>
+            <li><strong>Start Time:</strong> {reservation.parking_time.strftime('%Y-%m-%d %H:%M')}</li>
+            <li><strong>End Time:</strong> {actual_end_time.strftime('%Y-%m-%d %H:%M')}</li>
+            <li><strong>Duration:</strong> {(actual_end_time - reservation.parking_time).total_seconds() / 3600:.1f} hours</li>
+            <li><strong>Total Cost:</strong> Rs {reservation.parking_cost:.2f}</li>
+        </ul>
+        
+        <p>Thank you for using our parking service!</p>
+        
+        <p>Best regards,<br>
+        <strong>ParkEase-Smart Parking Solutions</strong></p>
+    </body>
+    </html>
+    """
+    
+    return {'to_email': user.email, 'subject': subject, 'body': body, 'html_body': html_body}
+
+# Email kinds that can be queued in the outbox
+EMAIL_BUILDERS = {
+    'booking_confirmation': build_booking_confirmation_email,
+    'parking_release': build_parking_release_email,
+}
+
+@celery.task(bind=True)
+def send_booking_confirmation_email(self, reservation_id):
+    """
+    Send booking confirmation email to user
+    """
+    try:
+        with get_app_context().app_context():
+            message = build_booking_confirmation_email(reservation_id)
+            if not message:
+                print(f"❌ Missing data for reservation {reservation_id}")
+                return f"Missing data for reservation {reservation_id}"
+            
+            if send_simple_email(**message):
+                print(f"✅ Booking confirmation email sent to {message['to_email']}")
+                return f"Booking confirmation email sent to {message['to_email']}"
+            else:
+                print(f"❌ Failed to send booking confirmation email to {message['to_email']}")
+                return f"Failed to send booking confirmation email to {message['to_email']}"
                 
-                <p>Best regards,<br>
-                <strong>ParkEase-Smart Parking Solutions</strong></p>
-            </body>
-            </html>
-            """
-            
-            if send_simple_email(user.email, subject, body, html_body):
-                print(f"✅ Parking release email sent to {user.email}")
-                return f"Parking release email sent to {user.email}"
+    except Exception as e:
+        print(f"❌ Booking confirmation email task failed: {str(e)}")
+        return f"Booking confirmation email task failed: {str(e)}"
+
+@celery.task(bind=True)
+def send_parking_release_email(self, reservation_id):
+    """
+    Send parking release/checkout email to user
+    """
+    try:
+        with get_app_context().app_context():
+            message = build_parking_release_email(reservation_id)
+            if not message:
+                print(f"❌ Missing data for reservation {reservation_id}")
+                return f"Missing data for reservation {reservation_id}"
+            
+            if send_simple_email(**message):
+                print(f"✅ Parking release email sent to {message['to_email']}")
+                return f"Parking release email sent to {message['to_email']}"
             else:
-                print(f"❌ Failed to send parking release email to {user.email}")
-                return f"Failed to send parking release email to {user.email}"
+                print(f"❌ Failed to send parking release email to {message['to_email']}")
+                return f"Failed to send parking release email to {message['to_email']}"
                 
     except Exception as e:
         print(f"❌ Parking release email task failed: {str(e)}")
         return f"Parking release email task failed: {str(e)}"
 
+def _deliver_outbox_entry(outbox_id):
+    """Claim and send one outbox email; returns True if it was sent by this worker"""
+    entry = claim_email(outbox_id)
+    if not entry:
+        # Already sent, or another worker holds it
+        return False
+    
+    builder = EMAIL_BUILDERS.get(entry.kind)
+    message = builder(entry.reservation_id) if builder else None
+    if not message:
+        mark_failed(entry, f"Cannot build {entry.kind} email for reservation {entry.reservation_id}", permanent=True)
+        return False
+    
+    if send_simple_email(**message):
+        mark_sent(entry)
+        return True
+    
+    mark_failed(entry, f"SMTP delivery to {message['to_email']} failed")
+    return False
+
+@celery.task(bind=True, ignore_result=True)
+def deliver_outbox_email(self, outbox_id):
+    """
+    Deliver one outbox email, dispatched right after its reservation committed
+    """
+    try:
+        with get_app_context().app_context():
+            sent = _deliver_outbox_entry(outbox_id)
+            return {"outbox_id": outbox_id, "sent": sent}
+            
+    except Exception as e:
+        print(f"❌ Outbox email {outbox_id} delivery failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@celery.task(bind=True)
+def drain_email_outbox(self, batch_size=100):
+    """
+    Periodic job - Deliver outbox emails whose dispatch was lost, whose retry is
+    due, or whose worker died mid-send
+    """
+    try:
+        with get_app_context().app_context():
+            sent = skipped = 0
+            for outbox_id in due_email_ids(batch_size):
+                if _deliver_outbox_entry(outbox_id):
+                    sent += 1
+                else:
+                    skipped += 1
+            
+            if sent or skipped:
+                print(f"📬 Email outbox drained: {sent} sent, {skipped} failed or skipped")
+            return {"sent": sent, "skipped": skipped}
+            
+    except Exception as e:
+        print(f"❌ Email outbox drain failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@celery.task(bind=True)
+def archive_old_reservations(self):
+    """
+    Periodic job - Move completed reservations older than ARCHIVE_AFTER_DAYS to the archive table
+    """
+    try:
+        with get_app_context().app_context():
+            from archive import archive_completed, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+            
+            moved = archive_completed(
+                current_app.config.get('ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS),
+                current_app.config.get('ARCHIVE_BATCH_SIZE', ARCHIVE_BATCH_SIZE)
+            )
+            
+            if moved:
+                print(f"🗄️ Archived {moved} completed reservations")
+            return {"archived": moved}
+            
+    except Exception as e:
+        print(f"❌ Reservation archival failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@celery.task(bind=True)
+def ensure_reserve_spot_partitions(self):
+    """
+    Periodic job - Create the coming months' reserve_spot partitions (PostgreSQL only)
+    """
+    try:
+        with get_app_context().app_context():
+            from partitions import ensure_partitions, PARTITION_MONTHS_AHEAD
+            
+            created = ensure_partitions(current_app.config.get('PARTITION_MONTHS_AHEAD', PARTITION_MONTHS_AHEAD))
+            
+            if created:
+                print(f"🗂️ Created reserve_spot partitions: {', '.join(created)}")
+            return {"created": created}
+            
+    except Exception as e:
+        print(f"❌ Partition maintenance failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@celery.task(bind=True)
+def reconcile_spot_pools(self):
+    """
+    Periodic job - Repair drift between the Redis free-spot pools and the database
+    """
+    try:
+        with get_app_context().app_context():
+            from spot_pool import reconcile_pool
+            
+            added = removed = 0
+            for (lot_id,) in db.session.query(ParkingLot.id).all():
+                result = reconcile_pool(lot_id)
+                added += result['added']
+                removed += result['removed']
+            
+            if added or removed:
+                print(f"🔧 Spot pool drift repaired: {added} added, {removed} removed")
+            return {"added": added, "removed": removed}
+            
+    except Exception as e:
+        print(f"❌ Spot pool reconciliation failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
 if __name__ == '__main__':
    pass
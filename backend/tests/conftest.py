@@ -0,0 +1,61 @@
+"""
+Shared fixtures: the app runs against a throwaway SQLite database, without
+Redis, and with Celery on the in-memory transport.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.close(_db_fd)
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+os.environ['JWT_SECRET_KEY'] = 'test-secret-key-for-the-test-suite-only'
+os.environ['REDIS_PORT'] = '1'
+os.environ['CELERY_BROKER_URL'] = 'memory://'
+os.environ['CELERY_RESULT_BACKEND'] = 'cache+memory://'
+
+from flask_jwt_extended import create_access_token
+from app import app as flask_app, db
+from models import User
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def users(app):
+    """Auth headers of an admin and two regular users"""
+    with app.app_context():
+        accounts = [
+            User(username='admin', email='admin@example.com', password='password', role='admin'),
+            User(username='alice', email='alice@example.com', password='password', vehicle_number='KA01A1111'),
+            User(username='bob', email='bob@example.com', password='password', vehicle_number='KA01B2222'),
+        ]
+        db.session.add_all(accounts)
+        db.session.commit()
+        return {
+            account.username: {'Authorization': f'Bearer {create_access_token(identity=str(account.id))}'}
+            for account in accounts
+        }
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if os.path.exists(_db_path):
+        os.remove(_db_path)
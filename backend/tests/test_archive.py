@@ -0,0 +1,30 @@
+"""Archived reservations keep their id, so reserve_spot must never reuse it."""
+from archive import archive_completed, reservation_history
+from models import db, User
+
+
+def test_archived_reservation_ids_are_not_reused(app, client, users):
+    response = client.post('/parking-lots', json={
+        'location_name': 'Central', 'price': 10, 'address': 'Main Street',
+        'pincode': '560001', 'number_of_slots': 1
+    }, headers=users['admin'])
+    lot_id = response.get_json()['lot']['id']
+
+    booked = client.post('/booking/book-spot', json={'lot_id': lot_id, 'vehicle_number': 'KA01B2222'}, headers=users['bob'])
+    assert booked.status_code == 201
+    with app.app_context():
+        bob_id = User.query.filter_by(username='bob').one().id
+    assert client.delete(f'/users/{bob_id}?archive=1', headers=users['admin']).status_code == 200
+
+    rebooked = client.post('/booking/book-spot', json={'lot_id': lot_id, 'vehicle_number': 'KA01A1111'}, headers=users['alice'])
+    assert rebooked.status_code == 201
+    reservation_id = rebooked.get_json()['reservation']['id']
+    assert reservation_id != booked.get_json()['reservation']['id']
+    released = client.post('/booking/release-spot', json={'reservation_id': reservation_id, 'payment_method': 'cash'},
+                           headers=users['alice'])
+    assert released.status_code == 200
+
+    with app.app_context():
+        assert archive_completed(older_than_days=0) == 1
+        ids = db.session.execute(db.select(reservation_history.c.id)).scalars().all()
+        assert len(ids) == len(set(ids)) == 2
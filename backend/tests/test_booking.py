@@ -0,0 +1,28 @@
+"""A spot is only freed by the reservation that holds it."""
+
+
+def test_cancelling_old_reservation_keeps_newer_booking_of_same_spot(app, client, users):
+    response = client.post('/parking-lots', json={
+        'location_name': 'Central', 'price': 10, 'address': 'Main Street',
+        'pincode': '560001', 'number_of_slots': 1
+    }, headers=users['admin'])
+    lot_id = response.get_json()['lot']['id']
+
+    def book(user, vehicle_number):
+        return client.post('/booking/book-spot', json={'lot_id': lot_id, 'vehicle_number': vehicle_number},
+                           headers=users[user])
+
+    first = book('alice', 'KA01A1111').get_json()['reservation']
+    released = client.post('/booking/release-spot', json={'reservation_id': first['id'], 'payment_method': 'cash'},
+                           headers=users['alice'])
+    assert released.status_code == 200
+    second = book('alice', 'KA01A1111')
+    assert second.status_code == 201
+    assert second.get_json()['reservation']['spot_id'] == first['spot_id']
+
+    assert client.delete(f"/reservations/{first['id']}", headers=users['alice']).status_code == 200
+    assert book('bob', 'KA01B2222').status_code != 201
+
+    occupied = client.post('/booking/occupy-spot', json={'reservation_id': second.get_json()['reservation']['id']},
+                           headers=users['alice'])
+    assert occupied.status_code == 200
@@ -0,0 +1,90 @@
+"""Endpoints that read booking history issue a fixed number of queries."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, User, ParkingLot, ParkingSpot, ReserveSpot
+from rollups import rebuild_rollups
+from sql_profiler import profile_queries
+
+LOTS = 3
+SPOTS_PER_LOT = 4
+RESERVATIONS_PER_USER = 12
+
+
+@pytest.fixture
+def history(app, users):
+    """Completed reservations for both users spread over every lot"""
+    with app.app_context():
+        now = datetime.now()
+        for index in range(LOTS):
+            lot = ParkingLot(location_name=f'Lot {index}', price=10, address=f'Street {index}',
+                             pincode='560001', number_of_slots=SPOTS_PER_LOT, available_slots=SPOTS_PER_LOT)
+            db.session.add(lot)
+            db.session.flush()
+            db.session.add_all([ParkingSpot(lot_id=lot.id, status='available') for _ in range(SPOTS_PER_LOT)])
+        db.session.flush()
+
+        spot_ids = [spot.id for spot in ParkingSpot.query.order_by(ParkingSpot.id)]
+        for user in User.query.filter(User.role == 'user'):
+            for index in range(RESERVATIONS_PER_USER):
+                parking_time = now - timedelta(days=index, hours=3)
+                db.session.add(ReserveSpot(
+                    spot_id=spot_ids[index % len(spot_ids)], user_id=user.id,
+                    parking_time=parking_time, leaving_time=parking_time + timedelta(hours=2),
+                    parking_cost=20.0, payment_method='cash'
+                ))
+        db.session.commit()
+        rebuild_rollups()
+        alice_id = User.query.filter_by(username='alice').one().id
+    return alice_id
+
+
+@pytest.mark.parametrize('user, path, max_queries', [
+    ('admin', '/users/{alice_id}/reservations', 3),
+    ('alice', '/user-booking-history', 2),
+    ('alice', '/user-reports', 3),
+    ('admin', '/export/parking-details', 2),
+    ('admin', '/parking-lots', 2),
+])
+def test_endpoint_query_count(client, users, history, user, path, max_queries):
+    with profile_queries() as profile:
+        response = client.get(path.format(alice_id=history), headers=users[user])
+    assert response.status_code == 200
+    profile.assert_no_n_plus_one()
+    profile.assert_max_queries(max_queries)
+
+
+@pytest.mark.parametrize('archive', ['0', '1'])
+def test_delete_user_statement_count_is_flat(app, client, users, archive):
+    with app.app_context():
+        lot = ParkingLot(location_name='Lot', price=10, address='Street', pincode='560001',
+                         number_of_slots=1, available_slots=1)
+        db.session.add(lot)
+        db.session.flush()
+        spot = ParkingSpot(lot_id=lot.id, status='available')
+        db.session.add(spot)
+        db.session.flush()
+
+        # Spread over many hours, days and months so every bucket differs
+        now = datetime.now()
+        user_ids = {}
+        for username, count in (('alice', 3), ('bob', 300)):
+            user = User.query.filter_by(username=username).one()
+            user_ids[username] = user.id
+            for index in range(count):
+                parking_time = now - timedelta(hours=index * 31 + 3)
+                db.session.add(ReserveSpot(
+                    spot_id=spot.id, user_id=user.id, parking_time=parking_time,
+                    leaving_time=parking_time + timedelta(hours=2), parking_cost=20.0, payment_method='cash'
+                ))
+        db.session.commit()
+        rebuild_rollups()
+
+    statements = []
+    for username in ('alice', 'bob'):
+        with profile_queries() as profile:
+            response = client.delete(f'/users/{user_ids[username]}?archive={archive}', headers=users['admin'])
+        assert response.status_code == 200
+        statements.append(profile.count)
+    assert statements[0] == statements[1]
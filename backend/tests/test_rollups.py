@@ -0,0 +1,147 @@
+"""The analytics rollups must always agree with the reservation table."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import case, func
+
+from archive import reservation_history
+from rollups import rebuild_rollups
+from models import db, User, ParkingSpot, LotActivityRollup
+
+
+def _create_lot(client, headers, slots=2):
+    response = client.post('/parking-lots', json={
+        'location_name': 'Central', 'price': 10, 'address': 'Main Street',
+        'pincode': '560001', 'number_of_slots': slots
+    }, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['lot']['id']
+
+
+def _book(client, headers, lot_id, vehicle_number):
+    response = client.post('/booking/book-spot', json={'lot_id': lot_id, 'vehicle_number': vehicle_number}, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['reservation']
+
+
+def _release(client, headers, reservation_id):
+    return client.post('/booking/release-spot', json={'reservation_id': reservation_id, 'payment_method': 'cash'}, headers=headers)
+
+
+def _assert_rollups_match(app):
+    """Rollup totals equal the counts over both reservation tiers"""
+    with app.app_context():
+        history = reservation_history.c
+        completed = history.leaving_time.isnot(None)
+        expected = db.session.query(
+            func.count(history.id),
+            func.coalesce(func.sum(case((completed, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((completed, history.parking_cost), else_=0)), 0)
+        ).one()
+        actual = db.session.query(
+            func.coalesce(func.sum(LotActivityRollup.bookings), 0),
+            func.coalesce(func.sum(LotActivityRollup.completed_sessions), 0),
+            func.coalesce(func.sum(LotActivityRollup.revenue), 0)
+        ).filter(LotActivityRollup.granularity == 'month').one()
+        assert tuple(actual) == pytest.approx(tuple(expected))
+
+
+def _active_reservations(client, headers):
+    response = client.get('/reports', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['data']['reservation_stats']['active_reservations']
+
+
+def test_book_and_release(app, client, users):
+    lot_id = _create_lot(client, users['admin'])
+    reservation = _book(client, users['alice'], lot_id, 'KA01A1111')
+    _assert_rollups_match(app)
+
+    assert _release(client, users['alice'], reservation['id']).status_code == 200
+    _assert_rollups_match(app)
+
+
+def test_double_release_counts_once(app, client, users):
+    lot_id = _create_lot(client, users['admin'], slots=1)
+    reservation = _book(client, users['alice'], lot_id, 'KA01A1111')
+    assert _release(client, users['alice'], reservation['id']).status_code == 200
+    _book(client, users['bob'], lot_id, 'KA01B2222')
+
+    assert _release(client, users['alice'], reservation['id']).status_code == 400
+    _assert_rollups_match(app)
+
+
+def test_prebooked_reservation_occupied_and_released(app, client, users):
+    lot_id = _create_lot(client, users['admin'], slots=1)
+    with app.app_context():
+        spot_id = ParkingSpot.query.filter_by(lot_id=lot_id).first().id
+    now = datetime.now()
+    response = client.post('/reservations', json={
+        'spot_id': spot_id,
+        'parking_time': now.isoformat(),
+        'leaving_time': (now + timedelta(hours=2)).isoformat()
+    }, headers=users['alice'])
+    assert response.status_code == 201
+    reservation_id = response.get_json()['reservation']['id']
+    _assert_rollups_match(app)
+
+    assert client.post('/booking/occupy-spot', json={'reservation_id': reservation_id}, headers=users['alice']).status_code == 200
+    _assert_rollups_match(app)
+
+    assert _release(client, users['alice'], reservation_id).status_code == 200
+    assert _release(client, users['alice'], reservation_id).status_code == 400
+    _assert_rollups_match(app)
+
+
+def test_cancelled_reservation_is_retracted(app, client, users):
+    lot_id = _create_lot(client, users['admin'])
+    reservation = _book(client, users['alice'], lot_id, 'KA01A1111')
+
+    assert client.delete(f"/reservations/{reservation['id']}", headers=users['alice']).status_code == 200
+    _assert_rollups_match(app)
+
+
+@pytest.mark.parametrize('archive', ['0', '1'])
+def test_deleting_user_with_active_booking(app, client, users, archive):
+    lot_id = _create_lot(client, users['admin'])
+    completed = _book(client, users['alice'], lot_id, 'KA01A1111')
+    assert _release(client, users['alice'], completed['id']).status_code == 200
+    _book(client, users['alice'], lot_id, 'KA01A1111')
+    _book(client, users['bob'], lot_id, 'KA01B2222')
+
+    with app.app_context():
+        alice_id = User.query.filter_by(username='alice').one().id
+    response = client.delete(f'/users/{alice_id}?archive={archive}', headers=users['admin'])
+    assert response.status_code == 200
+    _assert_rollups_match(app)
+    assert _active_reservations(client, users['admin']) == 1
+
+
+@pytest.mark.parametrize('archive', ['0', '1'])
+def test_deleting_lot_with_active_booking(app, client, users, archive):
+    lot_id = _create_lot(client, users['admin'])
+    other_lot_id = _create_lot(client, users['admin'])
+    _book(client, users['alice'], lot_id, 'KA01A1111')
+    _book(client, users['bob'], other_lot_id, 'KA01B2222')
+
+    assert client.delete(f'/parking-lots/{lot_id}?archive={archive}', headers=users['admin']).status_code == 200
+    _assert_rollups_match(app)
+    assert _active_reservations(client, users['admin']) == 1
+
+
+def test_rebuild_matches_incremental_rollups(app, client, users):
+    lot_id = _create_lot(client, users['admin'])
+    reservation = _book(client, users['alice'], lot_id, 'KA01A1111')
+    assert _release(client, users['alice'], reservation['id']).status_code == 200
+    _book(client, users['bob'], lot_id, 'KA01B2222')
+
+    def snapshot():
+        return sorted(
+            (row.lot_id, row.granularity, row.period_start, row.bookings, row.completed_sessions, row.revenue)
+            for row in LotActivityRollup.query.all()
+        )
+
+    with app.app_context():
+        incremental = snapshot()
+        assert rebuild_rollups() == 2
+        assert snapshot() == incremental
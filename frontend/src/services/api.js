@@ -322,18 +322,20 @@ const apiService = {
     }
   },
 
-  async getUserBookingHistory() {
+  async getUserBookingHistory(params = {}) {
     try {
-      const response = await apiClient.get('/user-booking-history');
+      // params: { limit, cursor } - pass the previous page's pagination.next_cursor to continue
+      const response = await apiClient.get('/user-booking-history', { params });
       return response.data;
     } catch (error) {
       throw error;
     }
   },
 
-  async exportParkingDetails() {
+  async exportParkingDetails(params = {}) {
     try {
-      const response = await apiClient.get('/export/parking-details');
+      // params: { start, end, lot_id } - use format=csv or format=ndjson on the endpoint for streamed downloads
+      const response = await apiClient.get('/export/parking-details', { params });
       return response.data;
     } catch (error) {
       throw error;